@@ -0,0 +1,150 @@
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+# Parole di cortesia che non cambiano il significato della domanda
+PAROLE_DI_CORTESIA = {
+    "ciao", "salve", "buonasera", "buongiorno", "scusi", "scusa", "senta",
+    "per", "favore", "grazie", "ma", "allora", "ehi"
+}
+
+# Riferimenti alla conversazione in corso: la risposta dipende dallo stato
+# e non può essere riutilizzata per un altro cliente
+RIFERIMENTI_CONTESTO = re.compile(
+    r"\b(quell\w*|quest\w*|stess\w*|anche|ancora|prima|mio|mia|miei|mie|"
+    r"ordine|ordinato|comanda|ho detto|cambia\w*|modific\w*|aggiung\w*|togli\w*)\b"
+)
+
+
+def normalizza_domanda(testo: str) -> str:
+    """
+    Riduce una domanda a una forma canonica per l'uso come chiave di cache
+
+    Args:
+        testo: Testo della domanda del cliente
+
+    Returns:
+        Domanda in minuscolo, senza accenti, punteggiatura e parole di cortesia
+    """
+    testo = unicodedata.normalize("NFKD", testo.lower())
+    testo = "".join(c for c in testo if not unicodedata.combining(c))
+    parole = re.sub(r"[^\w\s]", " ", testo).split()
+    return " ".join(p for p in parole if p not in PAROLE_DI_CORTESIA)
+
+
+def dipende_dal_contesto(testo: str) -> bool:
+    """
+    Determina se una domanda fa riferimento alla conversazione in corso
+
+    Args:
+        testo: Testo della domanda del cliente
+
+    Returns:
+        True se la risposta dipende dallo stato della conversazione
+    """
+    return bool(RIFERIMENTI_CONTESTO.search(testo.lower()))
+
+
+class CacheRisposte:
+    """
+    Cache LRU con scadenza (TTL) per le risposte di fallback generate dal LLM
+    """
+
+    def __init__(self, capacita: int = 256, ttl_secondi: float = 3600):
+        """
+        Inizializza la cache
+
+        Args:
+            capacita: Numero massimo di risposte memorizzate
+            ttl_secondi: Durata di validità di una risposta in secondi
+        """
+        self.capacita = capacita
+        self.ttl_secondi = ttl_secondi
+        self._voci = OrderedDict()  # chiave -> (scadenza, risposta)
+        self._lock = Lock()
+        self.hit = 0
+        self.miss = 0
+        self.scadute = 0
+        self.rimosse = 0
+
+    @staticmethod
+    def chiave(domanda: str, versione_menu: str) -> str:
+        """
+        Costruisce la chiave di cache da domanda normalizzata e versione del menu
+        """
+        return f"{versione_menu}|{normalizza_domanda(domanda)}"
+
+    def ottieni(self, domanda: str, versione_menu: str) -> Optional[str]:
+        """
+        Restituisce la risposta memorizzata per la domanda, se valida
+
+        Args:
+            domanda: Testo della domanda del cliente
+            versione_menu: Versione corrente del menu
+
+        Returns:
+            La risposta memorizzata o None
+        """
+        chiave = self.chiave(domanda, versione_menu)
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is None:
+                self.miss += 1
+                return None
+
+            scadenza, risposta = voce
+            if scadenza < time.monotonic():
+                # Risposta scaduta: la eliminiamo e la contiamo come miss
+                del self._voci[chiave]
+                self.scadute += 1
+                self.miss += 1
+                return None
+
+            self._voci.move_to_end(chiave)
+            self.hit += 1
+            return risposta
+
+    def salva(self, domanda: str, versione_menu: str, risposta: str) -> None:
+        """
+        Memorizza una risposta, eliminando la meno usata se la cache è piena
+
+        Args:
+            domanda: Testo della domanda del cliente
+            versione_menu: Versione corrente del menu
+            risposta: Risposta da memorizzare
+        """
+        chiave = self.chiave(domanda, versione_menu)
+        with self._lock:
+            self._voci[chiave] = (time.monotonic() + self.ttl_secondi, risposta)
+            self._voci.move_to_end(chiave)
+            while len(self._voci) > self.capacita:
+                self._voci.popitem(last=False)
+                self.rimosse += 1
+
+    def svuota(self) -> None:
+        """Elimina tutte le risposte memorizzate"""
+        with self._lock:
+            self._voci.clear()
+
+    def statistiche(self) -> Dict:
+        """
+        Restituisce le statistiche di utilizzo della cache
+
+        Returns:
+            Dizionario con hit, miss, hit rate e occupazione
+        """
+        with self._lock:
+            richieste = self.hit + self.miss
+            return {
+                "hit": self.hit,
+                "miss": self.miss,
+                "hit_rate": self.hit / richieste if richieste else 0.0,
+                "scadute": self.scadute,
+                "rimosse": self.rimosse,
+                "voci": len(self._voci),
+                "capacita": self.capacita,
+                "ttl_secondi": self.ttl_secondi
+            }
@@ -0,0 +1,160 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterator, List, Optional
+
+# Categorie del carrello, nell'ordine di stampa
+CATEGORIE_CARRELLO = ("pizze", "fritti", "bevande")
+
+
+def in_centesimi(prezzo) -> int:
+    """
+    Converte un prezzo in euro (numero o stringa) in centesimi interi
+
+    Args:
+        prezzo: Prezzo in euro, es. 6.5 o "6.50"
+
+    Returns:
+        Il prezzo in centesimi, es. 650
+    """
+    if prezzo is None or prezzo == "":
+        return 0
+    return int((Decimal(str(prezzo)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def formatta_euro(centesimi: int) -> str:
+    """Formatta un importo in centesimi come "€6.50", come i prezzi del menu"""
+    return f"€{centesimi // 100}.{centesimi % 100:02d}"
+
+
+class RigaOrdine:
+    """Una riga dell'ordine: prodotto, quantità e prezzo unitario in centesimi"""
+
+    __slots__ = ("nome", "quantita", "prezzo_centesimi")
+
+    def __init__(self, nome: str, quantita: int, prezzo_centesimi: int):
+        """
+        Inizializza la riga
+
+        Args:
+            nome: Nome del prodotto nel menu (identifica il prodotto)
+            quantita: Numero di unità
+            prezzo_centesimi: Prezzo unitario in centesimi
+        """
+        self.nome = nome
+        self.quantita = quantita
+        self.prezzo_centesimi = prezzo_centesimi
+
+    @property
+    def subtotale_centesimi(self) -> int:
+        """Prezzo della riga in centesimi"""
+        return self.quantita * self.prezzo_centesimi
+
+    @classmethod
+    def da_json(cls, voce: Dict) -> "RigaOrdine":
+        """
+        Ricostruisce una riga salvata nella tabella comande
+
+        Args:
+            voce: Dizionario con nome, prezzo (euro) e quantita
+
+        Returns:
+            La riga corrispondente
+        """
+        return cls(voce.get("nome", ""), int(voce.get("quantita", 0)), in_centesimi(voce.get("prezzo")))
+
+    def in_json(self) -> Dict:
+        """Riga nel formato JSONB della tabella comande"""
+        return {
+            "nome": self.nome,
+            "prezzo": self.prezzo_centesimi / 100,
+            "quantita": self.quantita
+        }
+
+    def __repr__(self) -> str:
+        return f"RigaOrdine({self.nome!r}, {self.quantita}, {self.prezzo_centesimi})"
+
+
+class Carrello:
+    """
+    Prodotti di un ordine raggruppati per categoria, una riga per prodotto.
+    Il totale in centesimi è aggiornato ad ogni aggiunta o rimozione.
+    """
+
+    __slots__ = ("_righe", "totale_centesimi")
+
+    def __init__(self):
+        self._righe: Dict[str, Dict[str, RigaOrdine]] = {categoria: {} for categoria in CATEGORIE_CARRELLO}
+        self.totale_centesimi = 0
+
+    def aggiungi(self, categoria: str, nome: str, quantita: int, prezzo_centesimi: int) -> RigaOrdine:
+        """
+        Aggiunge unità di un prodotto, sommandole alla riga esistente
+
+        Args:
+            categoria: Categoria del carrello ("pizze", "fritti", "bevande")
+            nome: Nome del prodotto
+            quantita: Unità da aggiungere
+            prezzo_centesimi: Prezzo unitario in centesimi (usato per le righe nuove)
+
+        Returns:
+            La riga aggiornata
+        """
+        righe = self._righe[categoria]
+        riga = righe.get(nome)
+        if riga is None:
+            riga = righe[nome] = RigaOrdine(nome, 0, prezzo_centesimi)
+        riga.quantita += quantita
+        self.totale_centesimi += quantita * riga.prezzo_centesimi
+        return riga
+
+    def rimuovi(self, categoria: str, nome: str, quantita: Optional[int] = None) -> int:
+        """
+        Rimuove unità di un prodotto (tutte se quantita è None)
+
+        Args:
+            categoria: Categoria del carrello
+            nome: Nome del prodotto
+            quantita: Unità da rimuovere
+
+        Returns:
+            Numero di unità rimosse
+        """
+        riga = self._righe[categoria].get(nome)
+        if riga is None:
+            return 0
+        rimosse = riga.quantita if quantita is None else min(quantita, riga.quantita)
+        riga.quantita -= rimosse
+        self.totale_centesimi -= rimosse * riga.prezzo_centesimi
+        if riga.quantita == 0:
+            del self._righe[categoria][nome]
+        return rimosse
+
+    def svuota(self) -> None:
+        """Rimuove tutti i prodotti"""
+        for righe in self._righe.values():
+            righe.clear()
+        self.totale_centesimi = 0
+
+    def righe(self, categoria: Optional[str] = None) -> List[RigaOrdine]:
+        """Righe di una categoria, o di tutte, in ordine di inserimento"""
+        if categoria is not None:
+            return list(self._righe[categoria].values())
+        return [riga for righe in self._righe.values() for riga in righe.values()]
+
+    def in_json(self, categoria: str) -> List[Dict]:
+        """Righe di una categoria nel formato JSONB della tabella comande, ordinate per nome"""
+        return [riga.in_json() for riga in sorted(self._righe[categoria].values(), key=lambda r: r.nome)]
+
+    @property
+    def totale(self) -> float:
+        """Totale in euro (calcolato dai centesimi, senza errori di arrotondamento)"""
+        return self.totale_centesimi / 100
+
+    def __iter__(self) -> Iterator[RigaOrdine]:
+        return iter(self.righe())
+
+    def __len__(self) -> int:
+        """Numero totale di unità"""
+        return sum(riga.quantita for riga in self.righe())
+
+    def __bool__(self) -> bool:
+        return any(self._righe.values())
@@ -0,0 +1,203 @@
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from carrello import CATEGORIE_CARRELLO
+from esportazione import DIMENSIONE_PAGINA, pagine_comande
+from statistiche import voci_prodotti
+
+# Clienti abituali tenuti in memoria (i meno recenti vengono dimenticati oltre il limite)
+MASSIMO_CLIENTI = int(os.getenv("CUSTOMER_CACHE_SIZE", "50000"))
+
+# Colonne delle comande lette all'avvio per ricostruire l'ultimo ordine di ogni cliente
+_COLONNE_COMANDE = [
+    "telefono_cliente", "nome_cliente", "indirizzo_cliente", "metodo_pagamento", "data", "ora", *CATEGORIE_CARRELLO
+]
+
+
+def normalizza_telefono(telefono: Optional[str]) -> str:
+    """
+    Forma canonica di un numero di telefono, usata come chiave della rubrica
+
+    Args:
+        telefono: Numero come scritto dal cliente, es. "+39 333 123-4567"
+
+    Returns:
+        Solo le cifre, senza prefisso internazionale italiano, es. "3331234567"
+    """
+    cifre = re.sub(r"\D", "", telefono or "")
+    if cifre.startswith("0039"):
+        cifre = cifre[4:]
+    elif cifre.startswith("39") and len(cifre) > 10:
+        cifre = cifre[2:]
+    return cifre
+
+
+def parole_indirizzo(indirizzo: Optional[str]) -> List[str]:
+    """Parole di un indirizzo in forma normalizzata, es. "Via Roma, n. 1" -> ["via", "roma", "1"]"""
+    testo = unicodedata.normalize("NFKD", (indirizzo or "").lower())
+    testo = "".join(c for c in testo if not unicodedata.combining(c))
+    return [parola for parola in re.findall(r"\w+", testo) if parola not in ("n", "nr", "numero")]
+
+
+def stesso_indirizzo(scritto: Optional[str], salvato: Optional[str]) -> bool:
+    """
+    Verifica che l'indirizzo scritto dal cliente sia quello salvato: stesse
+    parole, al più senza quelle finali di uno dei due (es. la città), purché
+    la parte comune termini con il numero civico dopo almeno due parole
+    (così "via 4" non basta per "via 4 Novembre 12")
+
+    Args:
+        scritto: Indirizzo scritto dal cliente
+        salvato: Indirizzo dell'ultimo ordine
+
+    Returns:
+        True se i due indirizzi coincidono
+    """
+    parole_scritte, parole_salvate = parole_indirizzo(scritto), parole_indirizzo(salvato)
+    comuni = min(len(parole_scritte), len(parole_salvate))
+    if parole_scritte == parole_salvate:
+        return any(any(c.isdigit() for c in parola) for parola in parole_salvate)
+    prefisso = parole_scritte[:comuni]
+    return (comuni > 0 and prefisso == parole_salvate[:comuni]
+            and any(c.isdigit() for c in prefisso[-1])
+            and sum(not any(c.isdigit() for c in parola) for parola in prefisso) >= 2)
+
+
+class RubricaClienti:
+    """
+    Clienti abituali indicizzati per numero di telefono: nome, ultimo
+    indirizzo, ultimo metodo di pagamento e prodotti dell'ultima comanda.
+    Viene popolata all'avvio dal database e aggiornata a ogni ordine
+    confermato, così il riconoscimento del cliente non interroga Supabase.
+    """
+
+    def __init__(self, massimo_clienti: int = MASSIMO_CLIENTI):
+        """
+        Inizializza la rubrica vuota
+
+        Args:
+            massimo_clienti: Clienti tenuti in memoria
+        """
+        self.massimo_clienti = massimo_clienti
+        self._clienti: "OrderedDict[str, Dict]" = OrderedDict()  # telefono normalizzato -> cliente
+        self._lock = Lock()
+        self.riconosciuti = 0
+        self.sconosciuti = 0
+
+    def registra(self, telefono: str, nome: Optional[str], indirizzo: Optional[str],
+                 pagamento: Optional[str] = None, prodotti: Optional[Dict[str, List[Tuple[str, int]]]] = None,
+                 aggiornato: str = "") -> None:
+        """
+        Registra il cliente di una comanda. Una comanda più vecchia di quella
+        già registrata per lo stesso telefono viene ignorata.
+
+        Args:
+            telefono: Numero di telefono del cliente
+            nome: Nome del cliente
+            indirizzo: Indirizzo di consegna
+            pagamento: Metodo di pagamento
+            prodotti: Prodotti della comanda per categoria, come liste di (nome, quantità)
+            aggiornato: Data e ora della comanda "YYYY-MM-DD HH:MM:SS"
+        """
+        chiave = normalizza_telefono(telefono)
+        if not chiave:
+            return
+        with self._lock:
+            precedente = self._clienti.get(chiave)
+            if precedente is not None and precedente["aggiornato"] > aggiornato:
+                return
+            self._clienti[chiave] = {
+                "telefono": telefono,
+                "nome": nome or (precedente or {}).get("nome"),
+                "indirizzo": indirizzo or (precedente or {}).get("indirizzo"),
+                "pagamento": pagamento or (precedente or {}).get("pagamento"),
+                "prodotti": prodotti if prodotti else (precedente or {}).get("prodotti") or {},
+                "aggiornato": aggiornato
+            }
+            self._clienti.move_to_end(chiave)
+            while len(self._clienti) > self.massimo_clienti:
+                self._clienti.popitem(last=False)
+
+    def registra_comanda(self, comanda: Dict) -> None:
+        """
+        Registra il cliente a partire da una riga della tabella comande
+
+        Args:
+            comanda: Comanda con telefono_cliente, nome_cliente, indirizzo_cliente,
+                     metodo_pagamento, data, ora e le colonne dei prodotti
+        """
+        self.registra(
+            comanda.get("telefono_cliente"),
+            comanda.get("nome_cliente"),
+            comanda.get("indirizzo_cliente"),
+            comanda.get("metodo_pagamento"),
+            {categoria: voci_prodotti(comanda.get(categoria)) for categoria in CATEGORIE_CARRELLO},
+            f"{comanda.get('data') or ''} {comanda.get('ora') or ''}".strip()
+        )
+
+    def cerca(self, telefono: str) -> Optional[Dict]:
+        """
+        Cerca un cliente abituale
+
+        Args:
+            telefono: Numero di telefono, in qualsiasi formato
+
+        Returns:
+            Copia dei dati del cliente, oppure None se non ha mai ordinato
+        """
+        chiave = normalizza_telefono(telefono)
+        with self._lock:
+            cliente = self._clienti.get(chiave)
+            if cliente is None:
+                self.sconosciuti += 1
+                return None
+            self._clienti.move_to_end(chiave)
+            self.riconosciuti += 1
+            return dict(cliente)
+
+    async def carica(self, repository) -> int:
+        """
+        Popola la rubrica dalle comande e dai clienti salvati su Supabase
+
+        Args:
+            repository: RepositoryAsync da cui leggere le tabelle
+
+        Returns:
+            Numero di clienti in rubrica
+        """
+        # Entrambe le tabelle sono lette a pagine: una select unica verrebbe troncata dal max-rows di PostgREST
+        async for pagina in pagine_comande(repository, colonne=_COLONNE_COMANDE):
+            for comanda in pagina:
+                self.registra_comanda(comanda)
+        # Clienti senza comande leggibili (es. formato storico): solo nome e indirizzo
+        ultimo_id = None
+        while True:
+            pagina = await repository.pagina_clienti(
+                ultimo_id, colonne="id,nome,telefono,indirizzo,ultimo_aggiornamento", limite=DIMENSIONE_PAGINA
+            )
+            for cliente in pagina:
+                with self._lock:
+                    noto = normalizza_telefono(cliente.get("telefono")) in self._clienti
+                if not noto:
+                    self.registra(cliente.get("telefono"), cliente.get("nome"), cliente.get("indirizzo"),
+                                  aggiornato=cliente.get("ultimo_aggiornamento") or "")
+            if len(pagina) < DIMENSIONE_PAGINA:
+                return len(self)
+            ultimo_id = pagina[-1]["id"]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clienti)
+
+    def statistiche(self) -> Dict:
+        """Clienti in rubrica e numeri riconosciuti o sconosciuti"""
+        with self._lock:
+            return {
+                "clienti": len(self._clienti),
+                "riconosciuti": self.riconosciuti,
+                "sconosciuti": self.sconosciuti
+            }
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Unisce le richieste concorrenti con la stessa chiave in un'unica
+    esecuzione, il cui risultato viene condiviso da tutti i chiamanti
+    """
+
+    def __init__(self):
+        self._in_corso: Dict[str, asyncio.Future] = {}
+        self.esecuzioni = 0
+        self.unite = 0
+
+    async def esegui(self, chiave: str, funzione: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Esegue la funzione, oppure attende l'esecuzione già in corso per la chiave
+
+        Args:
+            chiave: Identificativo della computazione
+            funzione: Funzione asincrona senza argomenti da eseguire
+
+        Returns:
+            Il risultato della funzione
+        """
+        futuro = self._in_corso.get(chiave)
+        if futuro is not None:
+            self.unite += 1
+            # shield: se un chiamante viene annullato, gli altri continuano ad attendere
+            return await asyncio.shield(futuro)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._in_corso[chiave] = futuro
+        self.esecuzioni += 1
+        try:
+            risultato = await funzione()
+        except BaseException as e:
+            futuro.set_exception(e)
+            # Evita l'avviso "exception was never retrieved" se nessuno attende
+            futuro.exception()
+            raise
+        else:
+            futuro.set_result(risultato)
+            return risultato
+        finally:
+            del self._in_corso[chiave]
+
+    def in_corso(self, chiave: str) -> bool:
+        """Indica se c'è un'esecuzione in corso per la chiave"""
+        return chiave in self._in_corso
+
+
+class CacheStaleWhileRevalidate:
+    """
+    Cache con finestra stale-while-revalidate: un risultato recente viene
+    servito subito; un risultato scaduto da poco viene servito mentre
+    un aggiornamento gira in background; oltre la finestra si ricalcola.
+    Tutti i calcoli passano da un SingleFlight.
+    """
+
+    def __init__(self, fresco_secondi: float = 5, stantio_secondi: float = 30):
+        """
+        Inizializza la cache
+
+        Args:
+            fresco_secondi: Per quanto un risultato è servito senza ricalcolo
+            stantio_secondi: Per quanto, dopo, è servito mentre si aggiorna in background
+        """
+        self.fresco_secondi = fresco_secondi
+        self.stantio_secondi = stantio_secondi
+        self.single_flight = SingleFlight()
+        self._voci: Dict[str, Tuple[float, Any]] = {}  # chiave -> (istante calcolo, valore)
+        self._aggiornamenti = set()  # task di aggiornamento in background
+
+    async def _calcola(self, chiave: str, funzione: Callable[[], Awaitable[Any]],
+                       memorizza: Optional[Callable[[Any], bool]]) -> Any:
+        """Calcola il valore e lo memorizza se valido"""
+        valore = await funzione()
+        if memorizza is None or memorizza(valore):
+            adesso = time.monotonic()
+            # Elimina i valori scaduti (le chiavi possono dipendere dai parametri della richiesta)
+            scadenza = self.fresco_secondi + self.stantio_secondi
+            for vecchia in [c for c, (istante, _) in self._voci.items() if adesso - istante >= scadenza]:
+                del self._voci[vecchia]
+            self._voci[chiave] = (adesso, valore)
+        return valore
+
+    async def ottieni(self, chiave: str, funzione: Callable[[], Awaitable[Any]],
+                      memorizza: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Restituisce il valore per la chiave, calcolandolo solo se necessario
+
+        Args:
+            chiave: Identificativo del valore
+            funzione: Funzione asincrona che calcola il valore
+            memorizza: Predicato opzionale: i valori per cui è False non vengono memorizzati
+
+        Returns:
+            Il valore, eventualmente servito dalla cache
+        """
+        voce = self._voci.get(chiave)
+        if voce is not None:
+            eta = time.monotonic() - voce[0]
+            if eta < self.fresco_secondi:
+                return voce[1]
+            if eta < self.fresco_secondi + self.stantio_secondi:
+                if not self.single_flight.in_corso(chiave):
+                    task = asyncio.create_task(
+                        self.single_flight.esegui(chiave, lambda: self._calcola(chiave, funzione, memorizza))
+                    )
+                    self._aggiornamenti.add(task)
+                    task.add_done_callback(self._fine_aggiornamento)
+                return voce[1]
+
+        return await self.single_flight.esegui(chiave, lambda: self._calcola(chiave, funzione, memorizza))
+
+    def _fine_aggiornamento(self, task: asyncio.Task) -> None:
+        """Rimuove il task completato e registra eventuali errori"""
+        self._aggiornamenti.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Errore nell'aggiornamento in background: {str(task.exception())}")
+
+    def invalida(self, chiave: str) -> None:
+        """Elimina il valore memorizzato per la chiave"""
+        self._voci.pop(chiave, None)
@@ -0,0 +1,278 @@
+import csv
+import math
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from previsioni import slot_di
+from ricerca_menu import IndiceProdotti, normalizza
+
+# Stradario locale: file CSV con le colonne via, lat, lon
+PERCORSO_STRADARIO = os.getenv("STREET_TABLE_PATH", os.path.join("data", "stradario.csv"))
+
+# Posizione della pizzeria (partenza di ogni giro)
+POSIZIONE_PIZZERIA = (
+    float(os.getenv("PIZZERIA_LAT", "41.9028")),
+    float(os.getenv("PIZZERIA_LON", "12.4964"))
+)
+
+# Parametri dei giri: ordini per rider, distanza massima tra consegne, velocità media
+ORDINI_PER_GIRO = int(os.getenv("RIDER_MAX_ORDERS", "3"))
+RAGGIO_GIRO_KM = float(os.getenv("RIDER_MAX_HOP_KM", "1.5"))
+VELOCITA_RIDER_KMH = float(os.getenv("RIDER_SPEED_KMH", "20"))
+
+# Abbreviazioni comuni negli indirizzi
+_ABBREVIAZIONI = {
+    "v.": "via", "v.le": "viale", "p.za": "piazza", "p.zza": "piazza", "pza": "piazza",
+    "c.so": "corso", "l.go": "largo", "vle": "viale"
+}
+
+# Slot assegnato alle comande senza orario di consegna (vengono pianificate per ultime)
+SLOT_SCONOSCIUTO = 999
+
+Coordinate = Tuple[float, float]
+
+
+class Geocoder(Protocol):
+    """Interfaccia dei geocoder: indirizzo -> (lat, lon), None se sconosciuto"""
+
+    def geocodifica(self, indirizzo: str) -> Optional[Coordinate]:
+        ...
+
+
+def normalizza_via(indirizzo: str) -> str:
+    """
+    Estrae e normalizza il nome della via da un indirizzo
+
+    Args:
+        indirizzo: Indirizzo del cliente, es. "V.le Marconi 12, Roma"
+
+    Returns:
+        Nome della via normalizzato, es. "viale marconi"
+    """
+    via = normalizza(indirizzo.split(",")[0])
+    parole = []
+    for parola in via.split():
+        parola = _ABBREVIAZIONI.get(parola, parola)
+        # Numeri civici, interni e scale non fanno parte della via
+        if any(c.isdigit() for c in parola) or parola in ("n.", "n", "civico", "int.", "scala"):
+            continue
+        parole.append(parola.strip(".'"))
+    return " ".join(p for p in parole if p)
+
+
+class GeocoderLocale:
+    """
+    Geocoder offline basato su uno stradario: ogni via ha una coordinata.
+    Le vie vengono cercate con l'indice a trigrammi del menu, quindi sono
+    tollerati errori di battitura (es. "via garibaldy").
+    """
+
+    def __init__(self, percorso: str = PERCORSO_STRADARIO):
+        """
+        Carica lo stradario
+
+        Args:
+            percorso: File CSV con le colonne via, lat, lon
+        """
+        self.indice = IndiceProdotti()
+        self.coordinate: Dict[str, Coordinate] = {}
+        if not os.path.exists(percorso):
+            print(f"Stradario {percorso} non trovato: gli indirizzi non verranno geolocalizzati")
+            return
+        with open(percorso, encoding="utf-8", newline="") as f:
+            for riga in csv.DictReader(f):
+                try:
+                    self.aggiungi(riga["via"], float(riga["lat"]), float(riga["lon"]))
+                except (KeyError, TypeError, ValueError):
+                    print(f"Riga dello stradario non valida: {riga}")
+        print(f"DEBUG - Stradario caricato: {len(self.coordinate)} vie")
+
+    def aggiungi(self, via: str, lat: float, lon: float) -> None:
+        """Aggiunge una via allo stradario"""
+        chiave = normalizza_via(via)
+        if chiave:
+            self.coordinate[chiave] = (lat, lon)
+            self.indice.aggiungi(chiave, chiave, "via")
+
+    def geocodifica(self, indirizzo: str) -> Optional[Coordinate]:
+        """
+        Coordinate della via di un indirizzo
+
+        Args:
+            indirizzo: Indirizzo del cliente
+
+        Returns:
+            Tupla (lat, lon), oppure None se la via non è nello stradario
+        """
+        via = normalizza_via(indirizzo or "")
+        if not via:
+            return None
+        if via in self.coordinate:
+            return self.coordinate[via]
+        # Tolleranza ridotta: i nomi delle vie condividono spesso il prefisso ("via ...")
+        trovate = self.indice.cerca(via, k=1, limite=max(1, len(via) // 6))
+        return self.coordinate[trovate[0].nome] if trovate else None
+
+
+class GeocoderConCache:
+    """Cache LRU davanti a un geocoder (memorizza anche gli indirizzi non trovati)"""
+
+    def __init__(self, geocoder: Geocoder, capacita: int = 4096):
+        """
+        Inizializza la cache
+
+        Args:
+            geocoder: Geocoder da interrogare in caso di miss
+            capacita: Numero massimo di indirizzi memorizzati
+        """
+        self.geocoder = geocoder
+        self.capacita = capacita
+        self._voci: "OrderedDict[str, Optional[Coordinate]]" = OrderedDict()
+        self._lock = Lock()
+        self.hit = 0
+        self.miss = 0
+
+    def geocodifica(self, indirizzo: str) -> Optional[Coordinate]:
+        """Coordinate dell'indirizzo, dalla cache se già cercato"""
+        chiave = " ".join(normalizza(indirizzo or "").split())
+        with self._lock:
+            if chiave in self._voci:
+                self._voci.move_to_end(chiave)
+                self.hit += 1
+                return self._voci[chiave]
+            self.miss += 1
+        coordinate = self.geocoder.geocodifica(indirizzo)
+        with self._lock:
+            self._voci[chiave] = coordinate
+            while len(self._voci) > self.capacita:
+                self._voci.popitem(last=False)
+        return coordinate
+
+
+def distanza_km(a: Coordinate, b: Coordinate) -> float:
+    """Distanza in linea d'aria (formula dell'emisenoverso)"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+def percorso_vicino_piu_vicino(partenza: Coordinate, tappe: List[Coordinate],
+                               slot: Optional[List[int]] = None) -> Tuple[List[int], float]:
+    """
+    Ordina le tappe andando ogni volta alla più vicina tra quelle dello slot
+    di consegna più urgente, così un orario successivo non viene servito
+    prima di uno precedente
+
+    Args:
+        partenza: Punto di partenza
+        tappe: Coordinate delle consegne
+        slot: Slot di consegna di ogni tappa (None: solo la distanza)
+
+    Returns:
+        Tupla (indici delle tappe in ordine di visita, km percorsi esclusa la via del ritorno)
+    """
+    da_visitare = list(range(len(tappe)))
+    ordine = []
+    posizione = partenza
+    km = 0.0
+    while da_visitare:
+        prossima = min(da_visitare, key=lambda i: (slot[i] if slot else 0, distanza_km(posizione, tappe[i])))
+        km += distanza_km(posizione, tappe[prossima])
+        posizione = tappe[prossima]
+        ordine.append(prossima)
+        da_visitare.remove(prossima)
+    return ordine, km
+
+
+def pianifica_giri(comande: List[Dict], geocoder: Geocoder, partenza: Coordinate = POSIZIONE_PIZZERIA,
+                   ordini_per_giro: int = ORDINI_PER_GIRO, raggio_km: float = RAGGIO_GIRO_KM,
+                   slot_adiacenti: int = 1, velocita_kmh: float = VELOCITA_RIDER_KMH) -> Dict:
+    """
+    Raggruppa le comande in giri di consegna: partendo dalla consegna più
+    urgente, aggiunge le comande dello stesso slot o di quelli adiacenti
+    più vicine al giro, finché il rider è pieno o non ce ne sono entro il raggio
+
+    Args:
+        comande: Comande con comanda_id, indirizzo_cliente e orario_consegna
+        geocoder: Geocoder degli indirizzi
+        partenza: Posizione della pizzeria
+        ordini_per_giro: Consegne massime per giro
+        raggio_km: Distanza massima di una consegna dalla più vicina del giro
+        slot_adiacenti: Slot di 15 minuti di differenza ammessi nello stesso giro
+        velocita_kmh: Velocità media del rider
+
+    Returns:
+        Dizionario con i giri e i totali (consegne per giro, km risparmiati)
+    """
+    voci = []
+    for comanda in comande:
+        slot = slot_di(comanda.get("orario_consegna"))
+        voci.append({
+            "comanda_id": comanda.get("comanda_id"),
+            "cliente": comanda.get("nome_cliente"),
+            "indirizzo": comanda.get("indirizzo_cliente"),
+            "orario_consegna": (comanda.get("orario_consegna") or "")[:5],
+            "slot": slot if slot is not None else SLOT_SCONOSCIUTO,
+            "posizione": geocoder.geocodifica(comanda.get("indirizzo_cliente") or "")
+        })
+    voci.sort(key=lambda v: (v["slot"], v["orario_consegna"]))
+
+    giri = []
+    libere = [v for v in voci if v["posizione"] is not None]
+    while libere:
+        giro = [libere.pop(0)]
+        while len(giro) < ordini_per_giro:
+            candidate = [
+                (min(distanza_km(v["posizione"], g["posizione"]) for g in giro), i)
+                for i, v in enumerate(libere)
+                if abs(v["slot"] - giro[0]["slot"]) <= slot_adiacenti
+            ]
+            candidate = [c for c in candidate if c[0] <= raggio_km]
+            if not candidate:
+                break
+            giro.append(libere.pop(min(candidate)[1]))
+        giri.append(giro)
+    # Le comande senza posizione partono da sole
+    giri.extend([v] for v in voci if v["posizione"] is None)
+
+    risultato = []
+    km_totali = km_singoli = 0.0
+    for numero, giro in enumerate(sorted(giri, key=lambda g: min(v["slot"] for v in g)), 1):
+        localizzate = [v for v in giro if v["posizione"] is not None]
+        ordine, km = percorso_vicino_piu_vicino(
+            partenza, [v["posizione"] for v in localizzate], [v["slot"] for v in localizzate]
+        )
+        # Le comande non localizzate (sempre da sole in un giro) restano in coda
+        tappe = [localizzate[i] for i in ordine] + [v for v in giro if v["posizione"] is None]
+        if localizzate:
+            # Andata e ritorno: il rider torna in pizzeria dopo l'ultima consegna
+            km += distanza_km(localizzate[ordine[-1]]["posizione"], partenza)
+            km_singoli += sum(2 * distanza_km(partenza, v["posizione"]) for v in localizzate)
+        km_totali += km
+        risultato.append({
+            "giro": numero,
+            "partenza": min((v["orario_consegna"] for v in giro), default=""),
+            "consegne": [
+                {
+                    "comanda_id": v["comanda_id"],
+                    "cliente": v["cliente"],
+                    "indirizzo": v["indirizzo"],
+                    "orario_consegna": v["orario_consegna"],
+                    "localizzata": v["posizione"] is not None
+                }
+                for v in tappe
+            ],
+            "km": round(km, 2),
+            "minuti": round(km / velocita_kmh * 60) if velocita_kmh else None
+        })
+
+    return {
+        "giri": risultato,
+        "consegne": len(voci),
+        "consegne_per_giro": round(len(voci) / len(risultato), 2) if risultato else 0,
+        "non_localizzate": sum(1 for v in voci if v["posizione"] is None),
+        "km_totali": round(km_totali, 2),
+        "km_risparmiati": round(max(0.0, km_singoli - km_totali), 2)
+    }
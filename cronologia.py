@@ -0,0 +1,273 @@
+import re
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+# tiktoken è opzionale: se non è installato si usa una stima sui caratteri
+try:
+    import tiktoken
+    _encoder = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoder = None
+
+# Riferimento breve che sostituisce il menu completo nella cronologia
+RIFERIMENTO_MENU = "[Il menu completo della pizzeria è stato mostrato al cliente]"
+
+# Token minimi perché il riassunto dei turni più vecchi valga lo spazio che occupa
+MINIMO_TOKEN_RIASSUNTO = 16
+
+# Righe tipiche del menu formattato ("## Sezione", "**Nome** - €6.50")
+_RIGA_MENU = re.compile(r"^(##\s|\*\*.+\*\*\s+-\s+€|-\s.+:\s+€)", re.MULTILINE)
+
+
+def conta_token(testo: str) -> int:
+    """
+    Conta i token di un testo
+
+    Args:
+        testo: Testo da misurare
+
+    Returns:
+        Numero di token (esatto con tiktoken, stimato altrimenti)
+    """
+    if not testo:
+        return 0
+    if _encoder is not None:
+        return len(_encoder.encode(testo))
+    # Stima: circa 4 caratteri per token per l'italiano
+    return len(testo) // 4 + 1
+
+
+def conta_token_messaggi(messaggi: List[Dict]) -> int:
+    """
+    Conta i token di una lista di messaggi in formato OpenAI
+
+    Args:
+        messaggi: Lista di dizionari con 'role' e 'content'
+
+    Returns:
+        Numero totale di token, incluso l'overhead per messaggio
+    """
+    return sum(conta_token(m["content"]) + 4 for m in messaggi)
+
+
+def tronca_a_token(testo: str, massimo: int) -> str:
+    """
+    Tronca un testo in modo che non superi un numero di token
+
+    Args:
+        testo: Testo da troncare
+        massimo: Token massimi, compreso il segno di troncamento
+
+    Returns:
+        Il testo originale se rientra nel limite, altrimenti il suo inizio seguito da "…"
+    """
+    if conta_token(testo) <= massimo:
+        return testo
+    taglio = max(massimo, 0) * 4
+    while taglio > 0 and conta_token(testo[:taglio].rstrip() + "…") > massimo:
+        taglio = taglio * 4 // 5
+    return testo[:taglio].rstrip() + "…" if taglio > 0 else ""
+
+
+def e_menu_completo(testo: str) -> bool:
+    """
+    Determina se un messaggio contiene un elenco del menu
+
+    Args:
+        testo: Contenuto del messaggio
+
+    Returns:
+        True se il messaggio contiene almeno alcune righe di menu
+    """
+    return len(_RIGA_MENU.findall(testo)) >= 3
+
+
+class BudgetToken:
+    """
+    Limita i token della cronologia inviata al LLM: condensa i messaggi
+    lunghi dell'assistente e riassume i turni più vecchi oltre il budget
+    """
+
+    def __init__(self, budget: int = 600, limite_messaggio: int = 200):
+        """
+        Inizializza il gestore del budget
+
+        Args:
+            budget: Token massimi per la cronologia
+            limite_messaggio: Token oltre i quali un messaggio dell'assistente viene condensato
+        """
+        self.budget = budget
+        self.limite_messaggio = limite_messaggio
+
+    def condensa(self, messaggio: Dict) -> Dict:
+        """
+        Sostituisce i messaggi lunghi dell'assistente con una versione breve
+
+        Args:
+            messaggio: Messaggio in formato OpenAI
+
+        Returns:
+            Il messaggio originale o la sua versione condensata
+        """
+        if messaggio["role"] != "assistant":
+            return messaggio
+
+        contenuto = messaggio["content"]
+        if e_menu_completo(contenuto):
+            # Conserva il testo prima e dopo il menu (es. la domanda finale)
+            righe = [r for r in contenuto.splitlines() if r.strip() and r.strip() != "---"]
+            introduzione = righe[0] if righe and not _RIGA_MENU.match(righe[0]) else ""
+            domanda = righe[-1] if righe and not _RIGA_MENU.match(righe[-1]) and righe[-1] != introduzione else ""
+            parti = [p for p in (introduzione, RIFERIMENTO_MENU, domanda) if p]
+            return {"role": "assistant", "content": "\n".join(parti)}
+
+        troncato = tronca_a_token(contenuto, self.limite_messaggio)
+        if troncato != contenuto:
+            # Tronca mantenendo l'inizio del messaggio
+            return {"role": "assistant", "content": troncato}
+
+        return messaggio
+
+    def _riassumi(self, messaggi: List[Dict]) -> Dict:
+        """
+        Riassume i turni più vecchi in un unico messaggio di sistema
+
+        Args:
+            messaggi: Messaggi da riassumere
+
+        Returns:
+            Messaggio di sistema con il riassunto
+        """
+        punti = []
+        for messaggio in messaggi:
+            chi = "Cliente" if messaggio["role"] == "user" else "Mario"
+            testo = " ".join(messaggio["content"].replace(RIFERIMENTO_MENU, "(menu)").split())
+            punti.append(f"{chi}: {testo[:80]}")
+        return {"role": "system", "content": "Riassunto della conversazione precedente:\n" + "\n".join(punti)}
+
+    def prepara(self, cronologia: List[Dict]) -> List[Dict]:
+        """
+        Prepara la cronologia da inviare al LLM rispettando il budget di token
+
+        Args:
+            cronologia: Messaggi precedenti in formato OpenAI (dal più vecchio)
+
+        Returns:
+            Lista di messaggi condensata entro il budget
+        """
+        condensati = [self.condensa(m) for m in cronologia]
+
+        # Tiene i turni più recenti finché rientrano nel budget (4 token di overhead per messaggio)
+        recenti = []
+        usati = 0
+        for messaggio in reversed(condensati):
+            costo = conta_token(messaggio["content"]) + 4
+            if usati + costo > self.budget:
+                if not recenti and self.budget > 4:
+                    # Almeno l'ultimo turno, troncato per rientrare nel budget
+                    messaggio = {**messaggio, "content": tronca_a_token(messaggio["content"], self.budget - 4)}
+                    recenti.append(messaggio)
+                    usati += conta_token(messaggio["content"]) + 4
+                break
+            recenti.append(messaggio)
+            usati += costo
+        recenti.reverse()
+
+        vecchi = condensati[:len(condensati) - len(recenti)]
+        if not vecchi:
+            return recenti
+
+        # Il riassunto usa solo il budget rimasto, e al più limite_messaggio token
+        spazio = min(self.limite_messaggio, self.budget - usati - 4)
+        if spazio < MINIMO_TOKEN_RIASSUNTO:
+            return recenti
+        riassunto = self._riassumi(vecchi)
+        riassunto["content"] = tronca_a_token(riassunto["content"], spazio)
+        return [riassunto] + recenti
+
+
+class VoceCronologia(NamedTuple):
+    """Un messaggio della cronologia in forma compatta"""
+    ruolo: str        # "user", "assistant" o "system"
+    contenuto: str
+    istante: float    # Secondi dall'epoch (time.time())
+
+    def in_formato_openai(self) -> Dict:
+        """Messaggio nel formato dell'API di OpenAI"""
+        return {"role": self.ruolo, "content": self.contenuto}
+
+    def ora(self) -> str:
+        """Istante formattato, da usare solo per la visualizzazione"""
+        return formatta_istante(self.istante)
+
+
+def formatta_istante(istante: float) -> str:
+    """Formatta un istante (secondi dall'epoch) come "AAAA-MM-GG HH:MM:SS" """
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(istante))
+
+
+class CronologiaCircolare:
+    """
+    Cronologia a capacità fissa (buffer circolare): oltre la capacità ogni
+    nuovo messaggio sostituisce il più vecchio, senza ricreare la lista
+    """
+
+    __slots__ = ("_voci", "_prossima", "_lunghezza")
+
+    def __init__(self, capacita: int = 10):
+        """
+        Inizializza la cronologia
+
+        Args:
+            capacita: Numero massimo di messaggi conservati
+        """
+        self._voci: List[Optional[VoceCronologia]] = [None] * max(1, capacita)
+        self._prossima = 0   # Posizione in cui scrivere il prossimo messaggio
+        self._lunghezza = 0
+
+    @property
+    def capacita(self) -> int:
+        return len(self._voci)
+
+    def aggiungi(self, ruolo: str, contenuto: str, istante: Optional[float] = None) -> None:
+        """
+        Aggiunge un messaggio, sovrascrivendo il più vecchio se la cronologia è piena
+
+        Args:
+            ruolo: Ruolo del messaggio ("user", "assistant", "system")
+            contenuto: Testo del messaggio
+            istante: Secondi dall'epoch (adesso se None)
+        """
+        self._voci[self._prossima] = VoceCronologia(ruolo, contenuto, time.time() if istante is None else istante)
+        self._prossima = (self._prossima + 1) % len(self._voci)
+        if self._lunghezza < len(self._voci):
+            self._lunghezza += 1
+
+    def __len__(self) -> int:
+        return self._lunghezza
+
+    def __iter__(self) -> Iterator[VoceCronologia]:
+        """Messaggi dal più vecchio al più recente"""
+        capacita = len(self._voci)
+        inizio = (self._prossima - self._lunghezza) % capacita
+        for i in range(self._lunghezza):
+            yield self._voci[(inizio + i) % capacita]
+
+    def ultimo(self) -> Optional[VoceCronologia]:
+        """Il messaggio più recente, o None se la cronologia è vuota"""
+        if not self._lunghezza:
+            return None
+        return self._voci[(self._prossima - 1) % len(self._voci)]
+
+    def messaggi(self, escludi_ultimi: int = 0) -> List[Dict]:
+        """
+        Cronologia nel formato dell'API di OpenAI
+
+        Args:
+            escludi_ultimi: Numero di messaggi recenti da escludere
+
+        Returns:
+            Lista di messaggi dal più vecchio
+        """
+        quanti = max(0, self._lunghezza - escludi_ultimi)
+        return [voce.in_formato_openai() for _, voce in zip(range(quanti), self)]
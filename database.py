@@ -0,0 +1,136 @@
+import os
+import threading
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient
+from supabase import Client
+from supabase.lib.client_options import ClientOptions
+
+# Carica le variabili d'ambiente dal file .env
+load_dotenv()
+
+# Client Supabase condiviso da tutti i moduli e relativo pool di connessioni
+_client: Optional[Client] = None
+_trasporto: Optional[httpx.HTTPTransport] = None
+_lock = threading.Lock()
+
+
+def http2_disponibile() -> bool:
+    """HTTP/2 richiede il pacchetto opzionale h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def limiti_pool() -> httpx.Limits:
+    """
+    Limiti del pool di connessioni verso Supabase, gli stessi per il client
+    sincrono e per il repository asincrono
+
+    Returns:
+        Limiti httpx da SUPABASE_POOL_SIZE e SUPABASE_KEEPALIVE
+    """
+    dimensione_pool = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+    return httpx.Limits(
+        max_connections=dimensione_pool,
+        max_keepalive_connections=dimensione_pool,
+        keepalive_expiry=float(os.getenv("SUPABASE_KEEPALIVE", "60"))
+    )
+
+
+def timeout_supabase() -> httpx.Timeout:
+    """Timeout delle richieste a Supabase da SUPABASE_TIMEOUT e SUPABASE_CONNECT_TIMEOUT"""
+    return httpx.Timeout(
+        float(os.getenv("SUPABASE_TIMEOUT", "10")),
+        connect=float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "3"))
+    )
+
+
+def _trasporto_condiviso() -> httpx.HTTPTransport:
+    """
+    Restituisce il trasporto HTTP condiviso, con pool di connessioni keep-alive
+
+    Returns:
+        Il trasporto httpx usato da tutte le sessioni PostgREST
+    """
+    global _trasporto
+    if _trasporto is None:
+        _trasporto = httpx.HTTPTransport(
+            http2=http2_disponibile(),
+            limits=limiti_pool(),
+            retries=1  # Un nuovo tentativo di connessione in caso di errore TCP
+        )
+    return _trasporto
+
+
+class _PostgrestConPool(SyncPostgrestClient):
+    """Client PostgREST che usa il trasporto condiviso invece di un pool proprio"""
+
+    def create_session(self, base_url, headers, timeout) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=_trasporto_condiviso()
+        )
+
+    def aclose(self) -> None:
+        # Il trasporto è condiviso: viene chiuso solo da chiudi_client
+        pass
+
+
+class _ClientSupabase(Client):
+    """
+    Client Supabase le cui sessioni PostgREST (ricreate ad ogni cambio di
+    autenticazione) condividono lo stesso pool di connessioni
+    """
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None) -> SyncPostgrestClient:
+        return _PostgrestConPool(rest_url, headers=headers, schema=schema, timeout=timeout)
+
+
+def ottieni_client() -> Client:
+    """
+    Restituisce il client Supabase condiviso, creandolo al primo utilizzo
+
+    Returns:
+        Il client Supabase
+
+    Raises:
+        RuntimeError: Se le credenziali non sono presenti nel file .env
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    with _lock:
+        if _client is None:
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_KEY")
+            if not supabase_url or not supabase_key:
+                raise RuntimeError("Credenziali Supabase non trovate nel file .env")
+
+            _client = _ClientSupabase(
+                supabase_url=supabase_url,
+                supabase_key=supabase_key,
+                options=ClientOptions(postgrest_client_timeout=timeout_supabase())
+            )
+            _trasporto_condiviso()
+            print(f"Connessione a Supabase stabilita: {supabase_url} (HTTP/2: {http2_disponibile()})")
+    return _client
+
+
+def chiudi_client() -> None:
+    """Chiude le connessioni del pool condiviso"""
+    global _client, _trasporto
+    with _lock:
+        if _trasporto is not None:
+            _trasporto.close()
+        _trasporto = None
+        _client = None
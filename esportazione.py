@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import os
+import zlib
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+from carrello import CATEGORIE_CARRELLO
+from statistiche import voci_prodotti
+
+# Righe lette da Supabase per ogni pagina dell'esportazione
+DIMENSIONE_PAGINA = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+# Colonne esportabili della tabella comande, nell'ordine del file
+COLONNE_ESPORTAZIONE = [
+    "comanda_id", "data", "ora", "orario_consegna", "nome_cliente", "telefono_cliente",
+    "indirizzo_cliente", "metodo_pagamento", "totale", *CATEGORIE_CARRELLO
+]
+
+# Colonne necessarie per il cursore della paginazione keyset
+_COLONNE_CURSORE = ("data", "ora", "comanda_id")
+
+# Caratteri iniziali che un foglio di calcolo interpreta come formula
+_INIZIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+# Formati disponibili: estensione -> tipo MIME
+FORMATI = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def scegli_colonne(colonne: Optional[str]) -> List[str]:
+    """
+    Valida le colonne richieste per l'esportazione
+
+    Args:
+        colonne: Nomi separati da virgola, tutte le colonne se None o vuoto
+
+    Returns:
+        Lista delle colonne nell'ordine richiesto
+
+    Raises:
+        ValueError: Se una colonna non è esportabile
+    """
+    if not colonne:
+        return list(COLONNE_ESPORTAZIONE)
+    scelte = [colonna.strip() for colonna in colonne.split(",") if colonna.strip()]
+    sconosciute = [colonna for colonna in scelte if colonna not in COLONNE_ESPORTAZIONE]
+    if sconosciute or not scelte:
+        raise ValueError(f"Colonne non esportabili: {', '.join(sconosciute) or colonne}")
+    return list(dict.fromkeys(scelte))
+
+
+def _testo_prodotti(valore) -> str:
+    """Prodotti di una comanda in una cella CSV, es. "2x Margherita; 1x Coca Cola" """
+    return "; ".join(f"{quantita}x {nome}" for nome, quantita in voci_prodotti(valore))
+
+
+def _cella_csv(valore):
+    """
+    Valore di una cella CSV: i testi scritti dal cliente (nome, indirizzo...)
+    che inizierebbero una formula vengono preceduti da un apostrofo
+
+    Args:
+        valore: Valore della colonna
+
+    Returns:
+        Il valore da scrivere nel file
+    """
+    if isinstance(valore, str) and valore.startswith(_INIZIO_FORMULA):
+        return "'" + valore
+    return valore
+
+
+def _righe_csv(comande: List[Dict], colonne: Sequence[str], intestazione: bool) -> str:
+    """Una pagina di comande in formato CSV"""
+    buffer = io.StringIO()
+    scrittore = csv.writer(buffer, lineterminator="\r\n")
+    if intestazione:
+        scrittore.writerow(colonne)
+    for comanda in comande:
+        scrittore.writerow([
+            _cella_csv(_testo_prodotti(comanda.get(colonna)) if colonna in CATEGORIE_CARRELLO else comanda.get(colonna, ""))
+            for colonna in colonne
+        ])
+    return buffer.getvalue()
+
+
+def _righe_ndjson(comande: List[Dict], colonne: Sequence[str]) -> str:
+    """Una pagina di comande in formato NDJSON (un oggetto JSON per riga)"""
+    return "".join(
+        json.dumps({colonna: comanda.get(colonna) for colonna in colonne}, ensure_ascii=False, default=str) + "\n"
+        for comanda in comande
+    )
+
+
+async def pagine_comande(repository, da: Optional[str] = None, a: Optional[str] = None,
+                         colonne: Sequence[str] = COLONNE_ESPORTAZIONE,
+                         dimensione_pagina: int = DIMENSIONE_PAGINA) -> AsyncIterator[List[Dict]]:
+    """
+    Scorre le comande del periodo una pagina alla volta, in ordine cronologico
+
+    Args:
+        repository: RepositoryAsync da cui leggere le comande
+        da: Primo giorno (incluso), "AAAA-MM-GG"
+        a: Ultimo giorno (incluso)
+        colonne: Colonne da leggere (quelle del cursore vengono aggiunte)
+        dimensione_pagina: Righe per pagina
+
+    Returns:
+        Generatore asincrono di pagine (liste di comande)
+    """
+    selezione = ",".join(dict.fromkeys([*colonne, *_COLONNE_CURSORE]))
+    cursore = None
+    while True:
+        pagina = await repository.pagina_comande(cursore, da, a, colonne=selezione, limite=dimensione_pagina)
+        if not pagina:
+            return
+        yield pagina
+        if len(pagina) < dimensione_pagina:
+            return
+        ultima = pagina[-1]
+        cursore = tuple(ultima.get(colonna) or "" for colonna in _COLONNE_CURSORE)
+
+
+async def esporta_comande(pagine: AsyncIterator[List[Dict]], formato: str, colonne: Sequence[str],
+                          comprimi: bool = False) -> AsyncIterator[bytes]:
+    """
+    Converte le pagine di comande nel formato richiesto, un blocco per pagina:
+    in memoria c'è al massimo una pagina, qualunque sia la durata del periodo
+
+    Args:
+        pagine: Pagine di comande (vedi pagine_comande)
+        formato: "csv" oppure "ndjson"
+        colonne: Colonne esportate, nell'ordine del file
+        comprimi: Se True il flusso è compresso in gzip
+
+    Returns:
+        Generatore asincrono dei blocchi del file
+    """
+    compressore = zlib.compressobj(wbits=31) if comprimi else None  # wbits=31: formato gzip
+    prima = True
+    try:
+        async for pagina in pagine:
+            if formato == "csv":
+                testo = _righe_csv(pagina, colonne, intestazione=prima)
+            else:
+                testo = _righe_ndjson(pagina, colonne)
+            prima = False
+            blocco = testo.encode("utf-8")
+            if compressore is not None:
+                blocco = compressore.compress(blocco)
+            if blocco:
+                yield blocco
+    except Exception as e:
+        # La risposta è già partita: il file resta troncato, l'errore finisce nei log
+        print(f"Errore durante l'esportazione delle comande: {str(e)} - file troncato")
+        raise
+    finally:
+        await pagine.aclose()
+    if prima and formato == "csv":
+        # Nessuna comanda: il CSV contiene solo l'intestazione
+        testo = _righe_csv([], colonne, intestazione=True).encode("utf-8")
+        yield compressore.compress(testo) if compressore is not None else testo
+    if compressore is not None:
+        yield compressore.flush()
@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from previsioni import CapacitaSlot, SLOT_CONSEGNA
+
+# Pizze che il forno sforna in uno slot di 15 minuti
+PIZZE_PER_SLOT = int(os.getenv("OVEN_PIZZAS_PER_SLOT", "8"))
+
+# Minuti tra la conferma dell'ordine e l'ingresso in forno (preparazione)
+MINUTI_PREPARAZIONE = int(os.getenv("PREP_LEAD_MINUTES", "15"))
+
+# Minuti tra l'uscita dal forno e la consegna
+MINUTI_CONSEGNA = int(os.getenv("DELIVERY_MINUTES", "15"))
+
+# Slot di forno precedenti all'ultimo utile in cui si possono cuocere le pizze di una consegna
+ANTICIPO_MASSIMO_SLOT = int(os.getenv("OVEN_MAX_EARLY_SLOTS", "1"))
+
+# Minuti dopo cui uno slot scelto ma non confermato torna disponibile
+MINUTI_VALIDITA_PRENOTAZIONE = float(os.getenv("SLOT_HOLD_MINUTES", "10"))
+
+DURATA_SLOT = 15
+
+
+def _in_minuti(orario: str) -> int:
+    """Converte "HH:MM" in minuti dalla mezzanotte"""
+    return int(orario[:2]) * 60 + int(orario[3:5])
+
+
+def _in_orario(minuti: int) -> str:
+    """Converte minuti dalla mezzanotte in "HH:MM" """
+    return f"{minuti // 60:02d}:{minuti % 60:02d}"
+
+
+class PianificatoreForno:
+    """
+    Ammissione degli ordini negli slot di consegna in base alla capacità del forno.
+    Il forno cuoce un numero fisso di pizze ogni 15 minuti: le pizze di una
+    consegna vengono assegnate agli slot di forno che finiscono in tempo per
+    la consegna (dal più vicino), senza iniziare prima che la preparazione
+    sia possibile. Uno slot è offerto solo se tutte le pizze dell'ordine ci stanno.
+    """
+
+    def __init__(self, pizze_per_slot: int = PIZZE_PER_SLOT, minuti_preparazione: int = MINUTI_PREPARAZIONE,
+                 minuti_consegna: int = MINUTI_CONSEGNA, anticipo_massimo_slot: int = ANTICIPO_MASSIMO_SLOT,
+                 capacita_slot: Optional[CapacitaSlot] = None,
+                 validita_prenotazione_minuti: float = MINUTI_VALIDITA_PRENOTAZIONE):
+        """
+        Inizializza il pianificatore
+
+        Args:
+            pizze_per_slot: Pizze cotte dal forno in 15 minuti
+            minuti_preparazione: Minuti dalla conferma all'ingresso in forno
+            minuti_consegna: Minuti dall'uscita dal forno alla consegna
+            anticipo_massimo_slot: Slot di forno in anticipo utilizzabili oltre l'ultimo utile
+            capacita_slot: Consegne per slot previste per la serata (vedi previsioni.py);
+                           senza previsioni pubblicate le consegne sono limitate solo dal forno
+            validita_prenotazione_minuti: Minuti per cui uno slot scelto resta riservato in attesa di conferma
+        """
+        self.pizze_per_slot = pizze_per_slot
+        self.minuti_preparazione = minuti_preparazione
+        self.minuti_consegna = minuti_consegna
+        self.anticipo_massimo_slot = anticipo_massimo_slot
+        self.capacita_slot = capacita_slot or CapacitaSlot()
+        self.validita_prenotazione = validita_prenotazione_minuti * 60
+        self._lock = threading.Lock()
+        self._giorno: Optional[date] = None
+        self._forno: Dict[int, int] = {}  # inizio slot di forno (minuti) -> pizze assegnate
+        self._consegne: Dict[str, int] = {}  # slot di consegna -> consegne prenotate
+        # Prenotazioni in attesa di conferma: chiave -> (slot, pizze per slot di forno)
+        self._prenotazioni: Dict[str, Tuple[str, Dict[int, int]]] = {}
+        self._scadenze: Dict[str, float] = {}  # chiave -> scadenza della prenotazione
+
+    def _allinea_giorno(self, adesso: datetime) -> None:
+        """Azzera il carico quando cambia la serata e libera le prenotazioni scadute"""
+        if self._giorno != adesso.date():
+            self._giorno = adesso.date()
+            self._forno.clear()
+            self._consegne.clear()
+            self._prenotazioni.clear()
+            self._scadenze.clear()
+        istante = time.monotonic()
+        for chiave in [c for c, scadenza in self._scadenze.items() if scadenza <= istante]:
+            self._scarica(*self._prenotazioni.pop(chiave))
+            del self._scadenze[chiave]
+
+    def _slot_forno(self, orario: str, adesso: datetime) -> List[int]:
+        """
+        Slot di forno utilizzabili per una consegna, dal più vicino alla consegna
+
+        Args:
+            orario: Slot di consegna "HH:MM"
+            adesso: Istante della richiesta
+
+        Returns:
+            Inizi degli slot di forno in minuti dalla mezzanotte
+        """
+        # Ultimo slot che finisce in tempo per la consegna
+        ultimo = (_in_minuti(orario) - self.minuti_consegna - DURATA_SLOT) // DURATA_SLOT * DURATA_SLOT
+        # Primo istante in cui le pizze possono entrare in forno
+        primo_inizio = adesso.hour * 60 + adesso.minute + self.minuti_preparazione
+        return [
+            inizio for inizio in range(ultimo, ultimo - DURATA_SLOT * (self.anticipo_massimo_slot + 1), -DURATA_SLOT)
+            if inizio >= primo_inizio
+        ]
+
+    def _consegna_ammessa(self, orario: str) -> bool:
+        """Controlla il limite di consegne previsto per lo slot, se pubblicato per la serata"""
+        if not self.capacita_slot.pubblicata(self._giorno):
+            return True
+        return self._consegne.get(orario, 0) < self.capacita_slot.capacita(orario, self._giorno)
+
+    def _assegna(self, orario: str, pizze: int, adesso: datetime) -> Optional[Dict[int, int]]:
+        """
+        Assegna le pizze agli slot di forno, senza modificare il carico
+
+        Returns:
+            Pizze per slot di forno, oppure None se l'ordine non ci sta
+            o l'orario non è uno slot di consegna della serata
+        """
+        if orario not in SLOT_CONSEGNA:
+            return None
+        slot_forno = self._slot_forno(orario, adesso)
+        if not slot_forno or not self._consegna_ammessa(orario):
+            return None
+        assegnazione = {}
+        da_assegnare = pizze
+        for inizio in slot_forno:
+            if da_assegnare == 0:
+                break
+            libere = self.pizze_per_slot - self._forno.get(inizio, 0)
+            if libere > 0:
+                assegnazione[inizio] = min(libere, da_assegnare)
+                da_assegnare -= assegnazione[inizio]
+        return assegnazione if da_assegnare == 0 else None
+
+    def orari_disponibili(self, pizze: int, adesso: Optional[datetime] = None) -> List[str]:
+        """
+        Slot di consegna in cui un ordine può essere cotto in tempo
+
+        Args:
+            pizze: Pizze dell'ordine
+            adesso: Istante della richiesta (ora attuale se None)
+
+        Returns:
+            Lista degli slot "HH:MM" disponibili, in ordine di orario
+        """
+        adesso = adesso or datetime.now()
+        with self._lock:
+            self._allinea_giorno(adesso)
+            return [orario for orario in SLOT_CONSEGNA if self._assegna(orario, pizze, adesso) is not None]
+
+    def suggerisci(self, orario: str, pizze: int, quanti: int = 3, adesso: Optional[datetime] = None) -> List[str]:
+        """
+        Slot disponibili più vicini a un orario richiesto
+
+        Args:
+            orario: Orario richiesto "HH:MM"
+            pizze: Pizze dell'ordine
+            quanti: Numero massimo di suggerimenti
+            adesso: Istante della richiesta (ora attuale se None)
+
+        Returns:
+            Slot suggeriti, in ordine di orario
+        """
+        richiesto = _in_minuti(orario)
+        disponibili = self.orari_disponibili(pizze, adesso)
+        vicini = sorted(disponibili, key=lambda slot: (abs(_in_minuti(slot) - richiesto), slot))[:quanti]
+        return sorted(vicini)
+
+    def prenota(self, chiave: str, orario: str, pizze: int, adesso: Optional[datetime] = None) -> bool:
+        """
+        Prenota uno slot di consegna e la relativa capacità del forno.
+        Una prenotazione precedente con la stessa chiave viene sostituita.
+
+        Args:
+            chiave: Identificativo della prenotazione (es. l'ID utente)
+            orario: Slot di consegna "HH:MM"
+            pizze: Pizze dell'ordine
+            adesso: Istante della richiesta (ora attuale se None)
+
+        Returns:
+            True se l'ordine ci sta ed è stato prenotato
+        """
+        adesso = adesso or datetime.now()
+        with self._lock:
+            self._allinea_giorno(adesso)
+            precedente = self._prenotazioni.pop(chiave, None)
+            if precedente is not None:
+                self._scarica(*precedente)
+            assegnazione = self._assegna(orario, pizze, adesso)
+            if assegnazione is None:
+                if precedente is not None:
+                    self._carica(*precedente)
+                    self._prenotazioni[chiave] = precedente
+                return False
+            self._carica(orario, assegnazione)
+            self._prenotazioni[chiave] = (orario, assegnazione)
+            self._scadenze[chiave] = time.monotonic() + self.validita_prenotazione
+            return True
+
+    def rilascia(self, chiave: str) -> None:
+        """
+        Annulla una prenotazione (nessun effetto se non esiste)
+
+        Args:
+            chiave: Identificativo della prenotazione
+        """
+        with self._lock:
+            self._scadenze.pop(chiave, None)
+            prenotazione = self._prenotazioni.pop(chiave, None)
+            if prenotazione is not None:
+                self._scarica(*prenotazione)
+
+    def conferma(self, chiave: str, orario: str, pizze: int, adesso: Optional[datetime] = None) -> None:
+        """
+        Rende definitiva una prenotazione. Se nel frattempo è scaduta il carico
+        viene registrato comunque, anche oltre la capacità: l'ordine è confermato.
+
+        Args:
+            chiave: Identificativo della prenotazione
+            orario: Slot di consegna "HH:MM"
+            pizze: Pizze dell'ordine
+            adesso: Istante della conferma (ora attuale se None)
+        """
+        adesso = adesso or datetime.now()
+        with self._lock:
+            self._allinea_giorno(adesso)
+            self._scadenze.pop(chiave, None)
+            if self._prenotazioni.pop(chiave, None) is not None:
+                return
+            assegnazione = self._assegna(orario, pizze, adesso)
+            if assegnazione is None:
+                slot_forno = self._slot_forno(orario, adesso)
+                assegnazione = {slot_forno[0] if slot_forno else _in_minuti(orario) - self.minuti_consegna - DURATA_SLOT: pizze}
+            self._carica(orario, assegnazione)
+
+    def _carica(self, orario: str, assegnazione: Dict[int, int]) -> None:
+        self._consegne[orario] = self._consegne.get(orario, 0) + 1
+        for inizio, pizze in assegnazione.items():
+            self._forno[inizio] = self._forno.get(inizio, 0) + pizze
+
+    def _scarica(self, orario: str, assegnazione: Dict[int, int]) -> None:
+        self._consegne[orario] -= 1
+        if not self._consegne[orario]:
+            del self._consegne[orario]
+        for inizio, pizze in assegnazione.items():
+            self._forno[inizio] -= pizze
+            if not self._forno[inizio]:
+                del self._forno[inizio]
+
+    def statistiche(self) -> Dict:
+        """Carico del forno e consegne prenotate per la serata"""
+        with self._lock:
+            return {
+                "giorno": self._giorno.isoformat() if self._giorno else None,
+                "pizze_per_slot": self.pizze_per_slot,
+                "forno": {_in_orario(inizio): pizze for inizio, pizze in sorted(self._forno.items())},
+                "consegne": dict(sorted(self._consegne.items())),
+                "in_attesa_di_conferma": len(self._prenotazioni)
+            }
@@ -0,0 +1,186 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set
+
+from carrello import CATEGORIE_CARRELLO
+from clienti import normalizza_telefono
+from ricerca_menu import normalizza
+from statistiche import consegna_prevista, stato_comanda, voci_prodotti
+
+# Nomi dei giorni della settimana indicizzati con la data (lunedì = 0), es. "rossi martedi"
+GIORNI_RICERCA = ["lunedi", "martedi", "mercoledi", "giovedi", "venerdi", "sabato", "domenica"]
+
+# Colonne delle comande lette per costruire l'indice
+COLONNE_INDICE = [
+    "comanda_id", "data", "ora", "orario_consegna", "consegna_prevista", "nome_cliente", "telefono_cliente",
+    "indirizzo_cliente", "totale", *CATEGORIE_CARRELLO
+]
+
+_PAROLA = re.compile(r"[a-z0-9]+")
+
+
+def termini(testo: Optional[str]) -> List[str]:
+    """
+    Parole di un testo in forma normalizzata (minuscolo, senza accenti né punteggiatura)
+
+    Args:
+        testo: Testo da scomporre, es. "Via Garibaldi 12/B"
+
+    Returns:
+        Lista delle parole, es. ["via", "garibaldi", "12", "b"]
+    """
+    return _PAROLA.findall(normalizza(str(testo or "")))
+
+
+class IndiceComande:
+    """
+    Indice invertito delle comande per la ricerca dalla dashboard: ogni
+    parola (ID, nome, telefono, indirizzo, prodotti, data e giorno della
+    settimana) punta all'insieme delle comande che la contengono. Il
+    vocabolario è tenuto ordinato, così la ricerca per prefisso è una
+    ricerca binaria; più parole nella query vanno tutte trovate (AND).
+    """
+
+    def __init__(self):
+        self._comande: List[Dict] = []  # posizione -> riepilogo della comanda
+        self._chiavi: Dict[tuple, int] = {}  # (comanda_id, data, ora) -> posizione, contro i duplicati
+        self._posting: Dict[str, Set[int]] = {}  # parola -> posizioni delle comande
+        self._vocabolario: List[str] = []  # parole in ordine alfabetico
+        self.pronto = False
+
+    def aggiungi(self, comanda: Dict) -> None:
+        """
+        Indicizza una comanda (nessun effetto se è già nell'indice)
+
+        Args:
+            comanda: Riga della tabella comande (vedi profilo.prepara_dati_comanda)
+        """
+        chiave = (comanda.get("comanda_id"), comanda.get("data"), comanda.get("ora"))
+        if chiave in self._chiavi:
+            return
+        posizione = len(self._comande)
+        self._chiavi[chiave] = posizione
+
+        prodotti = [
+            (nome, quantita)
+            for categoria in CATEGORIE_CARRELLO
+            for nome, quantita in voci_prodotti(comanda.get(categoria))
+        ]
+        self._comande.append({
+            "comanda_id": comanda.get("comanda_id"),
+            "cliente": comanda.get("nome_cliente") or "-",
+            "telefono": comanda.get("telefono_cliente"),
+            "indirizzo": comanda.get("indirizzo_cliente"),
+            "data_ordine": f"{comanda.get('data') or ''}T{comanda.get('ora') or '00:00:00'}",
+            "orario_consegna": comanda.get("orario_consegna"),
+            "consegna_prevista": consegna_prevista(comanda),
+            "prodotti": ", ".join(f"{quantita} {nome}" for nome, quantita in prodotti),
+            "totale": comanda.get("totale") or 0
+        })
+
+        parole = set()
+        comanda_id = str(comanda.get("comanda_id") or "")
+        parole.update(termini(comanda_id))
+        parole.add(comanda_id.lstrip("0"))  # "#42" trova la comanda "000042"
+        parole.update(termini(comanda.get("nome_cliente")))
+        parole.update(termini(comanda.get("indirizzo_cliente")))
+        parole.update(termini(comanda.get("telefono_cliente")))
+        parole.add(normalizza_telefono(comanda.get("telefono_cliente")))
+        for nome, _ in prodotti:
+            parole.update(termini(nome))
+        if comanda.get("data"):
+            parole.add(str(comanda["data"]))
+            try:
+                parole.add(GIORNI_RICERCA[date.fromisoformat(str(comanda["data"])[:10]).weekday()])
+            except ValueError:
+                pass
+        parole.discard("")
+
+        for parola in parole:
+            posizioni = self._posting.get(parola)
+            if posizioni is None:
+                posizioni = self._posting[parola] = set()
+                insort(self._vocabolario, parola)
+            posizioni.add(posizione)
+
+    def _con_prefisso(self, prefisso: str) -> Set[int]:
+        """Comande che contengono almeno una parola che inizia con il prefisso"""
+        trovate: Set[int] = set()
+        i = bisect_left(self._vocabolario, prefisso)
+        while i < len(self._vocabolario) and self._vocabolario[i].startswith(prefisso):
+            trovate |= self._posting[self._vocabolario[i]]
+            i += 1
+        return trovate
+
+    def _ordinamento(self, posizione: int) -> tuple:
+        """Chiave per mostrare prima le comande più recenti"""
+        return self._comande[posizione]["data_ordine"], posizione
+
+    def cerca(self, testo: str, limite: int = 20, offset: int = 0,
+              da: Optional[str] = None, a: Optional[str] = None) -> Dict:
+        """
+        Cerca le comande che contengono tutte le parole della query (anche solo l'inizio)
+
+        Args:
+            testo: Query, es. "rossi martedi" oppure "suppl"
+            limite: Risultati per pagina
+            offset: Risultati da saltare (pagine precedenti)
+            da: Primo giorno (incluso), "AAAA-MM-GG"
+            a: Ultimo giorno (incluso)
+
+        Returns:
+            Dizionario con il totale dei risultati e la pagina richiesta, dalla comanda più recente
+        """
+        parole = termini(testo)
+        if not parole:
+            return {"totale": 0, "risultati": []}
+
+        insiemi = sorted((self._con_prefisso(parola) for parola in parole), key=len)
+        trovate = set(insiemi[0])
+        for insieme in insiemi[1:]:
+            trovate &= insieme
+            if not trovate:
+                break
+        if da or a:
+            trovate = {
+                posizione for posizione in trovate
+                if (not da or self._comande[posizione]["data_ordine"][:10] >= da)
+                and (not a or self._comande[posizione]["data_ordine"][:10] <= a)
+            }
+
+        # Solo i risultati fino alla pagina richiesta vengono ordinati
+        pagina = heapq.nlargest(offset + limite, trovate, key=self._ordinamento)[offset:]
+        # Lo stato dipende dall'ora: si calcola ora, non quando la comanda è indicizzata
+        adesso = datetime.now()
+        risultati = []
+        for posizione in pagina:
+            comanda = dict(self._comande[posizione])
+            comanda["stato"] = stato_comanda(comanda["consegna_prevista"], comanda["data_ordine"], adesso)
+            risultati.append(comanda)
+        return {"totale": len(trovate), "risultati": risultati}
+
+    async def carica(self, pagine) -> int:
+        """
+        Costruisce l'indice dalle comande salvate
+
+        Args:
+            pagine: Pagine di comande (vedi esportazione.pagine_comande)
+
+        Returns:
+            Numero di comande indicizzate
+        """
+        async for pagina in pagine:
+            for comanda in pagina:
+                self.aggiungi(comanda)
+        self.pronto = True
+        return len(self._comande)
+
+    def statistiche(self) -> Dict:
+        """Comande e parole nell'indice"""
+        return {
+            "pronto": self.pronto,
+            "comande": len(self._comande),
+            "parole": len(self._vocabolario)
+        }
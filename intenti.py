@@ -0,0 +1,180 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Frasi di esempio etichettate per ogni intento: sono l'unica fonte per riconoscere
+# menu, domande, conferme e rifiuti, sia nel flusso dell'ordine sia prima del LLM
+FRASI_INTENTI = {
+    "saluto": [
+        "ciao", "salve", "buonasera", "buongiorno", "ehi ciao", "ciao mario",
+        "buonasera pizzeria", "salve c'è qualcuno", "pronto", "ciao come va", "grazie", "grazie mille"
+    ],
+    "menu": [
+        "menu", "mostra menu", "vedi menu", "il menu", "mostrami il menu", "lista delle pizze",
+        "lista pizze", "che pizze avete", "cosa avete", "cosa offrite", "la carta dei piatti",
+        "che cosa c'è da mangiare", "quali pizze fate", "avete bevande", "che fritti avete"
+    ],
+    "prezzo": [
+        "quanto costa", "prezzo", "che prezzo ha", "quanto viene", "costo",
+        "quanto costa una pizza", "quanto si spende", "quanto costa la margherita",
+        "prezzi delle bibite", "a quanto la vendete"
+    ],
+    "ingredienti": [
+        "ingredienti", "cosa contiene", "cosa c'è sopra", "allergeni", "com'è fatta",
+        "di cosa è composta", "che ingredienti ha", "c'è il glutine", "è vegetariana",
+        "avete pizze senza glutine", "è piccante"
+    ],
+    "consegna": [
+        "fate consegne", "consegnate a domicilio", "portate a casa", "fate domicilio",
+        "fino a che ora consegnate", "orari di consegna", "quanto ci mette la consegna",
+        "dove consegnate", "posso pagare con carta"
+    ],
+    "si": [
+        "sì", "si", "sisi", "yes", "ok", "okay", "giusto", "corretto", "esatto", "confermo",
+        "va bene", "certo", "perfetto", "sì grazie", "d'accordo", "sì confermo", "sì è giusto",
+        "sì grazie mille", "ok grazie", "okay grazie", "va bene grazie", "perfetto grazie", "tutto giusto"
+    ],
+    "no": [
+        "no", "nono", "no grazie", "niente", "non voglio", "sbagliato",
+        "non va bene", "cambia", "modifica",
+        "no non è giusto", "non è corretto", "nessuno", "niente fritti", "niente bibite", "non ne voglio"
+    ],
+    # "Ho finito": chiude la raccolta dei prodotti, non è né un sì né un no a una conferma
+    "fine": [
+        "basta così", "nient'altro", "va bene così", "a posto così", "è tutto", "basta",
+        "solo questo", "nient'altro grazie", "è tutto grazie"
+    ],
+    "ordine": [
+        "ordina", "ordinare", "vorrei ordinare", "voglio ordinare",
+        "fare un ordine", "ordine", "prendere", "vorrei prendere",
+        "voglio prendere", "vorrei una pizza", "vorrei un fritto",
+        "vorrei da bere", "portami", "consegnami", "voglio una pizza",
+        "prenoto", "prenotare", "prenotazione"
+    ]
+}
+
+# Domande fuori dal flusso dell'ordine, a cui si risponde localmente o con il LLM
+INTENTI_DOMANDA = ("saluto", "menu", "prezzo", "ingredienti", "consegna")
+
+
+def _normalizza(testo: str) -> str:
+    """Minuscolo, senza accenti e punteggiatura"""
+    testo = unicodedata.normalize("NFKD", testo.lower())
+    testo = "".join(c for c in testo if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", testo).split())
+
+
+def _ngrammi(testo: str, minimo: int = 2, massimo: int = 4) -> Counter:
+    """
+    Estrae gli n-grammi di caratteri di ogni parola, delimitata da spazi
+
+    Args:
+        testo: Testo normalizzato
+        minimo: Lunghezza minima degli n-grammi
+        massimo: Lunghezza massima degli n-grammi
+
+    Returns:
+        Conteggio degli n-grammi
+    """
+    conteggio = Counter()
+    for parola in testo.split():
+        parola = f" {parola} "
+        for n in range(minimo, massimo + 1):
+            for i in range(len(parola) - n + 1):
+                conteggio[parola[i:i + n]] += 1
+    return conteggio
+
+
+class ClassificatoreIntenti:
+    """
+    Classificatore locale degli intenti basato su n-grammi di caratteri.
+    Ogni frase di esempio è un vettore normalizzato; un messaggio riceve
+    l'intento della frase più simile (similarità del coseno).
+    """
+
+    def __init__(self, frasi_intenti: Dict[str, List[str]], soglia: float = 0.55):
+        """
+        Costruisce la matrice delle frasi di esempio
+
+        Args:
+            frasi_intenti: Dizionario intento -> lista di frasi di esempio
+            soglia: Confidenza minima per accettare un intento
+        """
+        self.soglia = soglia
+        self.etichette = []
+        self.vocabolario = {}  # n-gramma -> colonna
+
+        righe = []
+        for intento, frasi in frasi_intenti.items():
+            for frase in set(_normalizza(f) for f in frasi):
+                if not frase:
+                    continue
+                conteggio = _ngrammi(frase)
+                for ngramma in conteggio:
+                    self.vocabolario.setdefault(ngramma, len(self.vocabolario))
+                righe.append(conteggio)
+                self.etichette.append(intento)
+
+        self.matrice = np.zeros((len(righe), len(self.vocabolario)), dtype=np.float32)
+        for i, conteggio in enumerate(righe):
+            for ngramma, valore in conteggio.items():
+                self.matrice[i, self.vocabolario[ngramma]] = valore
+        norme = np.linalg.norm(self.matrice, axis=1, keepdims=True)
+        self.matrice /= np.maximum(norme, 1e-9)
+        self.etichette = np.array(self.etichette)
+
+    @classmethod
+    def da_menu(cls, menu_data: Dict, soglia: float = 0.55) -> "ClassificatoreIntenti":
+        """
+        Costruisce il classificatore arricchendo le frasi di esempio con il menu
+
+        Args:
+            menu_data: Menu organizzato per categoria (come in MenuManager)
+            soglia: Confidenza minima per accettare un intento
+
+        Returns:
+            Un nuovo ClassificatoreIntenti
+        """
+        frasi = {intento: list(esempi) for intento, esempi in FRASI_INTENTI.items()}
+        for categoria, prodotti in menu_data.items():
+            frasi["menu"].append(f"che {categoria} avete")
+            for nome in prodotti:
+                frasi["prezzo"].append(f"quanto costa la {nome}")
+                frasi["ingredienti"].append(f"cosa c'è nella {nome}")
+        return cls(frasi, soglia)
+
+    def classifica(self, messaggio: str) -> Tuple[Optional[str], float]:
+        """
+        Classifica un messaggio
+
+        Args:
+            messaggio: Testo del messaggio utente
+
+        Returns:
+            Tupla (intento, confidenza); l'intento è None sotto la soglia
+        """
+        conteggio = _ngrammi(_normalizza(messaggio))
+        if not conteggio or not len(self.etichette):
+            return None, 0.0
+
+        # Gli n-grammi sconosciuti contano nella norma: testi estranei hanno bassa similarità
+        norma = float(np.sqrt(sum(v * v for v in conteggio.values())))
+        colonne = []
+        valori = []
+        for ngramma, valore in conteggio.items():
+            colonna = self.vocabolario.get(ngramma)
+            if colonna is not None:
+                colonne.append(colonna)
+                valori.append(valore)
+        if not colonne:
+            return None, 0.0
+
+        punteggi = self.matrice[:, colonne] @ np.array(valori, dtype=np.float32) / norma
+        migliore = int(np.argmax(punteggi))
+        confidenza = float(punteggi[migliore])
+        if confidenza < self.soglia:
+            return None, confidenza
+        return str(self.etichette[migliore]), confidenza
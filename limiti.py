@@ -0,0 +1,163 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from threading import Lock
+from typing import AsyncIterator, Dict
+
+
+class RichiestaRifiutata(Exception):
+    """Sollevata quando una richiesta supera i limiti; riprova_tra indica i secondi di attesa suggeriti"""
+
+    def __init__(self, messaggio: str, riprova_tra: float):
+        super().__init__(messaggio)
+        self.riprova_tra = riprova_tra
+
+    @property
+    def retry_after(self) -> str:
+        """Valore dell'header Retry-After (secondi interi, almeno 1)"""
+        return str(max(1, math.ceil(self.riprova_tra)))
+
+
+class LimitatoreGettoni:
+    """
+    Token bucket per chiave (utente, IP...): ogni chiave ha un secchio di
+    gettoni che si ricarica a velocità costante; una richiesta consuma un
+    gettone e viene rifiutata se il secchio è vuoto. Le chiavi inattive da
+    più tempo vengono dimenticate oltre il numero massimo.
+    """
+
+    def __init__(self, nome: str, capacita: float, gettoni_al_secondo: float, massimo_chiavi: int = 10000):
+        """
+        Inizializza il limitatore
+
+        Args:
+            nome: Nome del limite (per log e monitoraggio)
+            capacita: Gettoni massimi nel secchio (raffica consentita)
+            gettoni_al_secondo: Velocità di ricarica
+            massimo_chiavi: Chiavi tenute in memoria
+        """
+        self.nome = nome
+        self.capacita = capacita
+        self.gettoni_al_secondo = gettoni_al_secondo
+        self.massimo_chiavi = massimo_chiavi
+        self._secchi: "OrderedDict[str, tuple]" = OrderedDict()  # chiave -> (gettoni, istante)
+        self._lock = Lock()
+        self.consentite = 0
+        self.rifiutate = 0
+
+    def attesa(self, chiave: str, costo: float = 1) -> float:
+        """
+        Consuma i gettoni di una richiesta, se disponibili
+
+        Args:
+            chiave: Identificativo del richiedente
+            costo: Gettoni consumati dalla richiesta
+
+        Returns:
+            0 se la richiesta è consentita, altrimenti i secondi prima che lo sia
+        """
+        adesso = time.monotonic()
+        with self._lock:
+            gettoni, istante = self._secchi.pop(chiave, (self.capacita, adesso))
+            gettoni = min(self.capacita, gettoni + (adesso - istante) * self.gettoni_al_secondo)
+            if gettoni >= costo:
+                gettoni -= costo
+                attesa = 0.0
+                self.consentite += 1
+            else:
+                attesa = (costo - gettoni) / self.gettoni_al_secondo if self.gettoni_al_secondo else math.inf
+                self.rifiutate += 1
+            self._secchi[chiave] = (gettoni, adesso)
+            while len(self._secchi) > self.massimo_chiavi:
+                self._secchi.popitem(last=False)
+        return attesa
+
+    def verifica(self, chiave: str, costo: float = 1) -> None:
+        """
+        Come attesa, ma solleva un'eccezione se la richiesta non è consentita
+
+        Raises:
+            RichiestaRifiutata: Se i gettoni non bastano
+        """
+        attesa = self.attesa(chiave, costo)
+        if attesa > 0:
+            raise RichiestaRifiutata(f"Limite {self.nome} superato", attesa)
+
+    def statistiche(self) -> Dict:
+        """Richieste consentite e rifiutate, chiavi in memoria"""
+        with self._lock:
+            return {
+                "consentite": self.consentite,
+                "rifiutate": self.rifiutate,
+                "chiavi": len(self._secchi)
+            }
+
+
+class AmmissioneConcorrente:
+    """
+    Limite globale alle chiamate concorrenti verso una dipendenza costosa,
+    con una coda d'attesa limitata: a coda piena le richieste vengono
+    rifiutate subito, e chi aspetta troppo viene rifiutato alla scadenza.
+    """
+
+    def __init__(self, nome: str, concorrenza: int, coda_massima: int, attesa_massima: float):
+        """
+        Inizializza l'ammissione
+
+        Args:
+            nome: Nome della dipendenza (per log e monitoraggio)
+            concorrenza: Chiamate contemporanee consentite
+            coda_massima: Richieste che possono attendere un posto libero
+            attesa_massima: Secondi massimi di attesa in coda
+        """
+        self.nome = nome
+        self.concorrenza = concorrenza
+        self.coda_massima = coda_massima
+        self.attesa_massima = attesa_massima
+        self._semaforo = asyncio.Semaphore(concorrenza)
+        self.in_corso = 0
+        self.in_attesa = 0
+        self.rifiutate = 0
+        self.scadute = 0
+
+    @asynccontextmanager
+    async def posto(self) -> AsyncIterator[None]:
+        """
+        Occupa un posto per la durata del blocco
+
+        Raises:
+            RichiestaRifiutata: Se la coda è piena o l'attesa scade
+        """
+        if self._semaforo.locked():
+            if self.in_attesa >= self.coda_massima:
+                self.rifiutate += 1
+                raise RichiestaRifiutata(f"{self.nome}: coda piena", self.attesa_massima)
+            self.in_attesa += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), timeout=self.attesa_massima)
+            except asyncio.TimeoutError:
+                self.scadute += 1
+                raise RichiestaRifiutata(f"{self.nome}: attesa scaduta", self.attesa_massima)
+            finally:
+                self.in_attesa -= 1
+        else:
+            await self._semaforo.acquire()
+
+        self.in_corso += 1
+        try:
+            yield
+        finally:
+            self.in_corso -= 1
+            self._semaforo.release()
+
+    def statistiche(self) -> Dict:
+        """Posti occupati, richieste in coda e rifiutate"""
+        return {
+            "concorrenza": self.concorrenza,
+            "in_corso": self.in_corso,
+            "in_attesa": self.in_attesa,
+            "rifiutate_coda_piena": self.rifiutate,
+            "rifiutate_attesa_scaduta": self.scadute
+        }
@@ -3,53 +3,309 @@ import re
 from openai import OpenAI
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, Dict, List, Any
 import uvicorn
 import json
+import hashlib
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
 import webbrowser  # Aggiunto per aprire automaticamente il browser
-from supabase import create_client, Client
+from supabase import Client
 
+# Importa il client Supabase condiviso
+from database import ottieni_client, chiudi_client
+# Importa il repository asincrono per le query a Supabase
+from repository import ottieni_repository, chiudi_repository
+# Importa circuit breaker, scadenze e coda locale degli ordini
+from resilienza import CircuitBreaker, CircuitoAperto, CodaOrdini, con_resilienza
+from profilo import prepara_dati_comanda, prepara_dati_cliente, ottieni_dettaglio_comanda_dashboard, ottieni_comande_dashboard
 # Importa il gestore degli ordini
-from ordine import GestoreOrdine, e_intento_ordine
+from ordine import GestoreOrdine, ALIAS_PRODOTTI, INVITO_CLIENTE_ABITUALE
+# Importa la rubrica dei clienti abituali
+from clienti import RubricaClienti
+# Importa l'indice a trigrammi per la ricerca dei prodotti
+from ricerca_menu import IndiceProdotti, tolleranza
+# Importa lo snapshot locale del menu
+from snapshot_menu import salva_snapshot, carica_snapshot
+# Importa la cache stale-while-revalidate per le statistiche della dashboard
+from coalescenza import CacheStaleWhileRevalidate
+# Importa la cache delle risposte di fallback
+from cache_risposte import CacheRisposte, dipende_dal_contesto
+# Importa il gestore del budget di token per la cronologia
+from cronologia import BudgetToken, CronologiaCircolare
+# Importa il classificatore locale degli intenti
+from intenti import ClassificatoreIntenti
+# Importa il registro su disco dei turni di conversazione
+from registro_turni import RegistroTurni
+# Importa la pianificazione dei giri di consegna
+from consegne import GeocoderConCache, GeocoderLocale, pianifica_giri
+# Importa i limiti di frequenza e di concorrenza delle richieste
+from limiti import AmmissioneConcorrente, LimitatoreGettoni, RichiestaRifiutata
+# Importa l'esecuzione in ordine dei turni di ogni sessione
+from sessioni import SerializzatoreSessioni
+# Importa l'esportazione a pagine delle comande (CSV e NDJSON)
+from esportazione import FORMATI, esporta_comande, pagine_comande, scegli_colonne
+# Importa l'indice invertito per la ricerca delle comande
+from indice_comande import COLONNE_INDICE, IndiceComande
+# Importa il motore colonnare delle statistiche della dashboard
+from statistiche import TabellaComande, GIORNI_SETTIMANA, INTERVALLI_SERIE, serie_vendite, lttb, data_in_minuto, minuto_in_data, consegna_prevista, stato_comanda
 
 # Carica le variabili d'ambiente dal file .env
 load_dotenv()
 
-# Verifica che le chiavi API siano presenti
-if not os.getenv("OPENAI_API_KEY"):
-    print("ERRORE: Chiave API di OpenAI non trovata nel file .env")
-    exit(1)
+# Client e gestori condivisi: vengono creati all'avvio dell'applicazione (vedi lifespan)
+supabase: Optional[Client] = None
+client: Optional[OpenAI] = None
+menu_manager = None
+gestore_ordine = None
+classificatore_intenti = None
+geocoder_consegne = None
 
-# Verifica e inizializza connessione Supabase
-try:
-    # Ottieni credenziali Supabase
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
+# Clienti abituali riconosciuti dal telefono (popolata all'avvio, aggiornata a ogni ordine)
+rubrica_clienti = RubricaClienti()
+
+# Indice per la ricerca delle comande dalla dashboard (costruito all'avvio, aggiornato a ogni ordine)
+indice_comande = IndiceComande()
+
+# Stato dell'inizializzazione, esposto dagli endpoint di readiness
+stato_avvio = {"pronto": False, "errore": None, "durata_secondi": None}
+
+def _crea_client_openai() -> OpenAI:
+    """
+    Crea il client OpenAI dalla chiave nel file .env
     
-    if not supabase_url or not supabase_key:
-        print("ERRORE: Credenziali Supabase non trovate nel file .env")
-        exit(1)
+    Raises:
+        RuntimeError: Se la chiave non è presente
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Chiave API di OpenAI non trovata nel file .env")
+    # I nuovi tentativi sono gestiti da con_resilienza, non dalla libreria
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=float(os.getenv("OPENAI_TIMEOUT", "15")),
+        max_retries=0
+    )
+
+async def _con_tentativi(funzione, descrizione: str):
+    """
+    Esegue una funzione bloccante in un thread, ripetendola in caso di errore
     
-    # Inizializza il client Supabase
-    supabase: Client = create_client(supabase_url, supabase_key)
-    print(f"Connessione a Supabase stabilita: {supabase_url}")
-except Exception as e:
-    print(f"ERRORE: Impossibile connettersi a Supabase: {str(e)}")
-    exit(1)
+    Args:
+        funzione: Funzione senza argomenti; un risultato False conta come errore
+        descrizione: Nome dell'operazione per i log
+        
+    Returns:
+        Il risultato della funzione
+    """
+    tentativi = int(os.getenv("STARTUP_RETRIES", "3"))
+    attesa = float(os.getenv("STARTUP_RETRY_DELAY", "0.5"))
+    
+    for tentativo in range(1, tentativi + 1):
+        try:
+            risultato = await asyncio.to_thread(funzione)
+            if risultato is not False:
+                return risultato
+            print(f"{descrizione}: tentativo {tentativo}/{tentativi} non riuscito")
+        except Exception as e:
+            print(f"{descrizione}: tentativo {tentativo}/{tentativi} fallito: {str(e)}")
+            if tentativo == tentativi:
+                raise
+        if tentativo < tentativi:
+            # Backoff esponenziale tra un tentativo e l'altro
+            await asyncio.sleep(attesa * 2 ** (tentativo - 1))
+    return False
+
+# Task in background attivi (riferimenti mantenuti per evitare la garbage collection)
+_task_background = set()
 
-# Inizializza il client OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def _avvia_in_background(coroutine):
+    """Avvia una coroutine come task in background"""
+    task = asyncio.create_task(coroutine)
+    _task_background.add(task)
+    task.add_done_callback(_task_background.discard)
+    return task
+
+# Salvataggi degli ordini confermati ancora in corso
+_salvataggi_in_corso = set()
+
+# Ordini confermati che non è stato possibile salvare, da ripetere
+coda_ordini = CodaOrdini()
+
+async def _salva_voce(tipo: str, dati: Dict):
+    """Salva una comanda o un profilo cliente tramite il repository asincrono"""
+    repository = ottieni_repository()
+    if tipo == "comanda":
+        # Una scrittura scaduta può essere comunque arrivata al database
+        if await repository.ottieni_comanda(dati["comanda_id"]) is None:
+            await repository.inserisci_comanda(dati)
+    else:
+        await repository.upsert_cliente(dati)
+
+async def _salva_ordine_su_database(comanda: Dict, cliente: Dict):
+    """
+    Salva comanda e profilo cliente in parallelo; le parti non salvate
+    vengono messe nella coda locale invece di andare perse
+    """
+    esiti = await asyncio.gather(
+        ottieni_repository().inserisci_comanda(comanda),
+        ottieni_repository().upsert_cliente(cliente),
+        return_exceptions=True
+    )
+    for (tipo, dati), esito in zip((("comanda", comanda), ("cliente", cliente)), esiti):
+        if isinstance(esito, Exception):
+            print(f"Errore nel salvataggio ({tipo}) della comanda #{comanda['comanda_id']}: {str(esito) or type(esito).__name__} - messo in coda")
+            coda_ordini.accoda(tipo, dati)
+    if not any(isinstance(esito, Exception) for esito in esiti):
+        print(f"Comanda #{comanda['comanda_id']} salvata")
+
+async def ripeti_ordini_in_coda():
+    """Ripete periodicamente i salvataggi in coda quando Supabase è raggiungibile"""
+    intervallo = float(os.getenv("ORDER_QUEUE_RETRY_SECONDS", "30"))
+    while True:
+        if not ottieni_repository().breaker.aperto and len(coda_ordini):
+            salvate = await coda_ordini.ripeti(_salva_voce)
+            if salvate:
+                print(f"Coda ordini: {salvate} salvataggi recuperati")
+        await asyncio.sleep(intervallo)
+
+def salva_ordine_asincrono(user_id: str, ordine: Dict):
+    """
+    Callback di GestoreOrdine: prepara i dati subito e li salva in background,
+    così la conferma al cliente non attende il database
+    """
+    comanda = prepara_dati_comanda(user_id, ordine)
+    indice_comande.aggiungi(comanda)
+    task = _avvia_in_background(_salva_ordine_su_database(
+        comanda,
+        prepara_dati_cliente(user_id, ordine["cliente"])
+    ))
+    _salvataggi_in_corso.add(task)
+    task.add_done_callback(_salvataggi_in_corso.discard)
+
+async def carica_rubrica_clienti():
+    """Popola la rubrica dei clienti abituali dal database, senza bloccare l'avvio"""
+    try:
+        clienti = await rubrica_clienti.carica(ottieni_repository())
+        print(f"Rubrica clienti caricata: {clienti} clienti")
+    except Exception as e:
+        print(f"Errore nel caricamento della rubrica clienti: {str(e)} - i clienti verranno riconosciuti dai nuovi ordini")
+
+async def carica_indice_comande():
+    """Costruisce l'indice di ricerca leggendo le comande a pagine, senza bloccare l'avvio"""
+    try:
+        inizio = time.perf_counter()
+        comande = await indice_comande.carica(pagine_comande(ottieni_repository(), colonne=COLONNE_INDICE))
+        print(f"Indice delle comande costruito: {comande} comande in {time.perf_counter() - inizio:.1f}s")
+    except Exception as e:
+        print(f"Errore nella costruzione dell'indice delle comande: {str(e)} - la ricerca troverà solo i nuovi ordini")
+
+def _ricostruisci_classificatore():
+    """Ricostruisce il classificatore degli intenti con i nomi del menu corrente"""
+    global classificatore_intenti
+    classificatore_intenti = ClassificatoreIntenti.da_menu(
+        menu_manager.menu_data,
+        soglia=float(os.getenv("INTENT_THRESHOLD", "0.55"))
+    )
+    # Lo stesso classificatore riconosce conferme e domande nel flusso dell'ordine
+    if gestore_ordine is not None:
+        gestore_ordine.classificatore = classificatore_intenti
+
+async def aggiorna_menu_da_database():
+    """
+    Aggiorna il menu da Supabase mentre il servizio usa già lo snapshot locale
+    """
+    if await _con_tentativi(menu_manager.carica_menu, "Aggiornamento menu"):
+        _ricostruisci_classificatore()
+        print("Menu aggiornato dal database")
+    else:
+        print("Aggiornamento menu non riuscito: resta in uso lo snapshot locale")
+
+async def inizializza_servizi():
+    """
+    Crea i client, carica il menu e costruisce i gestori.
+    I client vengono creati in parallelo; il caricamento del menu è ripetuto
+    un numero limitato di volte se Supabase non risponde.
+    """
+    global supabase, client, menu_manager, gestore_ordine, geocoder_consegne
+    
+    inizio = time.perf_counter()
+    try:
+        supabase, client = await asyncio.gather(
+            _con_tentativi(ottieni_client, "Connessione a Supabase"),
+            _con_tentativi(_crea_client_openai, "Inizializzazione client OpenAI")
+        )
+        
+        # Carica il menu: dallo snapshot locale se presente, altrimenti dal database
+        nuovo_menu_manager = MenuManager(supabase, carica=False)
+        da_snapshot = nuovo_menu_manager.carica_da_snapshot()
+        if not da_snapshot and not await _con_tentativi(nuovo_menu_manager.carica_menu, "Caricamento menu"):
+            print("Menu non caricato: il servizio parte con il menu vuoto")
+        menu_manager = nuovo_menu_manager
+        print("Menu inizializzato correttamente")
+        
+        # Inizializza il classificatore degli intenti con le frasi di esempio e i nomi del menu
+        _ricostruisci_classificatore()
+        
+        # Inizializza il gestore degli ordini passando il menu_manager
+        gestore_ordine = GestoreOrdine(menu_index=menu_manager, salva_ordine=salva_ordine_asincrono,
+                                       rubrica=rubrica_clienti, classificatore=classificatore_intenti)
+        print("Gestore ordini inizializzato correttamente")
+        
+        # Geocoder offline degli indirizzi di consegna, con cache
+        geocoder_consegne = GeocoderConCache(GeocoderLocale())
+        
+        stato_avvio["pronto"] = True
+        stato_avvio["errore"] = None
+        
+        # Se si è partiti dallo snapshot, aggiorna il menu dal database in background
+        if da_snapshot:
+            _avvia_in_background(aggiorna_menu_da_database())
+        
+        # Clienti abituali per il riconoscimento dal telefono
+        _avvia_in_background(carica_rubrica_clienti())
+        _avvia_in_background(carica_indice_comande())
+        
+        # Recupera gli ordini rimasti in coda durante un'interruzione di Supabase
+        _avvia_in_background(ripeti_ordini_in_coda())
+        _avvia_in_background(scrivi_registro_periodicamente())
+    except Exception as e:
+        print(f"ERRORE durante l'inizializzazione: {str(e)}")
+        stato_avvio["errore"] = str(e)
+    finally:
+        stato_avvio["durata_secondi"] = round(time.perf_counter() - inizio, 3)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ciclo di vita dell'applicazione: l'inizializzazione parte in background,
+    così il processo risponde subito alla liveness e diventa ready a fine caricamento
+    """
+    task_avvio = asyncio.create_task(inizializza_servizi())
+    yield
+    task_avvio.cancel()
+    # Gli ordini confermati in fase di salvataggio vengono completati prima della chiusura
+    if _salvataggi_in_corso:
+        await asyncio.wait(list(_salvataggi_in_corso), timeout=float(os.getenv("SHUTDOWN_TIMEOUT", "10")))
+    for task in list(_task_background):
+        task.cancel()
+    chiudi_client()
+    await chiudi_repository()
+    registro_turni.chiudi()
 
 # Inizializza l'app FastAPI
-app = FastAPI(title="Chatbot Pizzeria API")
+app = FastAPI(title="Chatbot Pizzeria API", lifespan=lifespan)
 
 # Definizione del modello per la richiesta di chat
 class ChatRequest(BaseModel):
     message: str
     user_id: Optional[str] = "default_user"
+    message_id: Optional[str] = None  # Uguale nei nuovi tentativi dello stesso messaggio
 
 # Modello per la richiesta di login - AGGIUNTO PER DASHBOARD
 class LoginRequest(BaseModel):
@@ -73,70 +329,201 @@ La Pizzeria da Mario è un ristorante italiano autentico. I clienti si aspettano
 Il chatbot dovrebbe usare occasionalmente espressioni italiane tipiche di una pizzeria e mantenere un tono cordiale ma diretto, come un cameriere telefonico italiano che è occupato ma amichevole.
 Evita giri di parole e vai subito al punto, guidando la conversazione verso il completamento dell'ordine in modo efficiente e naturale."""
 
-# Dizionario per memorizzare le conversazioni degli utenti
+# Dizionario per memorizzare le conversazioni degli utenti (user_id -> CronologiaCircolare)
 user_conversations = {}
 
-# Lista di comandi per mostrare il menu
-MENU_COMMANDS = ["mostra menu", "vedi menu", "menu", "il menu", "lista delle pizze", "lista pizza", "lista pizze", "mostrami il menu"]
+# Messaggi conservati per ogni conversazione
+DIMENSIONE_CRONOLOGIA = int(os.getenv("HISTORY_SIZE", "10"))
+
+# Registro append-only dei turni (stato dell'ordine, messaggio, risposta, latenza)
+registro_turni = RegistroTurni(
+    dimensione_segmento=int(os.getenv("TURN_LOG_SEGMENT_MB", "8")) * 1024 * 1024,
+    massimo_segmenti=int(os.getenv("TURN_LOG_MAX_SEGMENTS", "50"))
+)
+
+def _stato_ordine(user_id: str) -> Optional[str]:
+    """Stato dell'ordine attivo dell'utente, None se non ce n'è uno"""
+    ordine = gestore_ordine.ordini_attivi.get(user_id) if gestore_ordine else None
+    return ordine["stato"] if ordine else None
+
+async def scrivi_registro_periodicamente():
+    """Scrive su disco i turni rimasti nel buffer anche quando non arrivano messaggi"""
+    while True:
+        await asyncio.sleep(registro_turni.intervallo_scrittura)
+        registro_turni.scrivi()
+
+# Risposte predefinite per le domande riconosciute localmente
+# (segue la domanda del passo in cui si trova l'ordine, vedi GestoreOrdine.domanda_corrente)
+RISPOSTE_INTENTI = {
+    "saluto": "Buonasera, pizzeria da Mario!",
+    "consegna": "Consegniamo a domicilio tutte le sere dalle 19:00 alle 23:00, con pagamento in contanti o carta alla consegna."
+}
+
+# Risposta di riserva quando OpenAI non è disponibile
+MESSAGGIO_DEGRADATO = "Posso darle informazioni sui nostri piatti, prezzi e ingredienti, oppure prendere subito il suo ordine. Che pizza desidera?"
+
+# Circuit breaker di OpenAI: con il circuito aperto si risponde in modalità degradata
+breaker_openai = CircuitBreaker(
+    "openai",
+    soglia_errori=int(os.getenv("BREAKER_FAILURES", "5")),
+    attesa_secondi=float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+)
+
+# Limiti delle richieste al chatbot. Ogni IP ha un tetto ampio su tutti i messaggi
+# (il flusso dell'ordine è deterministico ed economico); le domande che arrivano
+# al LLM hanno limiti stretti per utente e per IP e un numero massimo di chiamate
+# contemporanee, con una coda breve oltre la quale si risponde subito 429
+limite_messaggi_ip = LimitatoreGettoni(
+    "messaggi_ip",
+    capacita=float(os.getenv("CHAT_IP_BURST", "60")),
+    gettoni_al_secondo=float(os.getenv("CHAT_IP_RATE", "2"))
+)
+limite_llm_utente = LimitatoreGettoni(
+    "llm_utente",
+    capacita=float(os.getenv("LLM_USER_BURST", "5")),
+    gettoni_al_secondo=float(os.getenv("LLM_USER_RATE", "0.2"))
+)
+limite_llm_ip = LimitatoreGettoni(
+    "llm_ip",
+    capacita=float(os.getenv("LLM_IP_BURST", "20")),
+    gettoni_al_secondo=float(os.getenv("LLM_IP_RATE", "1"))
+)
+ammissione_llm = AmmissioneConcorrente(
+    "openai",
+    concorrenza=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    coda_massima=int(os.getenv("LLM_QUEUE_SIZE", "16")),
+    attesa_massima=float(os.getenv("LLM_QUEUE_TIMEOUT", "2"))
+)
+MESSAGGIO_TROPPE_RICHIESTE = "Mi scusi, sto ricevendo troppe richieste. Riprovi tra qualche secondo, oppure continui pure con il suo ordine."
+
+# Turni di ogni sessione in ordine, con scarto dei messaggi inviati due volte
+serializzatore_sessioni = SerializzatoreSessioni(finestra_duplicati=float(os.getenv("CHAT_DEDUP_SECONDS", "2")))
+
+def _ip_cliente(request: Request) -> str:
+    """IP del client (dal primo X-Forwarded-For se TRUST_FORWARDED_FOR=1, dietro un proxy fidato)"""
+    if os.getenv("TRUST_FORWARDED_FOR", "0") == "1":
+        inoltrato = request.headers.get("x-forwarded-for")
+        if inoltrato:
+            return inoltrato.split(",")[0].strip()
+    return request.client.host if request.client else "sconosciuto"
+
+def _risposta_troppe_richieste(rifiuto: RichiestaRifiutata, testo: str = MESSAGGIO_TROPPE_RICHIESTE) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"response": testo},
+        headers={"Retry-After": rifiuto.retry_after}
+    )
+
+# Cache delle risposte di fallback, indicizzata per domanda normalizzata e versione del menu
+cache_risposte = CacheRisposte(
+    capacita=int(os.getenv("FALLBACK_CACHE_SIZE", "256")),
+    ttl_secondi=float(os.getenv("FALLBACK_CACHE_TTL", "3600"))
+)
+
+# Budget di token per la cronologia inviata a OpenAI
+budget_cronologia = BudgetToken(
+    budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "600")),
+    limite_messaggio=int(os.getenv("HISTORY_MESSAGE_TOKEN_LIMIT", "200"))
+)
 
-def get_chatgpt_response(message, conversation_history, system_instruction=None):
+def _chiama_chatgpt(message, conversation_history, system_instruction=None):
     """
     Invia un messaggio a ChatGPT con un'istruzione di sistema specifica o quella definita in SYSTEM_PROMPT
+    
+    Raises:
+        Exception: Gli errori della chiamata a OpenAI
+    """
+    # Usa il SYSTEM_PROMPT definito nel file se non viene specificata un'istruzione specifica
+    if system_instruction is None:
+        system_instruction = SYSTEM_PROMPT
+    
+    # Prepara i messaggi per l'API di OpenAI con l'istruzione specifica
+    messages = [
+        {"role": "system", "content": system_instruction}
+    ]
+    
+    # Aggiungi la cronologia della conversazione, condensata entro il budget di token
+    messages.extend(budget_cronologia.prepara(conversation_history))
+    
+    # Aggiungi il messaggio corrente dell'utente
+    messages.append({"role": "user", "content": message})
+    
+    # Chiama l'API di OpenAI
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    max_tokens = int(os.getenv("MAX_TOKENS", "1000"))
+    temperature = float(os.getenv("TEMPERATURE", "0.5"))
+    
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+    
+    # Estrai la risposta
+    return response.choices[0].message.content
+
+async def get_chatgpt_response(message, conversation_history, system_instruction=None):
+    """
+    Invia un messaggio a ChatGPT tramite il circuit breaker, con scadenza
+    complessiva e nuovi tentativi con backoff
+    
+    Returns:
+        La risposta, oppure None se OpenAI non è disponibile (modalità degradata)
     """
     try:
-        # Usa il SYSTEM_PROMPT definito nel file se non viene specificata un'istruzione specifica
-        if system_instruction is None:
-            system_instruction = SYSTEM_PROMPT
-        
-        # Prepara i messaggi per l'API di OpenAI con l'istruzione specifica
-        messages = [
-            {"role": "system", "content": system_instruction}
-        ]
-        
-        # Aggiungi la cronologia della conversazione
-        messages.extend(conversation_history)
-        
-        # Aggiungi il messaggio corrente dell'utente
-        messages.append({"role": "user", "content": message})
-        
-        # Chiama l'API di OpenAI
-        model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        max_tokens = int(os.getenv("MAX_TOKENS", "1000"))
-        temperature = float(os.getenv("TEMPERATURE", "0.5"))
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
+        return await con_resilienza(
+            breaker_openai,
+            lambda: run_in_threadpool(_chiama_chatgpt, message, conversation_history, system_instruction),
+            scadenza=float(os.getenv("OPENAI_DEADLINE", "20")),
+            tentativi=1 + int(os.getenv("OPENAI_RETRIES", "1"))
         )
-        
-        # Estrai la risposta
-        reply = response.choices[0].message.content
-        
-        return reply
-        
+    except CircuitoAperto:
+        print("OpenAI non disponibile (circuito aperto): risposta in modalità degradata")
+    except Exception as e:
+        print(f"\nErrore nella chiamata all'API: {str(e) or type(e).__name__}")
+    return None
+
+def risposta_degradata(messaggio: str) -> str:
+    """
+    Risposta senza OpenAI: le domande sul menu ricevono la risposta del menu
+    locale, le altre un invito a proseguire con l'ordine
+    """
+    try:
+        return menu_manager.query_menu(messaggio)
     except Exception as e:
-        print(f"\nErrore nella chiamata all'API: {str(e)}")
-        return f"Mi scusi, si è verificato un errore di sistema. Può ripetere?"
+        print(f"Errore nella risposta degradata: {str(e)}")
+        return MESSAGGIO_DEGRADATO
 
 # Classe per gestire il menu da Supabase
 class MenuManager:
-    def __init__(self, supabase_client):
-        """Inizializza il gestore del menu con il client Supabase"""
+    def __init__(self, supabase_client, carica=True):
+        """
+        Inizializza il gestore del menu con il client Supabase
+        
+        Args:
+            supabase_client: Client Supabase
+            carica: Se True carica subito il menu (altrimenti va chiamato carica_menu)
+        """
         self.supabase = supabase_client
         self.menu_data = {}
-        self.carica_menu()
+        self.versione_menu = ""
+        self.prodotti = {}  # nome prodotto -> dettagli
+        self.indice_prodotti = IndiceProdotti()
+        self.origine_menu = None  # "database" o "snapshot"
+        if carica:
+            self.carica_menu()
     
     def carica_menu(self):
-        """Carica i dati del menu da Supabase"""
+        """
+        Carica i dati del menu da Supabase
+        
+        Returns:
+            True se la query è riuscita, False in caso di errore di connessione
+        """
         try:
             print("Caricamento menu da Supabase...")
             
-            # Tentativo di eseguire una query di test per verificare la connessione
-            self.supabase.table("menu_pizzeria").select("count").limit(1).execute()
-            print("Connessione a Supabase verificata con successo")
-            
             # Recupera i prodotti dal menu_pizzeria
             response = self.supabase.table("menu_pizzeria").select("*").execute()
             prodotti = response.data
@@ -144,40 +531,82 @@ class MenuManager:
             if not prodotti:
                 print("Nessun prodotto trovato nel database Supabase")
                 self.menu_data = {}
-                return
+                self._aggiorna_indici_menu()
+                return True
                 
-            # Prepara la struttura del menu
-            self.menu_data = {}
+            # Prepara la struttura del menu (sostituita in blocco alla fine del caricamento)
+            nuovo_menu = {}
             
             # Organizza i prodotti per categoria
             for prodotto in prodotti:
                 categoria = prodotto.get('categoria', 'Altro')
                 
                 # Crea la categoria se non esiste
-                if categoria not in self.menu_data:
-                    self.menu_data[categoria] = {}
+                if categoria not in nuovo_menu:
+                    nuovo_menu[categoria] = {}
                 
                 # Aggiungi il prodotto alla categoria
                 nome_prodotto = prodotto.get('nome', '')
                 if nome_prodotto:
-                    self.menu_data[categoria][nome_prodotto] = {
+                    nuovo_menu[categoria][nome_prodotto] = {
                         "price": prodotto.get('prezzo', 0),
                         "description": prodotto.get('descrizione', '')
                     }
             
             # Verifica se il menu è vuoto
-            if not self.menu_data or all(len(items) == 0 for items in self.menu_data.values()):
+            if not nuovo_menu or all(len(items) == 0 for items in nuovo_menu.values()):
                 print("Menu vuoto o formato non valido")
                 self.menu_data = {}
-                return
-                
+                self._aggiorna_indici_menu()
+                return True
+            
+            self.menu_data = nuovo_menu
+            self.origine_menu = "database"
             print(f"Menu caricato con successo: {len(self.menu_data)} categorie")
-            self._debug_print_menu_data()
+            self._aggiorna_indici_menu()
+            if os.getenv("DEBUG_MENU"):
+                self._debug_print_menu_data()
+            
+            # Salva lo snapshot locale per i prossimi avvii
+            salva_snapshot(self.menu_data, self.versione_menu)
+            return True
             
         except Exception as e:
             print(f"Errore nel caricamento del menu da Supabase: {str(e)}")
-            # In caso di errore, inizializza con un menu vuoto
-            self.menu_data = {}
+            # In caso di errore mantiene il menu già caricato (es. dallo snapshot)
+            if not self.menu_data:
+                self.menu_data = {}
+                self._aggiorna_indici_menu()
+            return False
+    
+    def carica_da_snapshot(self):
+        """
+        Carica il menu dallo snapshot locale salvato all'ultimo caricamento riuscito
+        
+        Returns:
+            True se lo snapshot era presente e valido
+        """
+        snapshot = carica_snapshot()
+        if not snapshot or not snapshot["menu"]:
+            return False
+        
+        self.menu_data = snapshot["menu"]
+        self.origine_menu = "snapshot"
+        self._aggiorna_indici_menu()
+        print(f"Menu caricato dallo snapshot del {snapshot['salvato_il']}: {len(self.menu_data)} categorie")
+        return True
+    
+    def _aggiorna_indici_menu(self):
+        """
+        Ricostruisce le strutture derivate dal menu: l'impronta usata per
+        invalidare le risposte in cache e l'indice per la ricerca dei prodotti
+        """
+        contenuto = json.dumps(self.menu_data, sort_keys=True, default=str)
+        self.versione_menu = hashlib.sha1(contenuto.encode("utf-8")).hexdigest()[:12]
+        self.prodotti = {
+            nome: details for items in self.menu_data.values() for nome, details in items.items()
+        }
+        self.indice_prodotti = IndiceProdotti.da_menu(self.menu_data, ALIAS_PRODOTTI)
     
     def _debug_print_menu_data(self):
         """Stampa i dati del menu per debug"""
@@ -227,35 +656,11 @@ class MenuManager:
     
     def extract_item_name(self, text):
         """
-        Estrae possibili nomi di prodotti dal testo
+        Estrae possibili nomi di prodotti dal testo, tollerando errori di battitura
         """
-        # Crea un set di tutti i prodotti del menu
-        all_items = set()
-        for section in self.menu_data.values():
-            for item in section.keys():
-                all_items.add(item.lower())
-                # Aggiungi anche la prima parola del nome come possibile match
-                words = item.split()
-                if words:
-                    all_items.add(words[0].lower())
-        
-        # Normalizza il testo per la ricerca
-        text_lower = text.lower()
-        
-        # Cerca menzioni di prodotti nel testo
-        for item in all_items:
-            if item in text_lower:
-                return item
-        
-        # Se non abbiamo trovato un match esatto, cerca parole che potrebbero essere nomi di prodotti
-        words = text_lower.replace(',', ' ').replace('.', ' ').split()
-        for word in words:
-            if len(word) > 3 and word not in ["pizza", "vorrei", "voglio", "ordinare", "anche", "solo", "senza", "euro", "grazie"]:
-                # Cerca somiglianze
-                for item in all_items:
-                    if word in item or any(w in item for w in words if len(w) > 3):
-                        return item
-        
+        corrispondenze = self.indice_prodotti.trova_nel_testo(text)
+        if corrispondenze:
+            return corrispondenze[0].nome.lower()
         return None
     
     def extract_price_from_text(self, text):
@@ -293,31 +698,35 @@ class MenuManager:
         # Normalizza il nome dell'elemento per la ricerca
         item_name_lower = item_name.lower()
         
-        # Cerca in tutte le sezioni
-        for section_title, items in self.menu_data.items():
-            for menu_item, details in items.items():
-                if item_name_lower in menu_item.lower():
-                    # Se il prezzo è menzionato, verifica
-                    if mentioned_price is not None:
-                        try:
-                            mentioned_price_float = float(mentioned_price)
-                            actual_price = details["price"]
-                            
-                            if abs(mentioned_price_float - actual_price) < 0.01:
-                                return (True, True, f"La {menu_item} costa €{actual_price:.2f}")
-                            else:
-                                return (True, False, f"La {menu_item} costa €{actual_price:.2f}")
-                        except (ValueError, TypeError):
-                            return (True, False, f"La {menu_item} costa €{details['price']:.2f}")
+        # Cerca il prodotto nell'indice (match esatto o con pochi errori di battitura)
+        risultati = self.indice_prodotti.cerca(item_name, k=1)
+        if risultati:
+            menu_item = risultati[0].nome
+            details = self.prodotti[menu_item]
+            
+            # Se il prezzo è menzionato, verifica
+            if mentioned_price is not None:
+                try:
+                    mentioned_price_float = float(mentioned_price)
+                    actual_price = details["price"]
+                    
+                    if abs(mentioned_price_float - actual_price) < 0.01:
+                        return (True, True, f"La {menu_item} costa €{actual_price:.2f}")
                     else:
-                        return (True, True, f"La {menu_item} costa €{details['price']:.2f}")
+                        return (True, False, f"La {menu_item} costa €{actual_price:.2f}")
+                except (ValueError, TypeError):
+                    return (True, False, f"La {menu_item} costa €{details['price']:.2f}")
+            else:
+                return (True, True, f"La {menu_item} costa €{details['price']:.2f}")
         
-        # Se non trova corrispondenze esatte, prova a ottenere alternative simili
-        alternatives = []
+        # Se non trova corrispondenze, propone i prodotti più vicini nell'indice
+        alternatives = [
+            c.nome for c in self.indice_prodotti.cerca(item_name, k=3, limite=tolleranza(item_name_lower) + 2)
+        ]
         for section_title, items in self.menu_data.items():
             for menu_item in items.keys():
                 # Verifica somiglianza parziale
-                if any(word in menu_item.lower() for word in item_name_lower.split() if len(word) > 3):
+                if menu_item not in alternatives and any(word in menu_item.lower() for word in item_name_lower.split() if len(word) > 3):
                     alternatives.append(menu_item)
         
         if alternatives:
@@ -330,15 +739,14 @@ class MenuManager:
         """
         Restituisce gli ingredienti di un prodotto se disponibili
         """
-        item_name_lower = item_name.lower()
-        
-        for section_items in self.menu_data.values():
-            for menu_item, details in section_items.items():
-                if item_name_lower in menu_item.lower():
-                    if details["description"]:
-                        return f"La {menu_item} contiene: {details['description']}"
-                    else:
-                        return f"Mi dispiace, non abbiamo informazioni dettagliate sugli ingredienti della {menu_item}."
+        risultati = self.indice_prodotti.cerca(item_name, k=1)
+        if risultati:
+            menu_item = risultati[0].nome
+            details = self.prodotti[menu_item]
+            if details["description"]:
+                return f"La {menu_item} contiene: {details['description']}"
+            else:
+                return f"Mi dispiace, non abbiamo informazioni dettagliate sugli ingredienti della {menu_item}."
         
         return f"Mi dispiace, non abbiamo '{item_name}' nel nostro menu."
     
@@ -379,25 +787,119 @@ class MenuManager:
         # Risposta generica se non abbiamo capito la domanda
         return "Posso darle informazioni sui nostri piatti, prezzi e ingredienti. Cosa vuole sapere esattamente?"
 
-# Inizializza il gestore del menu passando il client Supabase
-try:
-    menu_manager = MenuManager(supabase)
-    print("Menu inizializzato correttamente")
-except Exception as e:
-    print(f"Errore durante l'inizializzazione del menu: {str(e)}")
-    exit(1)
-
-# Inizializza il gestore degli ordini passando il menu_manager
-try:
-    gestore_ordine = GestoreOrdine(menu_index=menu_manager)
-    print("Gestore ordini inizializzato correttamente")
-    # Debug - Verifica che menu_index sia stato passato correttamente
-    print(f"DEBUG - menu_index.menu_data presente in gestore_ordine: {hasattr(gestore_ordine, 'menu_index') and hasattr(gestore_ordine.menu_index, 'menu_data')}")
-except Exception as e:
-    print(f"Errore durante l'inizializzazione del gestore ordini: {str(e)}")
-    # Prova a inizializzare senza menu_manager in caso di errore
-    gestore_ordine = GestoreOrdine()
-    print("Gestore ordini inizializzato in modalità fallback")
+def risposta_locale(messaggio: str) -> Optional[str]:
+    """
+    Risponde localmente ai messaggi di cui il classificatore riconosce l'intento
+    
+    Returns:
+        La risposta, oppure None se il messaggio va inoltrato a ChatGPT
+    """
+    intento, confidenza = classificatore_intenti.classifica(messaggio)
+    print(f"DEBUG - Intento rilevato: {intento} (confidenza {confidenza:.2f})")
+    
+    if intento is None:
+        return None
+    if intento == "menu":
+        return f"Ecco il nostro menu:\n\n{menu_manager.format_menu_section()}"
+    if intento in ("prezzo", "ingredienti"):
+        # Senza un prodotto riconosciuto la domanda è troppo generica per il menu locale
+        if not menu_manager.extract_item_name(messaggio):
+            return None
+        return menu_manager.query_menu(messaggio)
+    return RISPOSTE_INTENTI.get(intento)
+
+async def _risposta_fuori_flusso(user_id: str, messaggio: str, ip: str):
+    """
+    Risponde a un messaggio fuori dal flusso dell'ordine: localmente se il
+    classificatore riconosce l'intento, altrimenti dalla cache o da ChatGPT
+    
+    Args:
+        user_id: ID della sessione
+        messaggio: Messaggio del cliente
+        ip: IP del client, per i limiti delle domande al LLM
+    
+    Returns:
+        Tupla (risposta, RichiestaRifiutata se i limiti del LLM sono superati, altrimenti None)
+    """
+    # Prova a rispondere localmente prima di interpellare ChatGPT
+    try:
+        risposta = risposta_locale(messaggio)
+    except Exception as e:
+        print(f"Errore nella classificazione dell'intento: {str(e)}")
+        risposta = None
+    if risposta is not None:
+        print("Intento gestito localmente")
+        return risposta, None
+    
+    # Le domande indipendenti dalla conversazione possono usare la cache
+    cacheable = not dipende_dal_contesto(messaggio)
+    cached = cache_risposte.ottieni(messaggio, menu_manager.versione_menu) if cacheable else None
+    if cached is not None:
+        print("Risposta generica servita dalla cache")
+        return cached, None
+    
+    try:
+        # Limiti per utente e per IP, poi un posto tra le chiamate contemporanee
+        limite_llm_utente.verifica(user_id)
+        limite_llm_ip.verifica(ip)
+        async with ammissione_llm.posto():
+            print("Utilizzo risposta generica da ChatGPT")
+            risposta = await get_chatgpt_response(messaggio, user_conversations[user_id].messaggi(escludi_ultimi=1))
+    except RichiestaRifiutata as e:
+        print(f"Richiesta al LLM rifiutata: {str(e)} (user_id={user_id}, ip={ip})")
+        return MESSAGGIO_TROPPE_RICHIESTE, e
+    
+    if risposta is None:
+        # Modalità degradata: risposta locale, mai in cache
+        return risposta_degradata(messaggio), None
+    if cacheable:
+        cache_risposte.salva(messaggio, menu_manager.versione_menu, risposta)
+    return risposta, None
+
+# Risposta per le richieste che arrivano prima della fine dell'inizializzazione
+def _risposta_non_pronto():
+    return JSONResponse(
+        status_code=503,
+        content={"response": "Un attimo, stiamo aprendo la pizzeria! Riprovi tra qualche secondo."}
+    )
+
+# Endpoint di liveness: il processo è attivo
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+# Endpoint di readiness: client connessi, menu caricato e gestori pronti
+@app.get("/health/ready")
+async def health_ready():
+    content = {
+        "status": "ready" if stato_avvio["pronto"] else "starting",
+        "errore": stato_avvio["errore"],
+        "durata_avvio_secondi": stato_avvio["durata_secondi"],
+        "menu_categorie": len(menu_manager.menu_data) if menu_manager else 0,
+        "menu_origine": menu_manager.origine_menu if menu_manager else None
+    }
+    return JSONResponse(status_code=200 if stato_avvio["pronto"] else 503, content=content)
+
+# Stato delle dipendenze esterne: circuit breaker e ordini in coda
+@app.get("/health/dependencies")
+async def health_dependencies():
+    try:
+        breaker_supabase = ottieni_repository().breaker.statistiche()
+    except RuntimeError as e:
+        breaker_supabase = {"stato": "non_configurato", "errore": str(e)}
+    return {
+        "openai": breaker_openai.statistiche(),
+        "supabase": breaker_supabase,
+        "ordini_in_coda": len(coda_ordini),
+        "degradato": breaker_openai.aperto,
+        "sessioni": serializzatore_sessioni.statistiche(),
+        "rubrica_clienti": rubrica_clienti.statistiche(),
+        "indice_comande": indice_comande.statistiche(),
+        "limiti": {
+            "llm": ammissione_llm.statistiche(),
+            **{limite.nome: limite.statistiche() for limite in (limite_messaggi_ip, limite_llm_utente, limite_llm_ip)}
+        }
+    }
 
 # Route per servire il file login.html come pagina principale
 @app.get("/")
@@ -416,10 +918,40 @@ async def get_dashboard():
 
 # API endpoint per gestire le richieste di chat
 @app.post("/api/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, richiesta_http: Request):
+    if not stato_avvio["pronto"]:
+        return _risposta_non_pronto()
+    
+    ip = _ip_cliente(richiesta_http)
     try:
-        user_message = request.message
-        user_id = request.user_id
+        limite_messaggi_ip.verifica(ip)
+    except RichiestaRifiutata as e:
+        print(f"Messaggio rifiutato: {str(e)} (ip={ip})")
+        return _risposta_troppe_richieste(e)
+    
+    # I turni della stessa sessione vengono elaborati uno alla volta e i doppi invii ignorati
+    return await serializzatore_sessioni.esegui(
+        request.user_id, request.message, lambda: _turno_chat(request.user_id, request.message, ip),
+        id_messaggio=request.message_id
+    )
+
+async def _turno_chat(user_id: str, user_message: str, ip: str) -> JSONResponse:
+    """
+    Elabora un messaggio del cliente (eseguito in esclusiva per la sessione)
+    
+    Args:
+        user_id: ID della sessione
+        user_message: Messaggio del cliente
+        ip: IP del client, per i limiti delle domande al LLM
+    
+    Returns:
+        La risposta JSON del chatbot
+    """
+    rifiuto = None
+    
+    try:
+        inizio_turno = time.perf_counter()
+        stato_prima = _stato_ordine(user_id)
         
         # Debug - Informazioni sulla richiesta
         print(f"DEBUG - Richiesta ricevuta: user_id={user_id}, messaggio='{user_message}'")
@@ -429,11 +961,10 @@ async def chat(request: ChatRequest):
         if user_id not in user_conversations:
             # Ottieni il menu per includerlo nel messaggio di benvenuto
             menu_text = menu_manager.format_menu_section()
-            welcome_with_menu = f"Buonasera, pizzeria da Mario! Ecco il nostro menu:\n\n{menu_text}\n\nChe pizza desidera ordinare?"
+            welcome_with_menu = f"Buonasera, pizzeria da Mario! Ecco il nostro menu:\n\n{menu_text}\n\nChe pizza desidera ordinare? {INVITO_CLIENTE_ABITUALE}"
             
-            user_conversations[user_id] = [
-                {"role": "assistant", "content": welcome_with_menu}
-            ]
+            user_conversations[user_id] = CronologiaCircolare(DIMENSIONE_CRONOLOGIA)
+            user_conversations[user_id].aggiungi("assistant", welcome_with_menu)
             
             # Se è un nuovo utente, avvia automaticamente un nuovo ordine
             gestore_ordine.inizia_nuovo_ordine(user_id)
@@ -444,62 +975,49 @@ async def chat(request: ChatRequest):
                 return JSONResponse({"response": welcome_with_menu})
         
         # Aggiungi il messaggio dell'utente alla conversazione
-        user_conversations[user_id].append({"role": "user", "content": user_message})
+        user_conversations[user_id].aggiungi("user", user_message)
         
-        # Verifica prioritariamente se è una richiesta di menu
-        if any(cmd in user_message.lower() for cmd in MENU_COMMANDS):
-            # Mostra il menu completo
-            menu_text = menu_manager.format_menu_section()
-            response_text = f"Ecco il nostro menu:\n\n{menu_text}\n\nChe pizza desidera ordinare?"
-            print("Richiesta menu rilevata")
+        # Se il messaggio è vuoto, fornisci un messaggio di benvenuto invece di elaborarlo
+        if not user_message:
+            response_text = welcome_with_menu
+            print("Messaggio vuoto rilevato, inviando messaggio di benvenuto")
         else:
-            # Se il messaggio è vuoto, fornisci un messaggio di benvenuto invece di elaborarlo
-            if not user_message:
-                response_text = welcome_with_menu
-                print("Messaggio vuoto rilevato, inviando messaggio di benvenuto")
-            else:
-                # Altrimenti, gestisci con il gestore ordini
-                response_text = gestore_ordine.gestisci_messaggio(user_id, user_message)
-                
-                # Debug - Risposta dal gestore_ordine
-                print(f"DEBUG - Risposta dal gestore_ordine: '{response_text}'")
+            # Altrimenti, gestisci con il gestore ordini
+            response_text = gestore_ordine.gestisci_messaggio(user_id, user_message)
+            
+            # Debug - Risposta dal gestore_ordine
+            print(f"DEBUG - Risposta dal gestore_ordine: '{response_text}'")
+            
+            # Se il gestore ordini richiede di mostrare il menu
+            if response_text == "MOSTRA_MENU":
+                menu_text = menu_manager.format_menu_section()
+                response_text = f"Ecco il nostro menu:\n\n{menu_text}\n\nChe pizza desidera ordinare?"
+                print("Richiesta menu da gestore ordini")
+            # Il messaggio non è una risposta al passo dell'ordine: prima la risposta locale, poi il LLM
+            elif response_text == "FALLBACK":
+                print("Fallback attivato - Classificazione locale dell'intento")
+                response_text, rifiuto = await _risposta_fuori_flusso(user_id, user_message, ip)
                 
-                # Se il gestore ordini richiede di mostrare il menu
-                if response_text == "MOSTRA_MENU":
-                    menu_text = menu_manager.format_menu_section()
-                    response_text = f"Ecco il nostro menu:\n\n{menu_text}\n\nChe pizza desidera ordinare?"
-                    print("Richiesta menu da gestore ordini")
-                # Se non è un messaggio relativo all'ordine, controlla prima se è una domanda sul menu
-                elif response_text == "FALLBACK":
-                    print("Fallback attivato - Controllo query sul menu")
-                    # Controlla se l'utente sta chiedendo informazioni sul menu
-                    menu_keywords = ["carta", "prezzo", "costa", "quanto", "ingredienti", "disponibile", "offrite"]
-                    is_menu_query = any(keyword in user_message.lower() for keyword in menu_keywords)
-                    
-                    # Gestisci le domande sul menu
-                    if is_menu_query:
-                        try:
-                            response_text = menu_manager.query_menu(user_message)
-                            print("Query sul menu elaborata")
-                        except Exception as e:
-                            print(f"Errore nell'elaborazione della query sul menu: {str(e)}")
-                            response_text = "Mi scusi, al momento non riesco a trovare queste informazioni. Posso aiutarla con un ordine?"
-                    # Altrimenti usa il fallback generico
-                    else:
-                        print("Utilizzo risposta generica da ChatGPT")
-                        response_text = get_chatgpt_response(user_message, user_conversations[user_id][:-1])
-        
-        # Aggiungi la risposta alla cronologia
-        user_conversations[user_id].append({"role": "assistant", "content": response_text})
+                # Riporta il cliente al passo dell'ordine in cui si trovava
+                domanda = gestore_ordine.domanda_corrente(user_id)
+                if domanda and not response_text.rstrip().endswith("?"):
+                    response_text = f"{response_text}\n\n{domanda}"
         
-        # Limita la lunghezza della cronologia
-        if len(user_conversations[user_id]) > 10:
-            user_conversations[user_id] = user_conversations[user_id][-10:]
+        # Aggiungi la risposta alla cronologia (a capacità fissa: i messaggi più vecchi vengono sostituiti)
+        user_conversations[user_id].aggiungi("assistant", response_text)
         
         # Debug
         print(f"Risposta: '{response_text[:100]}...'")
         
-        # Restituisci la risposta come JSON
+        # Registra il turno su disco (stato dell'ordine prima e dopo, latenza)
+        registro_turni.registra(
+            user_id, stato_prima, _stato_ordine(user_id), user_message, response_text,
+            (time.perf_counter() - inizio_turno) * 1000
+        )
+        
+        # Restituisci la risposta come JSON (429 se la domanda al LLM è stata rifiutata)
+        if rifiuto is not None:
+            return _risposta_troppe_richieste(rifiuto, response_text)
         return JSONResponse({"response": response_text})
         
     except Exception as e:
@@ -529,24 +1047,45 @@ async def login(request: LoginRequest):
             content={"success": False, "error": "Credenziali non valide"}
         )
 
+# Cache delle statistiche: richieste concorrenti condividono un unico calcolo
+cache_statistiche = CacheStaleWhileRevalidate(
+    fresco_secondi=float(os.getenv("DASHBOARD_STATS_FRESH", "5")),
+    stantio_secondi=float(os.getenv("DASHBOARD_STATS_STALE", "30"))
+)
+
 # Endpoint per ottenere le statistiche della dashboard
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats():
     """
-    Ottiene le statistiche per la dashboard dalle tabelle Supabase
+    Ottiene le statistiche per la dashboard dalle tabelle Supabase.
+    Più dashboard aperte insieme condividono lo stesso calcolo, e un risultato
+    recente viene servito mentre l'aggiornamento gira in background.
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    
+    return await cache_statistiche.ottieni(
+        "dashboard_stats",
+        _calcola_statistiche_dashboard,
+        memorizza=lambda risultato: risultato.get("success", False) and "debug_info" not in risultato
+    )
+
+async def _calcola_statistiche_dashboard():
+    """
+    Calcola le statistiche per la dashboard dalle tabelle Supabase.
+    Comande e clienti vengono recuperati in parallelo.
     """
     try:
-        # Verifica se le tabelle esistono
-        try:
-            # Verifica tabella comande
-            debug_response = supabase.table("comande").select("count").limit(1).execute()
-            print(f"Debug tabella comande: {debug_response}")
-            
-            # Verifica tabella clienti
-            clients_debug = supabase.table("clienti").select("count").limit(1).execute()
-            print(f"Debug tabella clienti: {clients_debug}")
-        except Exception as debug_error:
-            print(f"Errore debug tabelle: {str(debug_error)}")
+        repository = ottieni_repository()
+        risultati_comande, risultati_clienti = await asyncio.gather(
+            repository.lista_comande(),
+            repository.lista_clienti(),
+            return_exceptions=True
+        )
+        
+        # Se la tabella comande non è accessibile restituisce statistiche vuote con il motivo
+        if isinstance(risultati_comande, Exception):
+            print(f"Errore accesso tabella comande: {str(risultati_comande)}")
             return {
                 "success": True,
                 "data": {
@@ -555,17 +1094,13 @@ async def get_dashboard_stats():
                     "avg_order": 0,
                     "top_pizza": "-",
                     "recent_orders": [],
-                    "pizza_chart_data": [],
-                    "sales_chart_data": []
+                    "pizza_chart_data": []
                 },
-                "debug_info": f"Errore accesso tabelle: {str(debug_error)}"
+                "debug_info": f"Errore accesso tabelle: {str(risultati_comande)}"
             }
-
-        # Ottieni le comande senza ordinamento (per evitare errori di sintassi)
-        response = supabase.table("comande").select("*").execute()
-        print(f"Risposta query comande: {len(response.data) if response.data else 0} righe")
+        print(f"Risposta query comande: {len(risultati_comande)} righe")
         
-        if not response.data:
+        if not risultati_comande:
             print("Nessun dato trovato nella tabella comande")
             return {
                 "success": True,
@@ -575,141 +1110,61 @@ async def get_dashboard_stats():
                     "avg_order": 0,
                     "top_pizza": "-",
                     "recent_orders": [],
-                    "pizza_chart_data": [],
-                    "sales_chart_data": []
+                    "pizza_chart_data": []
                 }
             }
         
-        # Ottieni i dati e ordina manualmente
-        orders = response.data
-        
-        # Ordina manualmente per data decrescente se c'è un campo 'data'
-        if orders and len(orders) > 0 and 'data' in orders[0]:
-            orders.sort(key=lambda x: x.get('data', ''), reverse=True)
+        # Comande in forma colonnare: i raggruppamenti sono calcolati con NumPy
+        tabella = TabellaComande(risultati_comande)
         
         # Recupera i dati clienti
         client_info = {}
-        try:
-            client_response = supabase.table("clienti").select("*").execute()
-            if client_response.data:
-                for client in client_response.data:
-                    # Usa il telefono come chiave per abbinare clienti e comande
-                    telefono = client.get('telefono')
-                    if telefono:
-                        client_info[telefono] = client
-                print(f"Recuperati {len(client_info)} clienti")
-        except Exception as client_error:
-            print(f"Errore nel recupero dei clienti: {str(client_error)}")
-        
-        # Calcola statistiche
-        total_orders = len(orders)
-        total_revenue = 0
-        
-        # Prepara i dati per i grafici e la tabella
-        pizza_count = {}
-        sales_by_date = {}
-        
-        # Elabora ogni comanda
-        for order in orders:
-            try:
-                # Calcola il totale
-                order_total = 0
-                if 'totale' in order and order['totale'] is not None:
-                    try:
-                        order_total = float(order['totale'])
-                        total_revenue += order_total
-                    except (ValueError, TypeError):
-                        print(f"Errore nel convertire il totale: {order.get('totale')}")
-                
-                # Estrai la data per il grafico vendite
-                order_date = order.get('data', '')
-                if order_date:
-                    date_str = order_date.split('T')[0] if 'T' in order_date else order_date
-                    if date_str in sales_by_date:
-                        sales_by_date[date_str] += order_total
-                    else:
-                        sales_by_date[date_str] = order_total
-                
-                # Estrai le pizze/prodotti
-                # Prima verifica se abbiamo 'pizze' come JSON o come stringa
-                if 'pizze' in order:
-                    pizze = order['pizze']
-                    if isinstance(pizze, list):
-                        for pizza_item in pizze:
-                            if isinstance(pizza_item, dict) and 'nome' in pizza_item:
-                                pizza_name = pizza_item['nome']
-                                pizza_count[pizza_name] = pizza_count.get(pizza_name, 0) + 1
-                    elif isinstance(pizze, str):
-                        pizza_names = [p.strip() for p in pizze.split(',') if p.strip()]
-                        for pizza_name in pizza_names:
-                            pizza_count[pizza_name] = pizza_count.get(pizza_name, 0) + 1
-                
-                # Arricchisci l'ordine con info cliente
-                if 'telefono_cliente' in order and order['telefono_cliente'] in client_info:
-                    client = client_info[order['telefono_cliente']]
-                    order['cliente'] = client.get('nome', order.get('nome_cliente', '-'))
-                else:
-                    order['cliente'] = order.get('nome_cliente', '-')
-                
-                # Formatta i campi per la dashboard
-                if 'data_ordine' not in order and 'data' in order:
-                    order['data_ordine'] = order['data']
-                
-                # Crea un campo prodotti se non esiste
-                if 'prodotti' not in order:
-                    prodotti = []
-                    # Aggiungi pizze
-                    if 'pizze' in order and order['pizze']:
-                        if isinstance(order['pizze'], list):
-                            for p in order['pizze']:
-                                if isinstance(p, dict) and 'nome' in p:
-                                    prodotti.append(p['nome'])
-                        elif isinstance(order['pizze'], str):
-                            prodotti.extend([p.strip() for p in order['pizze'].split(',') if p.strip()])
-                    
-                    # Aggiungi fritti se presenti
-                    if 'fritti' in order and order['fritti']:
-                        if isinstance(order['fritti'], list):
-                            for f in order['fritti']:
-                                if isinstance(f, dict) and 'nome' in f:
-                                    prodotti.append(f['nome'])
-                        elif isinstance(order['fritti'], str):
-                            prodotti.extend([f.strip() for f in order['fritti'].split(',') if f.strip()])
-                    
-                    # Aggiungi bevande se presenti
-                    if 'bevande' in order and order['bevande']:
-                        if isinstance(order['bevande'], list):
-                            for b in order['bevande']:
-                                if isinstance(b, dict) and 'nome' in b:
-                                    prodotti.append(b['nome'])
-                        elif isinstance(order['bevande'], str):
-                            prodotti.extend([b.strip() for b in order['bevande'].split(',') if b.strip()])
-                    
-                    order['prodotti'] = ', '.join(prodotti)
-                
-                # Aggiungi stato se non è presente
-                if 'stato' not in order:
-                    order['stato'] = 'Completato'  # Stato predefinito
-            
-            except Exception as process_error:
-                print(f"Errore nell'elaborazione della comanda {order.get('comanda_id', 'unknown')}: {str(process_error)}")
+        if isinstance(risultati_clienti, Exception):
+            print(f"Errore nel recupero dei clienti: {str(risultati_clienti)}")
+        else:
+            for client in risultati_clienti:
+                # Usa il telefono come chiave per abbinare clienti e comande
+                telefono = client.get('telefono')
+                if telefono:
+                    client_info[telefono] = client
+            print(f"Recuperati {len(client_info)} clienti")
         
-        # Calcola la media
-        avg_order = total_revenue / total_orders if total_orders > 0 else 0
+        # Calcola statistiche (gli importi sono sommati in centesimi)
+        total_orders = len(tabella)
+        total_revenue = tabella.totale_centesimi / 100
+        avg_order = tabella.scontrino_medio_centesimi() / 100
         
-        # Determina la pizza più venduta
-        top_pizza = "-"
-        if pizza_count:
-            top_pizza_items = sorted(pizza_count.items(), key=lambda x: x[1], reverse=True)
-            if top_pizza_items:
-                top_pizza = top_pizza_items[0][0]
+        pizze_vendute = tabella.prodotti_piu_venduti("pizze")
+        top_pizza = pizze_vendute[0][0] if pizze_vendute else "-"
         
         # Dati per i grafici
-        pizza_chart_data = [{"name": name, "value": count} for name, count in pizza_count.items()]
-        sales_chart_data = [{"date": date, "amount": amount} for date, amount in sales_by_date.items()]
+        pizza_chart_data = [{"name": name, "value": count} for name, count in pizze_vendute]
+        comande_per_ora, ricavi_per_ora = tabella.mappa_calore()
+        heatmap_data = {
+            "days": GIORNI_SETTIMANA,
+            "orders": comande_per_ora.tolist(),
+            "revenue": (ricavi_per_ora / 100).tolist()
+        }
         
-        # Ordini recenti
-        recent_orders = orders[:min(10, len(orders))]
+        # Ordini recenti: solo questi vengono arricchiti per la tabella
+        recent_orders = []
+        for posizione in tabella.piu_recenti(10):
+            order = dict(risultati_comande[posizione])
+            
+            # Arricchisci l'ordine con info cliente
+            if order.get('telefono_cliente') in client_info:
+                order['cliente'] = client_info[order['telefono_cliente']].get('nome', order.get('nome_cliente', '-'))
+            else:
+                order['cliente'] = order.get('nome_cliente', '-')
+            
+            # Formatta i campi per la dashboard
+            if 'data_ordine' not in order and 'data' in order:
+                order['data_ordine'] = order['data']
+            if 'prodotti' not in order:
+                order['prodotti'] = ', '.join(tabella.nomi_prodotti(posizione))
+            # Lo stato dipende dall'ora di consegna, non è salvato nella comanda
+            order['stato'] = stato_comanda(consegna_prevista(order), order.get('data'))
+            recent_orders.append(order)
         
         # Invece di usare HTTPException che può causare problemi di formato,
         # restituiamo sempre una risposta JSON valida
@@ -722,7 +1177,7 @@ async def get_dashboard_stats():
                 "top_pizza": top_pizza,
                 "recent_orders": recent_orders,
                 "pizza_chart_data": pizza_chart_data,
-                "sales_chart_data": sales_chart_data
+                "heatmap_data": heatmap_data
             }
         }
     
@@ -738,11 +1193,261 @@ async def get_dashboard_stats():
                 "avg_order": 0,
                 "top_pizza": "-",
                 "recent_orders": [],
-                "pizza_chart_data": [],
-                "sales_chart_data": []
+                "pizza_chart_data": []
             }
         }
 
+# Numero massimo di punti della serie delle vendite inviati al grafico
+PUNTI_GRAFICO_VENDITE = int(os.getenv("SALES_CHART_POINTS", "200"))
+
+# Endpoint per la serie temporale delle vendite
+@app.get("/api/dashboard/sales")
+async def get_sales_series(da: Optional[str] = None, a: Optional[str] = None,
+                           intervallo: str = "1d", punti: int = PUNTI_GRAFICO_VENDITE):
+    """
+    Ricavi e numero di ordini per intervallo (15m, 1h, 1d, 1w) nel periodo richiesto.
+    L'aggregazione avviene sul server e la serie viene ridotta con LTTB a
+    un numero fisso di punti, qualunque sia la lunghezza dello storico.
+    
+    Args:
+        da: Primo giorno del periodo ("AAAA-MM-GG"), dalla prima comanda se assente
+        a: Ultimo giorno del periodo (incluso), fino all'ultima comanda se assente
+        intervallo: Ampiezza di ogni punto
+        punti: Numero massimo di punti restituiti
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    if intervallo not in INTERVALLI_SERIE:
+        raise HTTPException(status_code=400, detail=f"Intervallo non valido, usa uno tra: {', '.join(INTERVALLI_SERIE)}")
+    try:
+        da_minuto = data_in_minuto(da) if da else None
+        a_minuto = data_in_minuto(a) + 24 * 60 if a else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date non valide, usa il formato AAAA-MM-GG")
+    punti = max(3, min(punti, PUNTI_GRAFICO_VENDITE))
+    
+    async def calcola():
+        # Pagine keyset: una select unica verrebbe troncata dal max-rows di PostgREST
+        comande = [
+            comanda
+            async for pagina in pagine_comande(ottieni_repository(), da, a, ("totale", "data", "ora"))
+            for comanda in pagina
+        ]
+        inizi, ricavi, ordini = serie_vendite(TabellaComande(comande), intervallo, da_minuto, a_minuto)
+        scelti = lttb(inizi, ricavi, punti)
+        return {
+            "success": True,
+            "data": {
+                "interval": intervallo,
+                "buckets": len(inizi),
+                "points": [
+                    {"date": minuto_in_data(inizi[i]), "amount": int(ricavi[i]) / 100, "orders": int(ordini[i])}
+                    for i in scelti
+                ]
+            }
+        }
+    
+    try:
+        return await cache_statistiche.ottieni(f"vendite:{da}:{a}:{intervallo}:{punti}", calcola)
+    except Exception as e:
+        print(f"Errore nel calcolo della serie delle vendite: {str(e)}")
+        return {"success": False, "error": str(e), "data": {"interval": intervallo, "buckets": 0, "points": []}}
+
+# Endpoint per le previsioni di consegna della serata
+@app.get("/api/dashboard/forecast")
+async def get_forecast():
+    """
+    Restituisce la domanda prevista e la capacità di ogni slot di consegna
+    (pubblicate con `python previsioni.py`) insieme al carico attuale del forno
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    
+    return {
+        "success": True,
+        "data": {
+            "previsioni": gestore_ordine.pianificatore.capacita_slot.previsioni(),
+            "forno": gestore_ordine.pianificatore.statistiche()
+        }
+    }
+
+# Endpoint per i giri di consegna della serata
+@app.get("/api/dashboard/deliveries")
+async def get_deliveries(data: Optional[str] = None):
+    """
+    Raggruppa le comande della serata in giri di consegna per slot e vicinanza
+    degli indirizzi, con l'ordine delle tappe di ogni rider
+    
+    Args:
+        data: Giorno delle comande ("AAAA-MM-GG"), oggi se assente
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    giorno = data or datetime.now().strftime('%Y-%m-%d')
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", giorno):
+        raise HTTPException(status_code=400, detail="Data non valida, usa il formato AAAA-MM-GG")
+    
+    async def calcola():
+        comande = await ottieni_repository().lista_comande_finestra(
+            giorno, giorno, colonne="comanda_id,nome_cliente,indirizzo_cliente,orario_consegna,data,ora"
+        )
+        giri = await run_in_threadpool(pianifica_giri, comande, geocoder_consegne)
+        return {"success": True, "data": {"giorno": giorno, **giri}}
+    
+    try:
+        return await cache_statistiche.ottieni(f"giri:{giorno}", calcola)
+    except Exception as e:
+        print(f"Errore nella pianificazione dei giri: {str(e)}")
+        return {"success": False, "error": str(e), "data": {"giorno": giorno, "giri": []}}
+
+# Endpoint per l'esportazione delle comande (per la contabilità)
+@app.get("/api/dashboard/export")
+async def export_orders(formato: str = "csv", da: Optional[str] = None, a: Optional[str] = None,
+                        colonne: Optional[str] = None, comprimi: bool = False):
+    """
+    Esporta le comande del periodo come file CSV o NDJSON, eventualmente
+    compresso in gzip. Le comande vengono lette a pagine (keyset) e inviate
+    man mano, quindi la memoria usata non dipende dalla durata del periodo.
+    
+    Args:
+        formato: "csv" oppure "ndjson"
+        da: Primo giorno ("AAAA-MM-GG"), dalla prima comanda se assente
+        a: Ultimo giorno (incluso), fino all'ultima comanda se assente
+        colonne: Colonne da esportare separate da virgola, tutte se assente
+        comprimi: Se True il file è compresso in gzip
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    if formato not in FORMATI:
+        raise HTTPException(status_code=400, detail=f"Formato non valido, usa uno tra: {', '.join(FORMATI)}")
+    if any(giorno and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", giorno) for giorno in (da, a)):
+        raise HTTPException(status_code=400, detail="Date non valide, usa il formato AAAA-MM-GG")
+    try:
+        scelte = scegli_colonne(colonne)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # La prima pagina viene letta subito: se Supabase non risponde l'errore arriva prima del file
+    pagine = pagine_comande(ottieni_repository(), da, a, scelte)
+    try:
+        prima_pagina = await anext(pagine, None)
+    except Exception as e:
+        print(f"Errore nell'esportazione delle comande: {str(e)}")
+        await pagine.aclose()
+        return JSONResponse(status_code=503, content={"success": False, "error": str(e)})
+    
+    async def tutte_le_pagine():
+        try:
+            if prima_pagina is not None:
+                yield prima_pagina
+                async for pagina in pagine:
+                    yield pagina
+        finally:
+            await pagine.aclose()
+    
+    nome_file = f"comande_{da or 'inizio'}_{a or 'oggi'}.{formato}" + (".gz" if comprimi else "")
+    return StreamingResponse(
+        esporta_comande(tutte_le_pagine(), formato, scelte, comprimi),
+        media_type="application/gzip" if comprimi else FORMATI[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome_file}"'}
+    )
+
+# Risultati massimi per pagina della ricerca delle comande
+MASSIMO_RISULTATI_RICERCA = 100
+
+# Massimo di comande per pagina nelle liste della dashboard
+MASSIMO_COMANDE_PAGINA = 200
+
+# Endpoint per le liste filtrate di comande (cucina e sala)
+@app.get("/api/dashboard/orders")
+async def list_orders(filtro: str = "tutte", colonne: Optional[str] = None, limite: int = 50,
+                      cursore: Optional[str] = None):
+    """
+    Restituisce una pagina di comande filtrate, dalla più recente. Il filtro
+    è applicato da Supabase e vengono lette solo le colonne richieste.
+    
+    Args:
+        filtro: 'tutte', 'oggi', 'in_corso', 'completate' o 'future'
+        colonne: Colonne da restituire separate da virgola (predefinite se assente)
+        limite: Comande per pagina
+        cursore: Valore "cursore" della risposta precedente, per la pagina successiva
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    limite = max(1, min(limite, MASSIMO_COMANDE_PAGINA))
+    scelte = [colonna.strip() for colonna in colonne.split(",") if colonna.strip()] if colonne else None
+    
+    try:
+        pagina = await ottieni_comande_dashboard(filtro, scelte, limite, cursore)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Errore nel recupero delle comande ({filtro}): {str(e)}")
+        return JSONResponse(status_code=503, content={"success": False, "error": str(e)})
+    return {"success": True, "data": {"filtro": filtro, "limite": limite, **pagina}}
+
+# Endpoint per la ricerca delle comande
+@app.get("/api/dashboard/orders/search")
+async def search_orders(q: str, limite: int = 20, offset: int = 0,
+                        da: Optional[str] = None, a: Optional[str] = None):
+    """
+    Cerca le comande per ID, nome, telefono, indirizzo, prodotti, data o
+    giorno della settimana (es. "rossi martedi", "suppl"), dalla più recente.
+    Usa l'indice in memoria: nessuna query a Supabase.
+    
+    Args:
+        q: Parole da cercare, anche solo l'inizio; devono comparire tutte
+        limite: Risultati per pagina
+        offset: Risultati da saltare
+        da: Primo giorno ("AAAA-MM-GG")
+        a: Ultimo giorno (incluso)
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    if any(giorno and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", giorno) for giorno in (da, a)):
+        raise HTTPException(status_code=400, detail="Date non valide, usa il formato AAAA-MM-GG")
+    limite = max(1, min(limite, MASSIMO_RISULTATI_RICERCA))
+    offset = max(0, offset)
+    
+    risultato = indice_comande.cerca(q, limite, offset, da, a)
+    return {
+        "success": True,
+        "data": {
+            "query": q,
+            "offset": offset,
+            "limite": limite,
+            "indice_completo": indice_comande.pronto,
+            **risultato
+        }
+    }
+
+# Endpoint per il dettaglio di una comanda (usato dalla dashboard)
+@app.get("/api/order/{comanda_id}")
+async def get_order(comanda_id: str):
+    """
+    Restituisce i dati della comanda con le versioni HTML e testo per la stampa
+    """
+    if not stato_avvio["pronto"]:
+        raise HTTPException(status_code=503, detail="Servizio in avvio")
+    
+    try:
+        dettaglio = await ottieni_dettaglio_comanda_dashboard(comanda_id)
+    except Exception as e:
+        print(f"Errore nel recupero della comanda {comanda_id}: {str(e)}")
+        return {"success": False, "error": str(e)}
+    
+    if "errore" in dettaglio:
+        raise HTTPException(status_code=404, detail=dettaglio["errore"])
+    return {"success": True, "data": dettaglio}
+
+# Endpoint per le statistiche della cache delle risposte di fallback
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """
+    Restituisce hit, miss e occupazione della cache delle risposte di fallback
+    """
+    return {"success": True, "data": cache_risposte.statistiche()}
+
 # Funzione per aprire il browser
 def open_browser():
     webbrowser.open("http://localhost:5000")
@@ -754,9 +1459,10 @@ if __name__ == "__main__":
     print("  Apertura automatica del browser...")
     print("=" * 60)
     
-    # Apri automaticamente il browser dopo un breve ritardo
-    import threading
-    threading.Timer(1.5, open_browser).start()
+    # Apri automaticamente il browser dopo un breve ritardo (disattivabile con OPEN_BROWSER=0)
+    if os.getenv("OPEN_BROWSER", "1") != "0":
+        import threading
+        threading.Timer(1.5, open_browser).start()
     
     # Avvia il server FastAPI con uvicorn
     # Rimuovi l'opzione reload per evitare l'avviso
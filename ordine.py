@@ -1,10 +1,125 @@
 import re
 from datetime import datetime, timedelta
-from collections import Counter
 
+# Carrello a righe con totale in centesimi
+from carrello import Carrello, in_centesimi, formatta_euro
+# Cronologia a capacità fissa per le risposte del cliente
+from cronologia import CronologiaCircolare
+# Ammissione negli slot di consegna in base alla capacità del forno
+from forno import PianificatoreForno
+# Clienti abituali indicizzati per telefono
+from clienti import RubricaClienti, stesso_indirizzo
+# Classificatore locale degli intenti (conferme, rifiuti, domande fuori dal flusso)
+from intenti import ClassificatoreIntenti, INTENTI_DOMANDA
+from ricerca_menu import normalizza
 # Importazioni da profilo.py
 from profilo import crea_comanda_txt, aggiorna_profilo_cliente, aggiorna_file_clienti
 
+# Confidenza richiesta per riconoscere un sì o un no dal classificatore, sull'intero
+# messaggio o sulla sola prima frase (es. "sì è giusto, alle 20:30"): sotto questa
+# soglia nomi come "Giusto Bianchi" passerebbero per conferme
+CONFIDENZA_PARZIALE = 0.9
+
+# Prima parola che da sola decide tra sì e no, qualunque cosa segua (es. "sì, va bene così")
+PAROLE_SI_NO = {"si": "si", "sisi": "si", "ok": "si", "okay": "si", "no": "no", "nono": "no"}
+
+# Domanda del passo corrente, riproposta dopo una risposta fuori dal flusso dell'ordine
+DOMANDE_STATO = {
+    "raccolta_pizze": "Che pizza desidera ordinare?",
+    "raccolta_fritti": "Vuole anche dei fritti?",
+    "raccolta_bevande": "Vuole anche delle bibite?",
+    "offerta_riordino": "Vuole ripetere il suo ultimo ordine?",
+    "conferma_ordine": "L'ordine è corretto?",
+    "raccolta_telefono": "Mi lascia il suo numero di telefono?",
+    "verifica_indirizzo": "Qual è l'indirizzo di consegna del suo ultimo ordine?",
+    "raccolta_nome": "Come si chiama?",
+    "raccolta_indirizzo": "Qual è l'indirizzo di consegna?",
+    "raccolta_pagamento": "Preferisce pagare in contanti o con carta alla consegna?",
+    "raccolta_orario": "A che ora preferisce la consegna?",
+    "conferma_finale": "Conferma l'ordine?"
+}
+
+# Risposta quando il forno non riesce a cuocere l'ordine in nessuno slot della serata
+MESSAGGIO_NESSUN_ORARIO = ("Mi dispiace, per questa sera non riusciamo a cuocere l'ordine in tempo per nessun orario di consegna. "
+                           "Può ridurre l'ordine o contattare direttamente la pizzeria.")
+
+# Numero di telefono (anche come primo messaggio, per riconoscere un cliente abituale)
+PATTERN_TELEFONO = re.compile(r'\+?\d[\d\s-]{7,}')
+
+# Invito ai clienti abituali, aggiunto al messaggio di benvenuto
+INVITO_CLIENTE_ABITUALE = "Se ha già ordinato da noi, mi scriva il suo numero di telefono: posso ripetere il suo ultimo ordine."
+
+# Alias comuni dei prodotti, usati oltre all'indice del menu
+ALIAS_PIZZE = {
+    "margherit": "Margherita",
+    "diavol": "Diavola",
+    "4 stagioni": "Quattro Stagioni",
+    "quattro stagioni": "Quattro Stagioni",
+    "marinara": "Marinara",
+    "napoli": "Napoletana",
+    "capricciosa": "Capricciosa"
+}
+
+ALIAS_FRITTI = {
+    "patatine": "Patatine",
+    "crocchette": "Crocchette",
+    "suppl": "Supplì",
+    "arancin": "Arancini"
+}
+
+ALIAS_BEVANDE = {
+    "acqua": "Acqua",
+    "coca cola": "Coca Cola",
+    "coca-cola": "Coca Cola", 
+    "coca": "Coca Cola",
+    "coche": "Coca Cola",
+    "pepsi": "Pepsi",
+    "fanta": "Fanta",
+    "sprite": "Sprite",
+    "birra": "Birra",
+    "birre": "Birra",
+    "vino": "Vino"
+}
+
+ALIAS_PRODOTTI = {**ALIAS_PIZZE, **ALIAS_FRITTI, **ALIAS_BEVANDE}
+
+# Sezioni del menu per ciascuna fase dell'ordine
+CATEGORIE_PIZZE = ["Pizze Classiche", "Pizze Speciali", "Pizze Bianche"]
+CATEGORIE_FRITTI = ["Fritti", "Antipasti"]
+CATEGORIE_BEVANDE = ["Bevande", "Bibite"]
+
+# Fasi di raccolta dei prodotti, nell'ordine in cui vengono proposte:
+# (chiave nell'ordine, stato, alias, sezioni del menu)
+FASI_RACCOLTA = [
+    ("pizze", "raccolta_pizze", ALIAS_PIZZE, CATEGORIE_PIZZE),
+    ("fritti", "raccolta_fritti", ALIAS_FRITTI, CATEGORIE_FRITTI),
+    ("bevande", "raccolta_bevande", ALIAS_BEVANDE, CATEGORIE_BEVANDE)
+]
+
+STATI_RACCOLTA = {stato for _, stato, _, _ in FASI_RACCOLTA}
+
+# Risposte quando nel messaggio non si riconosce nessun prodotto
+NON_CAPITO_RACCOLTA = {
+    "pizze": "Mi scusi, non ho capito quali pizze desidera. Può ripetere per favore?",
+    "fritti": "Mi scusi, non ho capito quali fritti desidera. Può ripetere per favore? Se non desidera fritti, può dirmi 'no grazie'.",
+    "bevande": "Mi scusi, non ho capito quali bibite desidera. Può ripetere per favore? Se non desidera bibite, può dirmi 'no grazie'."
+}
+
+# Risposte del cliente conservate per ogni ordine
+MASSIMO_RISPOSTE_CLIENTE = 50
+
+# Quantità scritte in lettere
+NUMERI_IN_LETTERE = {
+    "un": 1, "uno": 1, "una": 1, "due": 2, "tre": 3, "quattro": 4, "cinque": 5,
+    "sei": 6, "sette": 7, "otto": 8, "nove": 9, "dieci": 10, "undici": 11, "dodici": 12
+}
+
+# Quantità (in cifre o in lettere) seguita al più da una parola prima del prodotto,
+# es. "2 margherite", "due pizze diavola", "una porzione di patatine"
+PATTERN_QUANTITA = re.compile(
+    r"\b(\d+|" + "|".join(NUMERI_IN_LETTERE) + r")\s+(?:\w+\s+(?:di\s+)?)?$"
+)
+
 class GestoreOrdine:
     """
     Classe per gestire la raccolta e l'elaborazione dei dati degli ordini
@@ -24,59 +139,63 @@ class GestoreOrdine:
         cls._contatore_id_comanda += 1
         return f"{cls._contatore_id_comanda:06d}"
     
-    def __init__(self, menu_index):
+    def __init__(self, menu_index, salva_ordine=None, pianificatore=None, rubrica=None, classificatore=None):
         """
         Inizializza un nuovo gestore ordini
         
         Args:
             menu_index: L'istanza MenuIndex per accedere alle informazioni sui prodotti
+            salva_ordine: Funzione opzionale (user_id, ordine) che salva l'ordine confermato;
+                          se assente l'ordine viene salvato in modo sincrono con profilo.py
+            pianificatore: PianificatoreForno che decide gli slot di consegna in base
+                           alle pizze dell'ordine e alla capacità del forno
+            rubrica: RubricaClienti con i clienti abituali, riconosciuti dal telefono
+            classificatore: ClassificatoreIntenti per conferme, rifiuti e domande fuori
+                            dal flusso; se assente viene costruito dalle frasi di esempio
         """
         self.menu_index = menu_index
+        self.salva_ordine = salva_ordine or self._salva_ordine_sincrono
+        self.pianificatore = pianificatore or PianificatoreForno()
+        self.rubrica = rubrica if rubrica is not None else RubricaClienti()
+        self.classificatore = classificatore or ClassificatoreIntenti.da_menu(menu_index.menu_data)
         self.ordini_attivi = {}  # user_id -> ordine
-        self.orari_prenotati = {}  # slot_orario -> conteggio prenotazioni
-        
-        # Inizializzazione degli orari prenotati
-        # In una versione più completa, potrebbe recuperare questi dati da Supabase
-        self._inizializza_orari_prenotati()
     
-    def _inizializza_orari_prenotati(self):
+    @staticmethod
+    def _salva_ordine_sincrono(user_id, ordine):
         """
-        Inizializza il dizionario degli orari prenotati
-        In una implementazione completa, potrebbe recuperare questi dati da Supabase
+        Salva la comanda e il profilo del cliente tramite le funzioni di profilo.py
+        
+        Args:
+            user_id: ID utente
+            ordine: Ordine confermato
         """
-        self.orari_prenotati = {}
+        crea_comanda_txt(user_id, ordine)
+        aggiorna_profilo_cliente(user_id, ordine["cliente"])
+        aggiorna_file_clienti(ordine["cliente"])
+    
+    @staticmethod
+    def _numero_pizze(ordine):
+        """Numero di pizze dell'ordine (le unità che occupano il forno)"""
+        return sum(riga.quantita for riga in ordine["carrello"].righe("pizze"))
     
-    def _genera_orari_disponibili(self):
+    def _genera_orari_disponibili(self, ordine):
         """
-        Genera una lista di orari disponibili per la consegna
+        Genera la lista degli orari di consegna in cui le pizze dell'ordine
+        possono essere cotte in tempo
+        
+        Args:
+            ordine: Ordine in corso
         
         Returns:
             Lista di stringhe con gli orari disponibili
         """
-        orari_disponibili = []
-        
-        # Inizia dalle 19:00 come richiesto
-        ora_inizio = datetime.now().replace(hour=19, minute=0, second=0, microsecond=0)
-        
-        # Genera slot di 15 minuti fino alle 23:00 (ultimo orario di consegna)
-        ora_corrente = ora_inizio
-        ora_fine = ora_inizio.replace(hour=23, minute=0)
-        
-        while ora_corrente <= ora_fine:
-            # Formatta l'orario come stringa (es. "19:00")
-            slot_orario = f"{ora_corrente.hour:02d}:{ora_corrente.minute:02d}"
-            
-            # Controlla quanti ordini sono già prenotati per questo slot
-            conteggio = self.orari_prenotati.get(slot_orario, 0)
-            
-            # Se ci sono meno di 2 prenotazioni, lo slot è disponibile
-            if conteggio < 2:
-                orari_disponibili.append(slot_orario)
-            
-            # Passa al prossimo slot di 15 minuti
-            ora_corrente += timedelta(minutes=15)
-        
-        return orari_disponibili
+        return self.pianificatore.orari_disponibili(self._numero_pizze(ordine))
+    
+    @staticmethod
+    def _formatta_orari(orari):
+        """Elenca gli orari andando a capo ogni 5"""
+        blocchi = [", ".join(orari[i:i + 5]) for i in range(0, len(orari), 5)]
+        return ",\n".join(blocchi)
     
     def _genera_menu_pizze(self):
         """
@@ -87,11 +206,8 @@ class GestoreOrdine:
         """
         menu_text = "🍕 MENU PIZZE 🍕\n"
         
-        # Categorie di pizze da cercare nel menu
-        categorie_pizze = ["Pizze Classiche", "Pizze Speciali", "Pizze Bianche"]
-        
         for section_title, items in self.menu_index.menu_data.items():
-            if any(categoria in section_title for categoria in categorie_pizze):
+            if any(categoria in section_title for categoria in CATEGORIE_PIZZE):
                 menu_text += f"\n{section_title}:\n"
                 for item_name, details in items.items():
                     menu_text += f"- {item_name}: €{details['price']:.2f}\n"
@@ -107,11 +223,8 @@ class GestoreOrdine:
         """
         menu_text = "🍟 MENU FRITTI 🍟\n"
         
-        # Categorie di fritti da cercare nel menu
-        categorie_fritti = ["Fritti", "Antipasti"]
-        
         for section_title, items in self.menu_index.menu_data.items():
-            if any(categoria in section_title for categoria in categorie_fritti):
+            if any(categoria in section_title for categoria in CATEGORIE_FRITTI):
                 menu_text += f"\n{section_title}:\n"
                 for item_name, details in items.items():
                     menu_text += f"- {item_name}: €{details['price']:.2f}\n"
@@ -127,91 +240,33 @@ class GestoreOrdine:
         """
         menu_text = "🥤 MENU BEVANDE 🥤\n"
         
-        # Categorie di bevande da cercare nel menu
-        categorie_bevande = ["Bevande", "Bibite"]
-        
         for section_title, items in self.menu_index.menu_data.items():
-            if any(categoria in section_title for categoria in categorie_bevande):
+            if any(categoria in section_title for categoria in CATEGORIE_BEVANDE):
                 menu_text += f"\n{section_title}:\n"
                 for item_name, details in items.items():
                     menu_text += f"- {item_name}: €{details['price']:.2f}\n"
         
         return menu_text
     
-    def _calcola_totale_ordine(self, ordine):
+    def _prodotti_menu(self):
+        """Prodotti del menu corrente: nome -> dettagli"""
+        prodotti = getattr(self.menu_index, "prodotti", None)
+        if prodotti is None:
+            prodotti = {nome: details for items in self.menu_index.menu_data.values() for nome, details in items.items()}
+        return prodotti
+    
+    def _prezzo_centesimi(self, nome_prodotto):
         """
-        Calcola il prezzo totale dell'ordine
+        Prezzo unitario di un prodotto del menu in centesimi
         
         Args:
-            ordine: Dizionario dell'ordine
+            nome_prodotto: Nome del prodotto
             
         Returns:
-            Prezzo totale dell'ordine
-        """
-        totale = 0.0
-        
-        # Calcola prezzo per le pizze
-        for pizza in ordine["pizze"]:
-            nome_pizza = pizza["nome"]
-            # Cerca il prezzo della pizza nel menu
-            for section, items in self.menu_index.menu_data.items():
-                if nome_pizza in items:
-                    totale += items[nome_pizza]["price"]
-                    break
-        
-        # Calcola prezzo per i fritti
-        for fritto in ordine["fritti"]:
-            nome_fritto = fritto["nome"]
-            # Cerca il prezzo del fritto nel menu
-            for section, items in self.menu_index.menu_data.items():
-                if nome_fritto in items:
-                    totale += items[nome_fritto]["price"]
-                    break
-        
-        # Calcola prezzo per le bevande
-        for bevanda in ordine["bevande"]:
-            nome_bevanda = bevanda["nome"]
-            # Cerca il prezzo della bevanda nel menu
-            for section, items in self.menu_index.menu_data.items():
-                if nome_bevanda in items:
-                    totale += items[nome_bevanda]["price"]
-                    break
-        
-        return totale
-    
-    def _aggiungi_prezzi_prodotti(self, ordine):
-        """
-        Aggiunge i prezzi ai singoli prodotti nell'ordine
-        
-        Args:
-            ordine: Dizionario dell'ordine
+            Il prezzo in centesimi, 0 se il prodotto non è nel menu
         """
-        # Aggiungi prezzi alle pizze
-        for pizza in ordine["pizze"]:
-            nome_pizza = pizza["nome"]
-            # Cerca il prezzo della pizza nel menu
-            for section, items in self.menu_index.menu_data.items():
-                if nome_pizza in items:
-                    pizza["prezzo"] = items[nome_pizza]["price"]
-                    break
-        
-        # Aggiungi prezzi ai fritti
-        for fritto in ordine["fritti"]:
-            nome_fritto = fritto["nome"]
-            # Cerca il prezzo del fritto nel menu
-            for section, items in self.menu_index.menu_data.items():
-                if nome_fritto in items:
-                    fritto["prezzo"] = items[nome_fritto]["price"]
-                    break
-        
-        # Aggiungi prezzi alle bevande
-        for bevanda in ordine["bevande"]:
-            nome_bevanda = bevanda["nome"]
-            # Cerca il prezzo della bevanda nel menu
-            for section, items in self.menu_index.menu_data.items():
-                if nome_bevanda in items:
-                    bevanda["prezzo"] = items[nome_bevanda]["price"]
-                    break
+        details = self._prodotti_menu().get(nome_prodotto)
+        return in_centesimi(details.get("price")) if details else 0
     
     def _aggiorna_stato_ordine(self, user_id: str) -> None:
         """
@@ -229,6 +284,81 @@ class GestoreOrdine:
         # Solo per debug
         print(f"Ordine {ordine['comanda_id']} aggiornato - Stato: {ordine['stato']}")
     
+    def _risposta_si_no(self, messaggio):
+        """
+        Riconosce una conferma o un rifiuto, anche quando seguono altre
+        informazioni (es. "sì, alle 20:30"). Un sì o un no esplicito in testa
+        al messaggio vince sul resto ("sì, va bene così" è una conferma);
+        altrimenti decide il classificatore degli intenti, con confidenza alta
+        
+        Args:
+            messaggio: Testo del messaggio utente
+            
+        Returns:
+            "si", "no" oppure None
+        """
+        parole = re.findall(r"\w+", normalizza(messaggio))
+        if parole and parole[0] in PAROLE_SI_NO:
+            return PAROLE_SI_NO[parole[0]]
+        prima_frase = re.split(r"[,.;:!?]", messaggio.strip(), maxsplit=1)[0]
+        for parte in (messaggio, prima_frase):
+            intento, confidenza = self.classificatore.classifica(parte)
+            if intento in ("si", "no") and confidenza >= CONFIDENZA_PARZIALE:
+                return intento
+        return None
+    
+    def _fine_raccolta(self, messaggio):
+        """
+        Riconosce un "ho finito" (es. "va bene così", "basta così"), valido
+        solo durante la raccolta dei prodotti
+        
+        Args:
+            messaggio: Testo del messaggio utente
+            
+        Returns:
+            True se il cliente non vuole aggiungere altro
+        """
+        prima_frase = re.split(r"[,.;:!?]", messaggio.strip(), maxsplit=1)[0]
+        return any(
+            self.classificatore.classifica(parte)[0] == "fine"
+            for parte in (messaggio, prima_frase)
+        )
+    
+    def _fuori_flusso(self, messaggio, testo_libero=False):
+        """
+        Determina se un messaggio che il passo corrente non ha riconosciuto va
+        gestito fuori dal flusso dell'ordine (risposta locale o LLM)
+        
+        Args:
+            messaggio: Testo del messaggio utente
+            testo_libero: True per i passi che accettano qualsiasi testo (nome, indirizzo):
+                          solo le domande riconosciute escono dal flusso
+            
+        Returns:
+            True per le domande (menu, prezzi, ingredienti, consegna, saluti) e, salvo
+            nei passi a testo libero, per i messaggi senza intento riconosciuto che non
+            contengono numeri (quantità, telefono, orario) e non sono un ordine
+        """
+        intento, _ = self.classificatore.classifica(messaggio)
+        if testo_libero:
+            return intento in INTENTI_DOMANDA and intento != "saluto"
+        if intento in INTENTI_DOMANDA:
+            return True
+        return intento is None and not re.search(r"\d", messaggio)
+    
+    def domanda_corrente(self, user_id: str):
+        """
+        Domanda del passo in cui si trova l'ordine dell'utente
+        
+        Args:
+            user_id: ID utente
+            
+        Returns:
+            La domanda, oppure None se non c'è un ordine attivo
+        """
+        ordine = self.ordini_attivi.get(user_id)
+        return DOMANDE_STATO.get(ordine["stato"]) if ordine else None
+    
     def inizia_nuovo_ordine(self, user_id: str) -> str:
         """
         Inizializza un nuovo ordine per un utente
@@ -239,10 +369,10 @@ class GestoreOrdine:
         Returns:
             Messaggio di benvenuto per l'ordine con il menu delle pizze
         """
+        # Un ordine precedente non confermato libera l'orario riservato
+        self.pianificatore.rilascia(user_id)
         self.ordini_attivi[user_id] = {
-            "pizze": [],
-            "fritti": [],
-            "bevande": [],
+            "carrello": Carrello(),  # Righe dell'ordine con totale aggiornato
             "cliente": {
                 "nome": None,
                 "indirizzo": None,
@@ -250,8 +380,11 @@ class GestoreOrdine:
             },
             "pagamento": None,
             "orario_consegna": None,  # Nuovo campo per l'orario di consegna
-            "risposte_cliente": [],
+            "risposte_cliente": CronologiaCircolare(MASSIMO_RISPOSTE_CLIENTE),
             "stato": "raccolta_pizze",  # Stato iniziale: raccolta delle pizze
+            "fasi_completate": [],  # Fasi di raccolta già soddisfatte ("pizze", "fritti", "bevande")
+            "cliente_da_verificare": None,  # Cliente in rubrica con il telefono scritto, non ancora verificato
+            "cliente_abituale": None,  # Dati dell'ultimo ordine, dopo la verifica dell'indirizzo
             "comanda_id": None  # ID numerico progressivo della comanda
         }
         
@@ -259,135 +392,122 @@ class GestoreOrdine:
         menu_pizze = self._genera_menu_pizze()
         
         # Salva la risposta del cliente (vuota per iniziare)
-        self.ordini_attivi[user_id]["risposte_cliente"].append({
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "messaggio": "INIZIO ORDINE"
-        })
+        self.ordini_attivi[user_id]["risposte_cliente"].aggiungi("system", "INIZIO ORDINE")
         
         # Messaggio di benvenuto con menu
-        return f"Buonasera, pizzeria da Mario! Che pizza desidera ordinare?\n\n{menu_pizze}"
+        return f"Buonasera, pizzeria da Mario! Che pizza desidera ordinare? {INVITO_CLIENTE_ABITUALE}\n\n{menu_pizze}"
     
-    def _estrai_pizze(self, messaggio):
+    def _sezioni_menu(self, categorie):
         """
-        Estrae le pizze menzionate nel messaggio del cliente
+        Restituisce le sezioni del menu che appartengono alle categorie indicate
         
         Args:
-            messaggio: Testo del messaggio utente
+            categorie: Lista di nomi di categoria (es. CATEGORIE_PIZZE)
             
         Returns:
-            Lista di tuple (nome_pizza, quantità)
-        """
-        # Questa è una versione semplificata per l'estrazione delle pizze
-        
-        pizze_comuni = {
-            "margherit": "Margherita",
-            "diavol": "Diavola",
-            "4 stagioni": "Quattro Stagioni",
-            "quattro stagioni": "Quattro Stagioni",
-            "marinara": "Marinara",
-            "napoli": "Napoletana",
-            "capricciosa": "Capricciosa"
-        }
-        
-        pizze_trovate = []
-        messaggio_lower = messaggio.lower()
-        
-        # Cerca le pizze nel messaggio
-        for keyword, nome_pizza in pizze_comuni.items():
-            if keyword in messaggio_lower:
-                # Cerca quantità (es. "2 margherite")
-                match = re.search(r'(\d+)\s+\w*' + re.escape(keyword), messaggio_lower)
-                quantita = int(match.group(1)) if match else 1
-                
-                pizze_trovate.append((nome_pizza, quantita))
+            Lista dei titoli delle sezioni del menu corrispondenti
+        """
+        return [
+            section_title for section_title in self.menu_index.menu_data
+            if any(categoria in section_title for categoria in categorie)
+        ]
+    
+    @staticmethod
+    def _quantita_prima(testo):
+        """
+        Legge la quantità scritta subito prima di un prodotto
         
-        return pizze_trovate
+        Args:
+            testo: Testo del messaggio (minuscolo) che precede il prodotto
+            
+        Returns:
+            La quantità, 1 se non indicata
+        """
+        match = PATTERN_QUANTITA.search(testo)
+        if not match:
+            return 1
+        valore = match.group(1)
+        return int(valore) if valore.isdigit() else NUMERI_IN_LETTERE[valore]
     
-    def _estrai_fritti(self, messaggio):
+    def _menzioni_prodotti(self, messaggio):
         """
-        Estrae i fritti menzionati nel messaggio del cliente
+        Trova i prodotti menzionati nel messaggio, di qualsiasi categoria
         
         Args:
             messaggio: Testo del messaggio utente
             
         Returns:
-            Lista di tuple (nome_fritto, quantità)
+            Lista di tuple (inizio, fine, chiave fase, nome) nell'ordine del messaggio,
+            un prodotto per menzione
         """
-        # Versione semplificata per l'estrazione dei fritti
-        
-        fritti_comuni = {
-            "patatine": "Patatine",
-            "crocchette": "Crocchette",
-            "suppl": "Supplì",
-            "arancin": "Arancini"
-        }
-        
-        fritti_trovati = []
         messaggio_lower = messaggio.lower()
+        menzioni = []
         
-        # Cerca i fritti nel messaggio
-        for keyword, nome_fritto in fritti_comuni.items():
-            if keyword in messaggio_lower:
-                # Cerca quantità (es. "2 porzioni di patatine")
-                match = re.search(r'(\d+)\s+\w*' + re.escape(keyword), messaggio_lower)
-                quantita = int(match.group(1)) if match else 1
-                
-                fritti_trovati.append((nome_fritto, quantita))
+        def sovrapposta(inizio, fine):
+            return any(inizio < fine_coperta and inizio_coperto < fine for inizio_coperto, fine_coperta, _, _ in menzioni)
         
-        return fritti_trovati
+        # Cerca gli alias nel messaggio, dai più lunghi (es. "coca cola" prima di "coca")
+        alias = [(keyword, nome, chiave) for chiave, _, alias_fase, _ in FASI_RACCOLTA for keyword, nome in alias_fase.items()]
+        for keyword, nome, chiave in sorted(alias, key=lambda voce: len(voce[0]), reverse=True):
+            posizione = messaggio_lower.find(keyword)
+            if posizione < 0 or sovrapposta(posizione, posizione + len(keyword)):
+                continue
+            menzioni.append((posizione, posizione + len(keyword), chiave, nome))
+        
+        # Completa con la ricerca tollerante agli errori di battitura (es. "margarita", "diavolla")
+        indice = getattr(self.menu_index, "indice_prodotti", None)
+        if indice is not None:
+            fase_per_sezione = {
+                sezione: chiave
+                for chiave, _, _, categorie in FASI_RACCOLTA
+                for sezione in self._sezioni_menu(categorie)
+            }
+            for corrispondenza in indice.trova_nel_testo(messaggio, fase_per_sezione):
+                # Salta le menzioni già riconosciute dagli alias
+                if sovrapposta(corrispondenza.inizio, corrispondenza.fine):
+                    continue
+                menzioni.append((corrispondenza.inizio, corrispondenza.fine,
+                                 fase_per_sezione[corrispondenza.categoria], corrispondenza.nome))
+        
+        return sorted(menzioni)
     
-    def _estrai_bevande(self, messaggio):
+    def _estrai_prodotti(self, messaggio, menzioni=None):
         """
-        Estrae le bevande menzionate nel messaggio del cliente
+        Estrae in un solo passaggio tutti i prodotti menzionati nel messaggio,
+        di qualsiasi categoria (es. "2 margherite, una patatine e 3 coche")
         
         Args:
             messaggio: Testo del messaggio utente
+            menzioni: Risultato di _menzioni_prodotti, se già calcolato
             
         Returns:
-            Lista di tuple (nome_bevanda, quantità)
-        """
-        # Versione semplificata per l'estrazione delle bevande
-        
-        bevande_comuni = {
-            "acqua": "Acqua",
-            "coca cola": "Coca Cola",
-            "coca-cola": "Coca Cola", 
-            "coca": "Coca Cola",
-            "pepsi": "Pepsi",
-            "fanta": "Fanta",
-            "sprite": "Sprite",
-            "birra": "Birra",
-            "vino": "Vino"
-        }
-        
-        bevande_trovate = []
+            Dizionario chiave fase ("pizze", "fritti", "bevande") -> lista di tuple (nome, quantità)
+        """
         messaggio_lower = messaggio.lower()
+        trovati = {chiave: [] for chiave, _, _, _ in FASI_RACCOLTA}
+        for inizio, _, chiave, nome in self._menzioni_prodotti(messaggio) if menzioni is None else menzioni:
+            if not any(nome == trovato for trovato, _ in trovati[chiave]):
+                trovati[chiave].append((nome, self._quantita_prima(messaggio_lower[:inizio])))
+        return trovati
+    
+    def _domanda_sui_prodotti(self, messaggio, menzioni):
+        """
+        Riconosce una domanda su prezzi o ingredienti che nomina dei prodotti
+        (es. "quanto costa la capricciosa?"): il classificatore valuta il
+        messaggio senza i nomi dei prodotti, che da soli lo sbilancerebbero
         
-        # Cerca prima le combinazioni di parole come "coca cola"
-        for keyword in ["coca cola", "coca-cola"]:
-            if keyword in messaggio_lower:
-                match = re.search(r'(\d+)\s+\w*' + re.escape(keyword), messaggio_lower)
-                quantita = int(match.group(1)) if match else 1
-                bevande_trovate.append((bevande_comuni[keyword], quantita))
-                # Rimuovi la keyword dal messaggio per evitare duplicati
-                messaggio_lower = messaggio_lower.replace(keyword, "")
-        
-        # Cerca le bevande singole nel messaggio
-        for keyword, nome_bevanda in bevande_comuni.items():
-            # Salta le combinazioni già controllate
-            if keyword in ["coca cola", "coca-cola"]:
-                continue
-                
-            if keyword in messaggio_lower:
-                # Cerca quantità (es. "2 birre")
-                match = re.search(r'(\d+)\s+\w*' + re.escape(keyword), messaggio_lower)
-                quantita = int(match.group(1)) if match else 1
-                
-                # Evita duplicati (es. se abbiamo già trovato "coca cola", non aggiungere "coca")
-                if not any(nome_bevanda == bevanda[0] for bevanda in bevande_trovate):
-                    bevande_trovate.append((nome_bevanda, quantita))
-        
-        return bevande_trovate
+        Args:
+            messaggio: Testo del messaggio utente
+            menzioni: Risultato di _menzioni_prodotti
+            
+        Returns:
+            True se il messaggio è una domanda e non un ordine
+        """
+        resto = messaggio
+        for inizio, fine, _, _ in reversed(menzioni):
+            resto = resto[:inizio] + " " + resto[fine:]
+        intento, _ = self.classificatore.classifica(resto)
+        return intento in ("prezzo", "ingredienti")
     
     def _estrai_orario(self, messaggio):
         """
@@ -414,6 +534,290 @@ class GestoreOrdine:
         
         return None
     
+    def _domanda_fase(self, ordine):
+        """
+        Domanda da porre al cliente per lo stato corrente dell'ordine
+        
+        Args:
+            ordine: Dizionario dell'ordine
+            
+        Returns:
+            La domanda, con il menu della categoria da scegliere
+        """
+        if ordine["stato"] == "raccolta_pizze":
+            return f"Che pizza desidera ordinare?\n\n{self._genera_menu_pizze()}"
+        if ordine["stato"] == "raccolta_fritti":
+            return f"Vuole anche dei fritti?\n\n{self._genera_menu_fritti()}"
+        if ordine["stato"] == "raccolta_bevande":
+            return f"Vuole anche delle bibite?\n\n{self._genera_menu_bevande()}"
+        return f"L'ordine è: {self._genera_riepilogo_ordine(ordine)} È corretto?"
+    
+    def _gestisci_raccolta(self, user_id, ordine, messaggio):
+        """
+        Gestisce le fasi di raccolta dei prodotti: registra tutti i prodotti
+        menzionati, di qualsiasi categoria, e salta le fasi già completate
+        
+        Args:
+            user_id: ID utente
+            ordine: Dizionario dell'ordine
+            messaggio: Testo del messaggio utente
+            
+        Returns:
+            Risposta al messaggio dell'utente
+        """
+        fase_corrente = next(chiave for chiave, stato, _, _ in FASI_RACCOLTA if stato == ordine["stato"])
+        
+        # Una domanda sui prodotti (prezzo, ingredienti) non modifica il carrello
+        menzioni = self._menzioni_prodotti(messaggio)
+        if menzioni and self._domanda_sui_prodotti(messaggio, menzioni):
+            return "FALLBACK"
+        prodotti = self._estrai_prodotti(messaggio, menzioni)
+        
+        # Aggiungi i prodotti al carrello dell'ordine
+        aggiunti = []
+        for chiave, _, _, _ in FASI_RACCOLTA:
+            for nome, quantita in prodotti[chiave]:
+                ordine["carrello"].aggiungi(chiave, nome, quantita, self._prezzo_centesimi(nome))
+                aggiunti.append(f"{quantita} {nome}")
+            if prodotti[chiave] and chiave not in ordine["fasi_completate"]:
+                ordine["fasi_completate"].append(chiave)
+        
+        # Il cliente può rifiutare fritti e bibite, non le pizze
+        rifiuto = fase_corrente != "pizze" and self._risposta_si_no(messaggio) == "no"
+        if rifiuto and fase_corrente not in ordine["fasi_completate"]:
+            ordine["fasi_completate"].append(fase_corrente)
+        
+        # "Va bene così" con le pizze già scelte chiude la raccolta e passa alla conferma
+        if not rifiuto and "pizze" in ordine["fasi_completate"] and self._fine_raccolta(messaggio):
+            rifiuto = True
+            ordine["fasi_completate"] = [chiave for chiave, _, _, _ in FASI_RACCOLTA]
+        
+        if not aggiunti and not rifiuto:
+            # Una domanda o un messaggio estraneo all'ordine esce dal flusso
+            if self._fuori_flusso(messaggio):
+                return "FALLBACK"
+            # Se non abbiamo riconosciuto nessun prodotto, chiedi di nuovo
+            return NON_CAPITO_RACCOLTA[fase_corrente]
+        
+        # Passa alla prima fase non ancora completata, oppure alla conferma dell'ordine
+        ordine["stato"] = next(
+            (stato for chiave, stato, _, _ in FASI_RACCOLTA if chiave not in ordine["fasi_completate"]),
+            "conferma_ordine"
+        )
+        
+        # Aggiorna stato ordine
+        self._aggiorna_stato_ordine(user_id)
+        
+        if not aggiunti:
+            return self._domanda_fase(ordine)
+        if fase_corrente == "pizze":
+            return f"Perfetto! Ho registrato: {', '.join(aggiunti)}. {self._domanda_fase(ordine)}"
+        return f"Ottimo! Ho aggiunto {', '.join(aggiunti)}. {self._domanda_fase(ordine)}"
+    
+    def _ultimo_ordine_disponibile(self, cliente):
+        """
+        Prodotti dell'ultimo ordine di un cliente abituale ancora presenti nel menu
+        
+        Args:
+            cliente: Dati del cliente dalla rubrica
+            
+        Returns:
+            Lista di tuple (categoria, nome, quantità)
+        """
+        prodotti_menu = self._prodotti_menu()
+        return [
+            (chiave, nome, quantita)
+            for chiave, _, _, _ in FASI_RACCOLTA
+            for nome, quantita in cliente["prodotti"].get(chiave, [])
+            if nome in prodotti_menu
+        ]
+    
+    def _riconosci_cliente(self, user_id, ordine, telefono):
+        """
+        Salva il telefono e, se il numero è in rubrica, chiede l'indirizzo dell'ultimo
+        ordine: chi scrive un numero non è necessariamente il suo titolare, quindi
+        nessun dato salvato (ordine, indirizzo, pagamento) viene mostrato o usato
+        prima che l'indirizzo sia verificato (vedi _verifica_indirizzo)
+        
+        Args:
+            user_id: ID utente
+            ordine: Dizionario dell'ordine
+            telefono: Numero di telefono scritto dal cliente
+            
+        Returns:
+            La domanda di verifica, oppure None se il numero non è in rubrica
+            o il cliente non ha un indirizzo con cui essere verificato
+        """
+        ordine["cliente"]["telefono"] = telefono
+        cliente = self.rubrica.cerca(telefono)
+        if cliente is None or not cliente["indirizzo"]:
+            return None
+        ordine["cliente_da_verificare"] = cliente
+        ordine["stato"] = "verifica_indirizzo"
+        self._aggiorna_stato_ordine(user_id)
+        return "Bentornato! Per recuperare i suoi dati mi scriva l'indirizzo di consegna del suo ultimo ordine (via e numero civico)."
+    
+    def _verifica_indirizzo(self, user_id, ordine, messaggio):
+        """
+        Confronta l'indirizzo scritto con quello dell'ultimo ordine. Se coincide
+        il cliente è riconosciuto e può usare i dati salvati; altrimenti
+        l'indirizzo scritto diventa quello di consegna di un ordine nuovo
+        
+        Args:
+            user_id: ID utente
+            ordine: Dizionario dell'ordine
+            messaggio: Indirizzo scritto dal cliente
+            
+        Returns:
+            Risposta al messaggio dell'utente
+        """
+        cliente = ordine["cliente_da_verificare"]
+        ordine["cliente_da_verificare"] = None
+        if not stesso_indirizzo(messaggio, cliente["indirizzo"]):
+            # Nessun indizio su cosa non corrisponde: l'indirizzo vale per questo ordine
+            ordine["cliente"]["indirizzo"] = messaggio
+            if ordine["carrello"]:
+                return f"Grazie, consegneremo a questo indirizzo. {self._chiedi_dati_consegna(user_id, ordine)}"
+            ordine["stato"] = "raccolta_pizze"
+            self._aggiorna_stato_ordine(user_id)
+            return f"Grazie, consegneremo a questo indirizzo. {self._domanda_fase(ordine)}"
+        
+        ordine["cliente_abituale"] = cliente
+        ordine["cliente"]["indirizzo"] = cliente["indirizzo"]
+        ordine["cliente"]["nome"] = cliente["nome"]
+        if ordine["carrello"]:
+            if cliente["pagamento"]:
+                ordine["pagamento"] = cliente["pagamento"]
+                return f"Grazie, ho ritrovato i suoi dati. {self._chiedi_orario(user_id, ordine)}"
+            return f"Grazie, ho ritrovato i suoi dati. {self._chiedi_dati_consegna(user_id, ordine)}"
+        return self._offri_riordino(user_id, ordine)
+    
+    def _offri_riordino(self, user_id, ordine):
+        """
+        Propone a un cliente abituale appena verificato di ripetere l'ultimo ordine
+        
+        Args:
+            user_id: ID utente
+            ordine: Dizionario dell'ordine (carrello ancora vuoto)
+            
+        Returns:
+            Risposta al messaggio dell'utente
+        """
+        cliente = ordine["cliente_abituale"]
+        ultimo_ordine = self._ultimo_ordine_disponibile(cliente)
+        if not ultimo_ordine:
+            ordine["stato"] = "raccolta_pizze"
+            self._aggiorna_stato_ordine(user_id)
+            return f"Grazie, ho ritrovato i suoi dati. {self._domanda_fase(ordine)}"
+        
+        # Riepilogo con i prezzi del menu corrente
+        totale = sum(quantita * self._prezzo_centesimi(nome) for _, nome, quantita in ultimo_ordine)
+        riepilogo = ", ".join(f"{quantita} {nome}" for _, nome, quantita in ultimo_ordine)
+        ordine["stato"] = "offerta_riordino"
+        self._aggiorna_stato_ordine(user_id)
+        
+        # Con il pagamento noto basta un "sì" con l'orario per arrivare al riepilogo finale
+        if cliente["pagamento"]:
+            return (f"Grazie, ho ritrovato i suoi dati. L'ultima volta ha ordinato: {riepilogo} ({formatta_euro(totale)}). "
+                    f"Vuole ripetere lo stesso ordine, con pagamento {cliente['pagamento'].lower()}? "
+                    f"Risponda 'sì' con l'orario che preferisce (es. 'sì, alle 20:30'), oppure mi dica cosa desidera.")
+        return (f"Grazie, ho ritrovato i suoi dati. L'ultima volta ha ordinato: {riepilogo} ({formatta_euro(totale)}). "
+                f"Vuole ripetere lo stesso ordine? Risponda 'sì', oppure mi dica cosa desidera.")
+    
+    def _chiedi_dati_consegna(self, user_id, ordine):
+        """
+        Passa alla prima informazione di consegna mancante, dopo che il telefono è noto
+        
+        Args:
+            user_id: ID utente
+            ordine: Dizionario dell'ordine
+            
+        Returns:
+            La domanda da porre al cliente
+        """
+        if not ordine["cliente"]["nome"]:
+            ordine["stato"] = "raccolta_nome"
+            domanda = "Come si chiama?"
+        elif not ordine["cliente"]["indirizzo"]:
+            ordine["stato"] = "raccolta_indirizzo"
+            domanda = "Qual è l'indirizzo di consegna?"
+        else:
+            ordine["stato"] = "raccolta_pagamento"
+            domanda = "Come preferisce pagare? Accettiamo contanti e carta alla consegna."
+        
+        self._aggiorna_stato_ordine(user_id)
+        return domanda
+    
+    def _chiedi_orario(self, user_id, ordine):
+        """
+        Passa alla raccolta dell'orario di consegna
+        
+        Args:
+            user_id: ID utente
+            ordine: Dizionario dell'ordine
+            
+        Returns:
+            La domanda con gli orari in cui il forno riesce a cuocere l'ordine
+        """
+        ordine["stato"] = "raccolta_orario"
+        self._aggiorna_stato_ordine(user_id)
+        
+        orari_disponibili = self._genera_orari_disponibili(ordine)
+        if not orari_disponibili:
+            return MESSAGGIO_NESSUN_ORARIO
+        return f"Quale orario preferisce per la consegna? Ecco gli orari disponibili:\n{self._formatta_orari(orari_disponibili)}"
+    
+    def _gestisci_orario(self, user_id, ordine, messaggio):
+        """
+        Riserva l'orario di consegna indicato nel messaggio e passa alla conferma finale
+        
+        Args:
+            user_id: ID utente
+            ordine: Dizionario dell'ordine
+            messaggio: Testo del messaggio utente
+            
+        Returns:
+            Il riepilogo da confermare, oppure gli orari disponibili
+        """
+        # Estrai l'orario dal messaggio
+        orario = self._estrai_orario(messaggio)
+        
+        if orario:
+            # Riserva l'orario se il forno riesce a cuocere tutte le pizze in tempo
+            if self.pianificatore.prenota(user_id, orario, self._numero_pizze(ordine)):
+                # Salva l'orario di consegna
+                ordine["orario_consegna"] = orario
+                
+                # Passa alla conferma finale
+                ordine["stato"] = "conferma_finale"
+                
+                # Genera un ID univoco per la comanda se non ne ha già uno
+                if not ordine["comanda_id"]:
+                    ordine["comanda_id"] = self._genera_id_comanda()
+                
+                # Aggiorna stato ordine
+                self._aggiorna_stato_ordine(user_id)
+                
+                # Prepara il riepilogo completo
+                riepilogo = self._genera_riepilogo_completo(ordine)
+                
+                # Chiedi conferma finale
+                return f"{riepilogo}\n\nÈ tutto corretto? Conferma l'ordine?"
+            else:
+                # Se l'orario non è disponibile suggerisce i più vicini con capacità sufficiente
+                suggeriti = self.pianificatore.suggerisci(orario, self._numero_pizze(ordine))
+                if not suggeriti:
+                    return MESSAGGIO_NESSUN_ORARIO
+                return f"Mi dispiace, l'orario {orario} non è disponibile per il suo ordine. Gli orari più vicini disponibili sono: {', '.join(suggeriti)}"
+        elif self._fuori_flusso(messaggio):
+            return "FALLBACK"
+        else:
+            # Se non abbiamo riconosciuto l'orario
+            orari_disponibili = self._genera_orari_disponibili(ordine)
+            if not orari_disponibili:
+                return MESSAGGIO_NESSUN_ORARIO
+            return f"Mi scusi, non ho capito l'orario. Può scegliere uno tra questi orari: {', '.join(orari_disponibili[:5])}..."
+    
     def gestisci_messaggio(self, user_id: str, messaggio: str) -> str:
         """
         Gestisce un messaggio dell'utente nel contesto dell'ordine
@@ -433,155 +837,83 @@ class GestoreOrdine:
             return self.inizia_nuovo_ordine(user_id)
         
         # Salva la risposta del cliente
-        self.ordini_attivi[user_id]["risposte_cliente"].append({
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "messaggio": messaggio
-        })
+        self.ordini_attivi[user_id]["risposte_cliente"].aggiungi("user", messaggio)
         
         ordine = self.ordini_attivi[user_id]
         
         # Gestione in base allo stato dell'ordine
-        if ordine["stato"] == "raccolta_pizze":
-            # Cerca pizze nel messaggio
-            pizze = self._estrai_pizze(messaggio)
-            if pizze:
-                # Aggiungi le pizze all'ordine
-                for nome_pizza, quantita in pizze:
-                    for _ in range(quantita):
-                        ordine["pizze"].append({
-                            "nome": nome_pizza,
-                            "quantita": 1  # Ogni voce rappresenta una pizza
-                        })
-                
-                # Passa allo stato successivo
-                ordine["stato"] = "raccolta_fritti"
-                
-                # Genera il menu dei fritti
-                menu_fritti = self._genera_menu_fritti()
-                
-                # Aggiorna stato ordine
-                self._aggiorna_stato_ordine(user_id)
-                
-                # Chiedi dei fritti
-                return f"Perfetto! Ho registrato: {', '.join([f'{q} {p}' for p, q in pizze])}. Vuole anche dei fritti?\n\n{menu_fritti}"
-            else:
-                # Se non abbiamo riconosciuto le pizze, chiedi di nuovo
-                return "Mi scusi, non ho capito quali pizze desidera. Può ripetere per favore?"
-                
-        elif ordine["stato"] == "raccolta_fritti":
-            # Verifica se il cliente vuole fritti
-            messaggio_lower = messaggio.lower()
-            
-            # Se il cliente rifiuta esplicitamente i fritti
-            if any(keyword in messaggio_lower for keyword in ["no", "niente", "non voglio", "basta così"]):
-                # Passa allo stato successivo senza aggiungere fritti
-                ordine["stato"] = "raccolta_bevande"
-                
-                # Genera il menu delle bevande
-                menu_bevande = self._genera_menu_bevande()
-                
-                # Aggiorna stato ordine
-                self._aggiorna_stato_ordine(user_id)
-                
-                # Chiedi delle bevande
-                return f"Vuole anche delle bibite?\n\n{menu_bevande}"
+        if ordine["stato"] in STATI_RACCOLTA:
+            # Un numero di telefono a carrello vuoto identifica un cliente abituale
+            if not ordine["carrello"] and PATTERN_TELEFONO.fullmatch(messaggio.strip()):
+                domanda = self._riconosci_cliente(user_id, ordine, messaggio.strip())
+                if domanda is None:
+                    return f"Grazie, non trovo ordini precedenti con questo numero: lo useremo per la consegna. {self._domanda_fase(ordine)}"
+                return domanda
+            return self._gestisci_raccolta(user_id, ordine, messaggio)
+        
+        elif ordine["stato"] == "offerta_riordino":
+            # Se il cliente nomina dei prodotti, ordina quelli invece dell'ultimo ordine
+            menzioni = self._menzioni_prodotti(messaggio)
+            if menzioni and self._domanda_sui_prodotti(messaggio, menzioni):
+                return "FALLBACK"
+            if menzioni:
+                ordine["stato"] = "raccolta_pizze"
+                return self._gestisci_raccolta(user_id, ordine, messaggio)
             
-            # Cerca fritti nel messaggio
-            fritti = self._estrai_fritti(messaggio)
-            if fritti:
-                # Aggiungi i fritti all'ordine
-                for nome_fritto, quantita in fritti:
-                    for _ in range(quantita):
-                        ordine["fritti"].append({
-                            "nome": nome_fritto,
-                            "quantita": 1  # Ogni voce rappresenta una porzione
-                        })
-                
-                # Passa allo stato successivo
-                ordine["stato"] = "raccolta_bevande"
-                
-                # Genera il menu delle bevande
-                menu_bevande = self._genera_menu_bevande()
-                
-                # Aggiorna stato ordine
-                self._aggiorna_stato_ordine(user_id)
-                
-                # Chiedi delle bevande
-                fritti_str = ", ".join([f"{q} {f}" for f, q in fritti])
-                return f"Ottimo! Ho aggiunto {fritti_str}. Vuole anche delle bibite?\n\n{menu_bevande}"
-            else:
-                # Se non abbiamo riconosciuto i fritti, chiedi di nuovo
-                return "Mi scusi, non ho capito quali fritti desidera. Può ripetere per favore? Se non desidera fritti, può dirmi 'no grazie'."
-                
-        elif ordine["stato"] == "raccolta_bevande":
-            # Verifica se il cliente vuole bevande
-            messaggio_lower = messaggio.lower()
+            risposta = self._risposta_si_no(messaggio)
+            if risposta is None and self._fuori_flusso(messaggio):
+                return "FALLBACK"
+            ordine["stato"] = "raccolta_pizze"
             
-            # Se il cliente rifiuta esplicitamente le bevande
-            if any(keyword in messaggio_lower for keyword in ["no", "niente", "non voglio", "basta così"]):
-                # Passa alla conferma dell'ordine
-                ordine["stato"] = "conferma_ordine"
+            if risposta == "si":
+                # Ripete l'ultimo ordine con i prezzi del menu corrente
+                for chiave, nome, quantita in self._ultimo_ordine_disponibile(ordine["cliente_abituale"]):
+                    ordine["carrello"].aggiungi(chiave, nome, quantita, self._prezzo_centesimi(nome))
+                ordine["fasi_completate"] = [chiave for chiave, _, _, _ in FASI_RACCOLTA]
+                abituale = ordine["cliente_abituale"]
+                if not abituale["pagamento"]:
+                    return f"Perfetto, ho ripetuto il suo ultimo ordine: {self._genera_riepilogo_ordine(ordine)}. {self._chiedi_dati_consegna(user_id, ordine)}"
                 
-                # Aggiorna stato ordine
-                self._aggiorna_stato_ordine(user_id)
-                
-                # Prepara il riepilogo dell'ordine
-                riepilogo = self._genera_riepilogo_ordine(ordine)
-                
-                # Chiedi conferma
-                return f"L'ordine è: {riepilogo} È corretto?"
+                # Pagamento dell'ultima volta, già proposto insieme all'ordine
+                ordine["pagamento"] = abituale["pagamento"]
+                if self._estrai_orario(messaggio):
+                    ordine["stato"] = "raccolta_orario"
+                    return self._gestisci_orario(user_id, ordine, messaggio)
+                return f"Perfetto, ho ripetuto il suo ultimo ordine. {self._chiedi_orario(user_id, ordine)}"
             
-            # Cerca bevande nel messaggio
-            bevande = self._estrai_bevande(messaggio)
-            if bevande:
-                # Aggiungi le bevande all'ordine
-                for nome_bevanda, quantita in bevande:
-                    for _ in range(quantita):
-                        ordine["bevande"].append({
-                            "nome": nome_bevanda,
-                            "quantita": 1  # Ogni voce rappresenta una bevanda
-                        })
-                
-                # Passa alla conferma dell'ordine
-                ordine["stato"] = "conferma_ordine"
-                
-                # Aggiorna stato ordine
-                self._aggiorna_stato_ordine(user_id)
-                
-                # Prepara il riepilogo dell'ordine
-                riepilogo = self._genera_riepilogo_ordine(ordine)
-                
-                # Chiedi conferma
-                bevande_str = ", ".join([f"{q} {b}" for b, q in bevande])
-                return f"Ottimo! Ho aggiunto {bevande_str}. L'ordine è: {riepilogo} È corretto?"
-            else:
-                # Se non abbiamo riconosciuto le bevande, chiedi di nuovo
-                return "Mi scusi, non ho capito quali bibite desidera. Può ripetere per favore? Se non desidera bibite, può dirmi 'no grazie'."
+            self._aggiorna_stato_ordine(user_id)
+            if risposta == "no":
+                return f"Va bene! {self._domanda_fase(ordine)}"
+            return NON_CAPITO_RACCOLTA["pizze"]
                 
         elif ordine["stato"] == "conferma_ordine":
             # Controlla se l'utente conferma l'ordine
-            messaggio_lower = messaggio.lower()
+            risposta = self._risposta_si_no(messaggio)
             
             # Se l'utente conferma
-            if any(keyword in messaggio_lower for keyword in ["sì", "si", "yes", "ok", "giusto", "corretto", "esatto", "confermo"]):
-                # Passa alla raccolta delle informazioni del cliente
-                ordine["stato"] = "raccolta_nome"
+            if risposta == "si":
+                # Telefono già noto (scritto a inizio ordine): passa ai dati mancanti
+                if ordine["cliente"]["telefono"]:
+                    return self._chiedi_dati_consegna(user_id, ordine)
+                
+                # Il telefono per primo: se il cliente è in rubrica non serve chiedere nome e indirizzo
+                ordine["stato"] = "raccolta_telefono"
                 
                 # Aggiorna stato ordine
                 self._aggiorna_stato_ordine(user_id)
                 
-                # Chiedi nome, indirizzo, telefono e metodo di pagamento
-                return "Per gestire l'ordine correttamente ho bisogno di: nome, indirizzo di consegna, numero di telefono, metodo di pagamento. Iniziamo con il nome, come si chiama?"
+                # Chiedi telefono, nome, indirizzo e metodo di pagamento
+                return "Per gestire l'ordine correttamente ho bisogno di: numero di telefono, nome, indirizzo di consegna, metodo di pagamento. Iniziamo con il numero di telefono: se ha già ordinato da noi recupero i suoi dati."
                 
             # Se l'utente non conferma
-            elif any(keyword in messaggio_lower for keyword in ["no", "sbagliato", "non va bene", "cambia", "modifica"]):
+            elif risposta == "no":
                 # Torna alla raccolta delle pizze
                 ordine["stato"] = "raccolta_pizze"
                 
-                # Reset dell'ordine
-                ordine["pizze"] = []
-                ordine["fritti"] = []
-                ordine["bevande"] = []
+                # Reset dell'ordine (e libera l'orario riservato)
+                self.pianificatore.rilascia(user_id)
+                ordine["carrello"].svuota()
+                ordine["fasi_completate"] = []
                 
                 # Genera il menu delle pizze
                 menu_pizze = self._genera_menu_pizze()
@@ -592,54 +924,61 @@ class GestoreOrdine:
                 # Richiedi nuovamente l'ordine
                 return f"Mi scusi per l'errore. Ricominciamo. Che pizza desidera ordinare?\n\n{menu_pizze}"
                 
+            elif self._fuori_flusso(messaggio):
+                return "FALLBACK"
+                
             else:
                 # Se non abbiamo capito la risposta, chiedi di nuovo
                 return "Mi scusi, non ho capito se l'ordine è corretto. Può rispondere con 'sì' o 'no'?"
                 
         elif ordine["stato"] == "raccolta_nome":
+            # Una domanda (es. sul menu) non è un nome
+            if self._fuori_flusso(messaggio, testo_libero=True):
+                return "FALLBACK"
+            
             # Salva il nome del cliente
             ordine["cliente"]["nome"] = messaggio
             
-            # Passa alla raccolta dell'indirizzo
-            ordine["stato"] = "raccolta_indirizzo"
-            
-            # Aggiorna stato ordine
-            self._aggiorna_stato_ordine(user_id)
-            
-            # Chiedi l'indirizzo
-            return "Grazie. Qual è l'indirizzo di consegna?"
+            # Passa all'indirizzo, oppure al pagamento se l'indirizzo è già stato scritto
+            return f"Grazie. {self._chiedi_dati_consegna(user_id, ordine)}"
             
         elif ordine["stato"] == "raccolta_indirizzo":
+            # Una domanda (es. sul menu) non è un indirizzo
+            if self._fuori_flusso(messaggio, testo_libero=True):
+                return "FALLBACK"
+            
             # Salva l'indirizzo del cliente
             ordine["cliente"]["indirizzo"] = messaggio
             
-            # Passa alla raccolta del telefono
-            ordine["stato"] = "raccolta_telefono"
+            # Passa alla raccolta del metodo di pagamento
+            ordine["stato"] = "raccolta_pagamento"
             
             # Aggiorna stato ordine
             self._aggiorna_stato_ordine(user_id)
             
-            # Chiedi il telefono
-            return "Mi può lasciare un numero di telefono per eventuali comunicazioni sulla consegna?"
+            # Chiedi il metodo di pagamento
+            return "Come preferisce pagare? Accettiamo contanti e carta alla consegna."
             
         elif ordine["stato"] == "raccolta_telefono":
             # Verifica che sia un possibile numero di telefono
-            if re.match(r'\+?\d[\d\s-]{7,}', messaggio):
-                # Salva il telefono del cliente
-                ordine["cliente"]["telefono"] = messaggio
-                
-                # Passa alla raccolta del metodo di pagamento
-                ordine["stato"] = "raccolta_pagamento"
-                
-                # Aggiorna stato ordine
-                self._aggiorna_stato_ordine(user_id)
-                
-                # Chiedi il metodo di pagamento
-                return "Come preferisce pagare? Accettiamo contanti e carta alla consegna."
+            if PATTERN_TELEFONO.match(messaggio):
+                # Salva il telefono e cerca il cliente in rubrica
+                domanda = self._riconosci_cliente(user_id, ordine, messaggio)
+                if domanda is not None:
+                    return domanda
+                return f"Grazie. {self._chiedi_dati_consegna(user_id, ordine)}"
+            elif self._fuori_flusso(messaggio):
+                return "FALLBACK"
             else:
                 # Se il formato del telefono non è valido
                 return "Mi scusi, non sembra un numero di telefono valido. Può inserire un numero di telefono corretto?"
                 
+        elif ordine["stato"] == "verifica_indirizzo":
+            # Una domanda (es. sul menu) non è un indirizzo
+            if self._fuori_flusso(messaggio, testo_libero=True):
+                return "FALLBACK"
+            return self._verifica_indirizzo(user_id, ordine, messaggio)
+        
         elif ordine["stato"] == "raccolta_pagamento":
             messaggio_lower = messaggio.lower()
             
@@ -648,91 +987,42 @@ class GestoreOrdine:
                 ordine["pagamento"] = "Contanti alla consegna"
             elif any(keyword in messaggio_lower for keyword in ["carta", "bancomat", "credit", "credito", "debito", "pos"]):
                 ordine["pagamento"] = "Carta alla consegna"
+            elif self._fuori_flusso(messaggio):
+                return "FALLBACK"
             else:
                 # Se non abbiamo capito il metodo di pagamento
                 return "Mi scusi, non ho capito il metodo di pagamento. Può scegliere tra contanti o carta alla consegna?"
             
             # Passa alla raccolta dell'orario di consegna
-            ordine["stato"] = "raccolta_orario"
-            
-            # Aggiorna stato ordine
-            self._aggiorna_stato_ordine(user_id)
-            
-            # Genera la lista degli orari disponibili
-            orari_disponibili = self._genera_orari_disponibili()
-            
-            # Formatta gli orari disponibili in blocchi per maggiore leggibilità
-            orari_formattati = []
-            for i, orario in enumerate(orari_disponibili):
-                orari_formattati.append(orario)
-                # Aggiungi una nuova riga ogni 5 orari
-                if (i + 1) % 5 == 0 and i < len(orari_disponibili) - 1:
-                    orari_formattati.append("\n")
-            
-            orari_str = ", ".join(orari_formattati)
-            
-            # Chiedi l'orario di consegna
-            return f"Quale orario preferisce per la consegna? Ecco gli orari disponibili:\n{orari_str}"
+            return self._chiedi_orario(user_id, ordine)
             
         elif ordine["stato"] == "raccolta_orario":
-            # Estrai l'orario dal messaggio
-            orario = self._estrai_orario(messaggio)
-            
-            if orario:
-                # Verifica se l'orario è tra quelli disponibili
-                orari_disponibili = self._genera_orari_disponibili()
-                
-                if orario in orari_disponibili:
-                    # Salva l'orario di consegna
-                    ordine["orario_consegna"] = orario
-                    
-                    # Aggiorna il contatore degli orari prenotati
-                    if orario in self.orari_prenotati:
-                        self.orari_prenotati[orario] += 1
-                    else:
-                        self.orari_prenotati[orario] = 1
-                    
-                    # Passa alla conferma finale
-                    ordine["stato"] = "conferma_finale"
-                    
-                    # Genera un ID univoco per la comanda se non ne ha già uno
-                    if not ordine["comanda_id"]:
-                        ordine["comanda_id"] = self._genera_id_comanda()
-                    
-                    # Aggiorna stato ordine
-                    self._aggiorna_stato_ordine(user_id)
-                    
-                    # Prepara il riepilogo completo
-                    riepilogo = self._genera_riepilogo_completo(ordine)
-                    
-                    # Chiedi conferma finale
-                    return f"{riepilogo}\n\nÈ tutto corretto? Conferma l'ordine?"
-                else:
-                    # Se l'orario non è disponibile
-                    return f"Mi dispiace, l'orario {orario} non è disponibile. Scelga uno tra questi orari: {', '.join(orari_disponibili[:5])}..."
-            else:
-                # Se non abbiamo riconosciuto l'orario
-                orari_disponibili = self._genera_orari_disponibili()
-                return f"Mi scusi, non ho capito l'orario. Può scegliere uno tra questi orari: {', '.join(orari_disponibili[:5])}..."
+            return self._gestisci_orario(user_id, ordine, messaggio)
             
         elif ordine["stato"] == "conferma_finale":
             # Controlla se l'utente conferma tutto
-            messaggio_lower = messaggio.lower()
+            risposta = self._risposta_si_no(messaggio)
             
             # Se l'utente conferma
-            if any(keyword in messaggio_lower for keyword in ["sì", "si", "yes", "ok", "giusto", "corretto", "esatto", "confermo"]):
-                # Calcola il totale dell'ordine
+            if risposta == "si":
+                # Il totale è già aggiornato dal carrello ad ogni aggiunta
                 ordine_completato = self.ordini_attivi[user_id]
-                ordine_completato["totale"] = self._calcola_totale_ordine(ordine_completato)
+                ordine_completato["totale"] = ordine_completato["carrello"].totale
+                
+                # La capacità del forno riservata per l'orario diventa definitiva
+                self.pianificatore.conferma(user_id, ordine_completato["orario_consegna"], self._numero_pizze(ordine_completato))
                 
-                # Aggiungi prezzi ai singoli prodotti per la generazione della comanda
-                self._aggiungi_prezzi_prodotti(ordine_completato)
+                # Salva comanda e profilo cliente su Supabase (vedi salva_ordine)
+                self.salva_ordine(user_id, ordine_completato)
                 
-                # Ora i dati saranno salvati su Supabase tramite le funzioni di profilo.py
-                # Nessun salvataggio locale qui
-                crea_comanda_txt(user_id, ordine_completato)
-                aggiorna_profilo_cliente(user_id, ordine_completato["cliente"])
-                aggiorna_file_clienti(ordine_completato["cliente"])
+                # Il cliente sarà riconosciuto dal telefono al prossimo ordine
+                cliente = ordine_completato["cliente"]
+                self.rubrica.registra(
+                    cliente["telefono"], cliente["nome"], cliente["indirizzo"], ordine_completato["pagamento"],
+                    {chiave: [(riga.nome, riga.quantita) for riga in ordine_completato["carrello"].righe(chiave)]
+                     for chiave, _, _, _ in FASI_RACCOLTA},
+                    datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                )
                 
                 # Ottieni l'ID della comanda per mostrarlo all'utente
                 comanda_id = ordine_completato["comanda_id"]
@@ -744,19 +1034,21 @@ class GestoreOrdine:
                 return f"Grazie {ordine_completato['cliente']['nome']}! Il suo ordine #{comanda_id} è stato confermato. Consegneremo a {ordine_completato['cliente']['indirizzo']} alle {ordine_completato['orario_consegna']}. In caso di problemi, la contatteremo al numero {ordine_completato['cliente']['telefono']}. Grazie per aver scelto la pizzeria da Mario! In caso di problemi o modifiche all'ordine la preghiamo di contattare direttamente il numero della pizzeria, a presto!"
                 
             # Se l'utente non conferma
-            elif any(keyword in messaggio_lower for keyword in ["no", "sbagliato", "non va bene", "cambia", "modifica"]):
+            elif risposta == "no":
                 # Torna alla raccolta delle pizze
                 ordine["stato"] = "raccolta_pizze"
                 
-                # Reset dell'ordine
-                ordine["pizze"] = []
-                ordine["fritti"] = []
-                ordine["bevande"] = []
+                # Reset dell'ordine (e libera l'orario riservato)
+                self.pianificatore.rilascia(user_id)
+                ordine["carrello"].svuota()
+                ordine["fasi_completate"] = []
                 ordine["cliente"]["nome"] = None
                 ordine["cliente"]["indirizzo"] = None
                 ordine["cliente"]["telefono"] = None
                 ordine["pagamento"] = None
                 ordine["orario_consegna"] = None
+                ordine["cliente_abituale"] = None
+                ordine["cliente_da_verificare"] = None
                 
                 # Genera il menu delle pizze
                 menu_pizze = self._genera_menu_pizze()
@@ -767,6 +1059,9 @@ class GestoreOrdine:
                 # Richiedi nuovamente l'ordine
                 return f"Mi scusi per l'errore. Ricominciamo da capo. Che pizza desidera ordinare?\n\n{menu_pizze}"
                 
+            elif self._fuori_flusso(messaggio):
+                return "FALLBACK"
+                
             else:
                 # Se non abbiamo capito la risposta, chiedi di nuovo
                 return "Mi scusi, non ho capito se vuole confermare l'ordine. Può rispondere con 'sì' o 'no'?"
@@ -786,29 +1081,11 @@ class GestoreOrdine:
         """
         parti_riepilogo = []
         
-        # Aggiungi le pizze al riepilogo
-        if ordine["pizze"]:
-            nomi_pizze = [p["nome"] for p in ordine["pizze"]]
-            # Conta le occorrenze di ciascuna pizza
-            conteggio_pizze = Counter(nomi_pizze)
-            pizze_str = ", ".join([f"{conteggio} {pizza}" for pizza, conteggio in conteggio_pizze.items()])
-            parti_riepilogo.append(pizze_str)
-        
-        # Aggiungi i fritti al riepilogo
-        if ordine["fritti"]:
-            nomi_fritti = [f["nome"] for f in ordine["fritti"]]
-            # Conta le occorrenze di ciascun fritto
-            conteggio_fritti = Counter(nomi_fritti)
-            fritti_str = ", ".join([f"{conteggio} {fritto}" for fritto, conteggio in conteggio_fritti.items()])
-            parti_riepilogo.append(fritti_str)
-        
-        # Aggiungi le bevande al riepilogo
-        if ordine["bevande"]:
-            nomi_bevande = [b["nome"] for b in ordine["bevande"]]
-            # Conta le occorrenze di ciascuna bevanda
-            conteggio_bevande = Counter(nomi_bevande)
-            bevande_str = ", ".join([f"{conteggio} {bevanda}" for bevanda, conteggio in conteggio_bevande.items()])
-            parti_riepilogo.append(bevande_str)
+        # Una parte per categoria (pizze, fritti, bevande), con le quantità di ogni prodotto
+        for chiave, _, _, _ in FASI_RACCOLTA:
+            righe = ordine["carrello"].righe(chiave)
+            if righe:
+                parti_riepilogo.append(", ".join(f"{riga.quantita} {riga.nome}" for riga in righe))
         
         # Costruisci il riepilogo finale
         if parti_riepilogo:
@@ -844,31 +1121,8 @@ class GestoreOrdine:
         riepilogo += f"Indirizzo di consegna: {indirizzo}\n"
         riepilogo += f"Telefono: {telefono}\n"
         riepilogo += f"Orario di consegna: {orario_consegna}\n"
-        riepilogo += f"Metodo di pagamento: {pagamento}"
+        riepilogo += f"Metodo di pagamento: {pagamento}\n"
+        riepilogo += f"Totale: {formatta_euro(ordine['carrello'].totale_centesimi)}"
         
         return riepilogo
 
-
-def e_intento_ordine(messaggio: str) -> bool:
-    """
-    Determina se il messaggio dell'utente indica l'intento di effettuare un ordine
-    
-    Args:
-        messaggio: Testo del messaggio utente
-        
-    Returns:
-        True se l'utente intende effettuare un ordine, False altrimenti
-    """
-    messaggio_lower = messaggio.lower()
-    
-    # Parole chiave che indicano l'intento di ordinare
-    keywords_ordine = [
-        "ordina", "ordinare", "vorrei ordinare", "voglio ordinare", 
-        "fare un ordine", "ordine", "prendere", "vorrei prendere",
-        "voglio prendere", "vorrei una pizza", "vorrei un fritto",
-        "vorrei da bere", "portami", "consegnami", "voglio una pizza",
-        "prenoto", "prenotare", "prenotazione"
-    ]
-    
-    # Controlla se una delle parole chiave è presente nel messaggio
-    return any(keyword in messaggio_lower for keyword in keywords_ordine)
\ No newline at end of file
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import math
+import os
+import sys
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# File in cui vengono pubblicate le previsioni della serata
+PERCORSO_PREVISIONI = os.getenv("FORECAST_PATH", os.path.join("data", "previsioni_slot.json"))
+
+# Capacità di uno slot senza previsioni (il limite storico di 2 consegne)
+CAPACITA_SLOT_PREDEFINITA = int(os.getenv("SLOT_CAPACITY", "2"))
+
+# Consegne massime per slot sostenibili dal forno
+CAPACITA_SLOT_MASSIMA = int(os.getenv("SLOT_CAPACITY_MAX", "6"))
+
+# Margine sulla domanda prevista e capacità minima di ogni slot
+MARGINE_PREVISIONE = float(os.getenv("FORECAST_MARGIN", "0.25"))
+CAPACITA_SLOT_MINIMA = int(os.getenv("SLOT_CAPACITY_MIN", "1"))
+
+# Slot di consegna di 15 minuti dalle 19:00 alle 23:00
+SLOT_CONSEGNA = [f"{minuti // 60:02d}:{minuti % 60:02d}" for minuti in range(19 * 60, 23 * 60 + 1, 15)]
+
+
+def slot_di(orario: Optional[str]) -> Optional[int]:
+    """
+    Indice dello slot di consegna che contiene un orario
+
+    Args:
+        orario: Orario "HH:MM" o "HH:MM:SS"
+
+    Returns:
+        Indice in SLOT_CONSEGNA, oppure None se fuori dalla fascia di consegna
+    """
+    if not orario or len(orario) < 5 or not orario[:2].isdigit() or not orario[3:5].isdigit():
+        return None
+    minuti = int(orario[:2]) * 60 + int(orario[3:5])
+    indice = (minuti - 19 * 60) // 15
+    return indice if 0 <= indice < len(SLOT_CONSEGNA) else None
+
+
+class ModelloDomanda:
+    """
+    Previsione delle consegne per slot: media stagionale per giorno della
+    settimana e slot con smorzamento esponenziale (le serate più recenti
+    pesano di più), corretta per la tendenza delle ultime serate.
+    """
+
+    def __init__(self, alfa: float = 0.3, alfa_tendenza: float = 0.2, limiti_tendenza=(0.75, 1.5)):
+        """
+        Inizializza il modello
+
+        Args:
+            alfa: Peso dell'ultima serata nella media di ogni giorno della settimana
+            alfa_tendenza: Peso dell'ultima serata nel livello complessivo della domanda
+            limiti_tendenza: Correzione minima e massima dovuta alla tendenza
+        """
+        self.alfa = alfa
+        self.alfa_tendenza = alfa_tendenza
+        self.limiti_tendenza = limiti_tendenza
+        self.stagionale = np.zeros((7, len(SLOT_CONSEGNA)))  # giorno della settimana x slot
+        self.serate_per_giorno = np.zeros(7, dtype=np.int64)
+        self.tendenza = 1.0
+
+    def addestra(self, comande: List[Dict]) -> "ModelloDomanda":
+        """
+        Addestra il modello sullo storico delle comande
+
+        Args:
+            comande: Righe della tabella comande (servono data e orario_consegna, o ora)
+
+        Returns:
+            Il modello stesso
+        """
+        conteggi: Dict[str, np.ndarray] = {}  # data -> consegne per slot
+        for comanda in comande:
+            giorno = (comanda.get("data") or "")[:10]
+            slot = slot_di(comanda.get("orario_consegna") or comanda.get("ora"))
+            if not giorno or slot is None:
+                continue
+            if giorno not in conteggi:
+                conteggi[giorno] = np.zeros(len(SLOT_CONSEGNA))
+            conteggi[giorno][slot] += 1
+
+        # Solo le serate con almeno una consegna: i giorni di chiusura non abbassano le medie
+        serate = sorted(conteggi)
+        if not serate:
+            return self
+        matrice = np.array([conteggi[giorno] for giorno in serate])
+        giorni_settimana = np.array([date.fromisoformat(giorno).weekday() for giorno in serate])
+
+        for giorno_settimana in range(7):
+            righe = matrice[giorni_settimana == giorno_settimana]
+            self.serate_per_giorno[giorno_settimana] = len(righe)
+            if len(righe):
+                self.stagionale[giorno_settimana] = _media_esponenziale(righe, self.alfa)
+
+        # Tendenza: livello recente delle serate rispetto alla media dello storico
+        totali = matrice.sum(axis=1)
+        livello = _media_esponenziale(totali, self.alfa_tendenza)
+        media = totali.mean()
+        if media > 0:
+            self.tendenza = float(np.clip(livello / media, *self.limiti_tendenza))
+        return self
+
+    def prevedi(self, giorno: date) -> np.ndarray:
+        """
+        Consegne previste per ogni slot di una serata
+
+        Args:
+            giorno: Data della serata
+
+        Returns:
+            Array allineato a SLOT_CONSEGNA
+        """
+        giorno_settimana = giorno.weekday()
+        if self.serate_per_giorno[giorno_settimana]:
+            profilo = self.stagionale[giorno_settimana]
+        elif self.serate_per_giorno.any():
+            # Nessuno storico per quel giorno: media degli altri giorni
+            presenti = self.serate_per_giorno > 0
+            profilo = self.stagionale[presenti].mean(axis=0)
+        else:
+            return np.zeros(len(SLOT_CONSEGNA))
+        return profilo * self.tendenza
+
+
+def _media_esponenziale(valori: np.ndarray, alfa: float) -> np.ndarray:
+    """Media con smorzamento esponenziale lungo il primo asse (l'ultimo valore pesa alfa)"""
+    media = valori[0].astype(np.float64)
+    for valore in valori[1:]:
+        media = alfa * valore + (1 - alfa) * media
+    return media
+
+
+def capacita_da_previsione(previsione: np.ndarray, margine: float = MARGINE_PREVISIONE,
+                           minima: int = CAPACITA_SLOT_MINIMA, massima: int = CAPACITA_SLOT_MASSIMA) -> List[int]:
+    """
+    Capacità obiettivo di ogni slot: la domanda prevista più un margine,
+    entro i limiti del forno
+
+    Args:
+        previsione: Consegne previste per slot
+        margine: Margine relativo sulla previsione
+        minima: Capacità minima di ogni slot
+        massima: Capacità massima di ogni slot
+
+    Returns:
+        Lista di capacità allineata a SLOT_CONSEGNA
+    """
+    return [min(massima, max(minima, math.ceil(valore * (1 + margine) - 1e-9))) for valore in previsione]
+
+
+def pubblica_previsioni(comande: List[Dict], giorno: date, percorso: str = PERCORSO_PREVISIONI) -> Dict:
+    """
+    Addestra il modello e scrive previsioni e capacità per slot della serata
+
+    Args:
+        comande: Storico delle comande
+        giorno: Serata da prevedere
+        percorso: File JSON di destinazione
+
+    Returns:
+        Il contenuto pubblicato
+    """
+    modello = ModelloDomanda().addestra(comande)
+    previsione = modello.prevedi(giorno)
+    capacita = capacita_da_previsione(previsione)
+    pubblicazione = {
+        "data": giorno.isoformat(),
+        "generato": datetime.now().isoformat(timespec="seconds"),
+        "serate_storico": int(modello.serate_per_giorno.sum()),
+        "tendenza": round(modello.tendenza, 3),
+        "slot": {
+            slot: {"previsione": round(float(valore), 2), "capacita": posti}
+            for slot, valore, posti in zip(SLOT_CONSEGNA, previsione, capacita)
+        }
+    }
+
+    cartella = os.path.dirname(percorso)
+    if cartella:
+        os.makedirs(cartella, exist_ok=True)
+    temporaneo = f"{percorso}.tmp"
+    with open(temporaneo, "w", encoding="utf-8") as f:
+        json.dump(pubblicazione, f, indent=2, ensure_ascii=False)
+    os.replace(temporaneo, percorso)
+    return pubblicazione
+
+
+class CapacitaSlot:
+    """
+    Capacità per slot lette dalle previsioni pubblicate. Il file viene riletto
+    quando cambia; se manca o riguarda un'altra serata vale la capacità predefinita.
+    """
+
+    def __init__(self, percorso: str = PERCORSO_PREVISIONI, predefinita: int = CAPACITA_SLOT_PREDEFINITA):
+        """
+        Inizializza le capacità
+
+        Args:
+            percorso: File delle previsioni
+            predefinita: Capacità degli slot senza previsione
+        """
+        self.percorso = percorso
+        self.predefinita = predefinita
+        self._modificato: Optional[float] = None
+        self._pubblicazione: Dict = {}
+
+    def _aggiorna(self) -> None:
+        """Rilegge il file delle previsioni se è cambiato"""
+        try:
+            modificato = os.path.getmtime(self.percorso)
+        except OSError:
+            self._modificato, self._pubblicazione = None, {}
+            return
+        if modificato == self._modificato:
+            return
+        try:
+            with open(self.percorso, encoding="utf-8") as f:
+                self._pubblicazione = json.load(f)
+            self._modificato = modificato
+            print(f"DEBUG - Caricate le previsioni per la serata del {self._pubblicazione.get('data')}")
+        except (OSError, ValueError) as e:
+            print(f"Errore nella lettura delle previsioni: {str(e)}")
+            self._pubblicazione = {}
+
+    def pubblicata(self, giorno: Optional[date] = None) -> bool:
+        """Indica se ci sono previsioni pubblicate per la serata (oggi se None)"""
+        self._aggiorna()
+        return self._pubblicazione.get("data") == (giorno or date.today()).isoformat()
+
+    def capacita(self, slot: str, giorno: Optional[date] = None) -> int:
+        """
+        Consegne accettabili in uno slot
+
+        Args:
+            slot: Orario dello slot, es. "20:00"
+            giorno: Serata (oggi se None)
+
+        Returns:
+            La capacità obiettivo dello slot
+        """
+        self._aggiorna()
+        giorno = giorno or date.today()
+        if self._pubblicazione.get("data") != giorno.isoformat():
+            return self.predefinita
+        voce = self._pubblicazione.get("slot", {}).get(slot)
+        return int(voce["capacita"]) if voce else self.predefinita
+
+    def previsioni(self) -> Dict:
+        """Ultime previsioni pubblicate (vuoto se assenti)"""
+        self._aggiorna()
+        return self._pubblicazione
+
+
+async def _carica_storico() -> List[Dict]:
+    """Legge dal database le colonne delle comande usate dal modello, una pagina alla volta"""
+    from esportazione import pagine_comande
+    from repository import ottieni_repository, chiudi_repository
+    try:
+        return [
+            comanda
+            async for pagina in pagine_comande(ottieni_repository(), colonne=("data", "ora", "orario_consegna"))
+            for comanda in pagina
+        ]
+    finally:
+        await chiudi_repository()
+
+
+if __name__ == "__main__":
+    # Uso: python previsioni.py [AAAA-MM-GG] (oggi se assente)
+    from dotenv import load_dotenv
+    load_dotenv()
+    serata = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else date.today()
+    risultato = pubblica_previsioni(asyncio.run(_carica_storico()), serata)
+    print(json.dumps(risultato, indent=2, ensure_ascii=False))
@@ -1,80 +1,104 @@
 import os
 import json
+import base64
+import asyncio
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Optional
-from supabase import create_client
-from dotenv import load_dotenv
+from typing import Dict, List, Optional, Tuple
+from database import ottieni_client
+from carrello import CATEGORIE_CARRELLO, RigaOrdine, in_centesimi, formatta_euro
+from repository import ottieni_repository
+from statistiche import consegna_prevista, stato_comanda
 
-# Load environment variables
-load_dotenv()
+# Finestra in cui una consegna è "in corso" per la cucina
+ORE_IN_CORSO = 2
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-supabase = create_client(supabase_url, supabase_key)
+# Colonne della tabella comande che la dashboard può richiedere, e quelle restituite se non specificate.
+# "stato" non è una colonna: dipende dall'ora ed è derivato da consegna_prevista per le righe restituite
+COLONNE_COMANDE_DASHBOARD = [
+    "comanda_id", "data", "ora", "orario_consegna", "consegna_prevista", "stato",
+    "nome_cliente", "telefono_cliente", "indirizzo_cliente", "metodo_pagamento", "totale",
+    *CATEGORIE_CARRELLO, *(f"num_{categoria}" for categoria in CATEGORIE_CARRELLO), "num_prodotti"
+]
+COLONNE_COMANDE_PREDEFINITE = [
+    "comanda_id", "data", "ora", "orario_consegna", "consegna_prevista", "stato",
+    "nome_cliente", "indirizzo_cliente", "totale", *(f"num_{categoria}" for categoria in CATEGORIE_CARRELLO), "num_prodotti"
+]
 
-def crea_comanda_txt(user_id: str, ordine: Dict) -> None:
+# Filtri delle liste di comande della dashboard
+FILTRI_COMANDE = ("tutte", "oggi", "in_corso", "completate", "future")
+
+def prepara_dati_comanda(user_id: str, ordine: Dict) -> Dict:
     """
-    Salva i dati dell'ordine nel database Supabase con formato ordinato per la stampa
+    Prepara la riga della tabella "comande" a partire dall'ordine.
+    Orario di consegna completo e numero di prodotti vengono calcolati
+    qui, una volta, così le liste della dashboard li leggono e filtrano
+    direttamente sul database.
     
     Args:
         user_id: ID utente
         ordine: Dizionario dell'ordine
+        
+    Returns:
+        Dizionario con i dati della comanda per il database
     """
-    # Ottieni l'ID comanda
-    comanda_id = ordine["comanda_id"]
-    
-    # Prepara i prodotti in formato JSONB per il database
-    pizze_json = _prepara_prodotti_json(ordine["pizze"])
-    fritti_json = _prepara_prodotti_json(ordine["fritti"])
-    bevande_json = _prepara_prodotti_json(ordine["bevande"])
-    
-    # Prepara i dati della comanda per il database
-    comanda_data = {
-        "comanda_id": comanda_id,
+    adesso = datetime.now()
+    data = adesso.strftime('%Y-%m-%d')
+    quantita = {
+        categoria: sum(riga.quantita for riga in ordine["carrello"].righe(categoria))
+        for categoria in CATEGORIE_CARRELLO
+    }
+    return {
+        "comanda_id": ordine["comanda_id"],
         "user_id": user_id,
-        "data": datetime.now().strftime('%Y-%m-%d'),
-        "ora": datetime.now().strftime('%H:%M:%S'),
+        "data": data,
+        "ora": adesso.strftime('%H:%M:%S'),
         "orario_consegna": ordine['orario_consegna'],
+        "consegna_prevista": f"{data}T{ordine['orario_consegna']}:00" if ordine['orario_consegna'] else None,
         "nome_cliente": ordine['cliente']['nome'],
         "telefono_cliente": ordine['cliente']['telefono'],
         "indirizzo_cliente": ordine['cliente']['indirizzo'],
         "metodo_pagamento": ordine['pagamento'],
-        "totale": ordine['totale'],
-        "pizze": pizze_json,
-        "fritti": fritti_json,
-        "bevande": bevande_json
+        "totale": ordine["carrello"].totale,
+        # Righe del carrello in formato JSONB per il database (pizze, fritti, bevande)
+        **{categoria: ordine["carrello"].in_json(categoria) for categoria in CATEGORIE_CARRELLO},
+        # Numero di prodotti per categoria e in totale
+        **{f"num_{categoria}": quantita[categoria] for categoria in CATEGORIE_CARRELLO},
+        "num_prodotti": sum(quantita.values())
     }
-    
-    # Salva la comanda nella tabella "comande"
-    response = supabase.table("comande").insert(comanda_data).execute()
 
-def _prepara_prodotti_json(prodotti: List[Dict]) -> List[Dict]:
+def prepara_dati_cliente(user_id: str, info_cliente: Dict) -> Dict:
     """
-    Prepara i prodotti in formato JSON per il database
+    Prepara la riga della tabella "clienti"
     
     Args:
-        prodotti: Lista di prodotti
+        user_id: ID utente
+        info_cliente: Informazioni del cliente (nome, telefono, indirizzo)
         
     Returns:
-        Lista di dizionari con formato adatto per JSON
+        Dizionario con i dati del cliente per il database
     """
-    # Utilizza _conta_prodotti per raggruppare e contare
-    conteggio = _conta_prodotti(prodotti)
-    
-    # Converte in formato JSON per il database
-    risultato = []
-    for nome, (quantita, prezzo) in conteggio.items():
-        risultato.append({
-            "nome": nome,
-            "prezzo": prezzo,
-            "quantita": quantita
-        })
-    
-    # Ordina per nome prodotto per avere un formato consistente
-    return sorted(risultato, key=lambda x: x["nome"])
+    return {
+        "user_id": user_id,
+        "nome": info_cliente['nome'],
+        "telefono": info_cliente['telefono'],
+        "indirizzo": info_cliente['indirizzo'],
+        "ultimo_aggiornamento": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
 
-def formatta_comanda_per_stampa(comanda_id: str) -> str:
+def crea_comanda_txt(user_id: str, ordine: Dict) -> None:
+    """
+    Salva i dati dell'ordine nel database Supabase con formato ordinato per la stampa
+    (versione sincrona, per l'uso fuori dal server; il server usa RepositoryAsync)
+    
+    Args:
+        user_id: ID utente
+        ordine: Dizionario dell'ordine
+    """
+    # Salva la comanda nella tabella "comande"
+    supabase = ottieni_client()
+    supabase.table("comande").insert(prepara_dati_comanda(user_id, ordine)).execute()
+
+async def formatta_comanda_per_stampa(comanda_id: str) -> str:
     """
     Formatta una comanda per la stampa
     
@@ -85,13 +109,23 @@ def formatta_comanda_per_stampa(comanda_id: str) -> str:
         String con la comanda formattata pronta per la stampa
     """
     # Recupera i dati della comanda
-    response = supabase.table("comande").select("*").eq("comanda_id", comanda_id).execute()
+    comanda = await ottieni_repository().ottieni_comanda(comanda_id)
     
-    if not response.data or len(response.data) == 0:
+    if not comanda:
         return "Comanda non trovata."
     
-    comanda = response.data[0]
+    return _formatta_testo_comanda(comanda)
+
+def _formatta_testo_comanda(comanda: Dict) -> str:
+    """
+    Formatta il testo di stampa di una comanda già recuperata
     
+    Args:
+        comanda: Dati della comanda
+        
+    Returns:
+        String con la comanda formattata pronta per la stampa
+    """
     # Costruisci il contenuto formattato
     contenuto = []
     contenuto.append("=" * 50)
@@ -113,35 +147,16 @@ def formatta_comanda_per_stampa(comanda_id: str) -> str:
     # Prodotti ordinati
     contenuto.append("PRODOTTI ORDINATI:")
     
-    # Pizze
-    pizze = comanda.get("pizze", [])
-    if pizze:
-        contenuto.append("\nPIZZE:")
-        for pizza in pizze:
-            prezzo = float(pizza["prezzo"]) if isinstance(pizza["prezzo"], str) else pizza["prezzo"]
-            quantita = int(pizza["quantita"])
-            contenuto.append(f"  {quantita}x {pizza['nome']:<20} {prezzo:.2f}€/cad = {quantita * prezzo:.2f}€")
-    
-    # Fritti
-    fritti = comanda.get("fritti", [])
-    if fritti:
-        contenuto.append("\nFRITTI:")
-        for fritto in fritti:
-            prezzo = float(fritto["prezzo"]) if isinstance(fritto["prezzo"], str) else fritto["prezzo"]
-            quantita = int(fritto["quantita"])
-            contenuto.append(f"  {quantita}x {fritto['nome']:<20} {prezzo:.2f}€/cad = {quantita * prezzo:.2f}€")
-    
-    # Bevande
-    bevande = comanda.get("bevande", [])
-    if bevande:
-        contenuto.append("\nBEVANDE:")
-        for bevanda in bevande:
-            prezzo = float(bevanda["prezzo"]) if isinstance(bevanda["prezzo"], str) else bevanda["prezzo"]
-            quantita = int(bevanda["quantita"])
-            contenuto.append(f"  {quantita}x {bevanda['nome']:<20} {prezzo:.2f}€/cad = {quantita * prezzo:.2f}€")
+    # Pizze, fritti e bevande
+    for categoria in CATEGORIE_CARRELLO:
+        righe = [RigaOrdine.da_json(voce) for voce in comanda.get(categoria) or []]
+        if righe:
+            contenuto.append(f"\n{categoria.upper()}:")
+            for riga in righe:
+                contenuto.append(f"  {riga.quantita}x {riga.nome:<20} {formatta_euro(riga.prezzo_centesimi)}/cad = {formatta_euro(riga.subtotale_centesimi)}")
     
     contenuto.append("-" * 50)
-    contenuto.append(f"TOTALE: {float(comanda['totale']):.2f}€")
+    contenuto.append(f"TOTALE: {formatta_euro(in_centesimi(comanda['totale']))}")
     contenuto.append("=" * 50)
     
     return "\n".join(contenuto)
@@ -149,30 +164,18 @@ def formatta_comanda_per_stampa(comanda_id: str) -> str:
 def aggiorna_profilo_cliente(user_id: str, info_cliente: Dict) -> None:
     """
     Aggiorna o crea il profilo del cliente nel database Supabase
+    (versione sincrona, per l'uso fuori dal server; il server usa RepositoryAsync)
     
     Args:
         user_id: ID utente
         info_cliente: Informazioni del cliente (nome, telefono, indirizzo)
     """
     # Prepara i dati del cliente
-    cliente_data = {
-        "user_id": user_id,
-        "nome": info_cliente['nome'],
-        "telefono": info_cliente['telefono'],
-        "indirizzo": info_cliente['indirizzo'],
-        "ultimo_aggiornamento": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    }
-    
-    # Verifica se il cliente esiste già (usando il telefono come chiave)
-    response = supabase.table("clienti").select("*").eq("telefono", info_cliente['telefono']).execute()
+    cliente_data = prepara_dati_cliente(user_id, info_cliente)
     
-    if response.data and len(response.data) > 0:
-        # Cliente esistente, aggiorna i dati
-        cliente_id = response.data[0]['id']  # Assumiamo che 'id' sia la chiave primaria
-        supabase.table("clienti").update(cliente_data).eq("id", cliente_id).execute()
-    else:
-        # Nuovo cliente, inserisci i dati
-        supabase.table("clienti").insert(cliente_data).execute()
+    # Upsert sul telefono (vincolo unique): aggiorna il cliente esistente o lo inserisce
+    supabase = ottieni_client()
+    supabase.table("clienti").upsert(cliente_data, on_conflict="telefono").execute()
 
 def aggiorna_file_clienti(info_cliente: Dict) -> None:
     """
@@ -185,29 +188,7 @@ def aggiorna_file_clienti(info_cliente: Dict) -> None:
     # Non fa nulla - i dati sono già salvati in Supabase
     pass
 
-def _conta_prodotti(prodotti: List[Dict]) -> Dict[str, tuple]:
-    """
-    Conta i prodotti raggruppandoli per nome
-    
-    Args:
-        prodotti: Lista di prodotti
-        
-    Returns:
-        Dizionario con conteggio e prezzo per ogni prodotto
-    """
-    conteggio = {}
-    for prodotto in prodotti:
-        nome = prodotto["nome"]
-        prezzo = prodotto["prezzo"]
-        
-        if nome in conteggio:
-            conteggio[nome] = (conteggio[nome][0] + 1, prezzo)
-        else:
-            conteggio[nome] = (1, prezzo)
-    
-    return conteggio
-
-def cerca_comande_cliente(telefono: str) -> List[Dict]:
+async def cerca_comande_cliente(telefono: str) -> List[Dict]:
     """
     Cerca tutte le comande di un cliente utilizzando il numero di telefono
     
@@ -217,81 +198,117 @@ def cerca_comande_cliente(telefono: str) -> List[Dict]:
     Returns:
         Lista delle comande del cliente
     """
-    response = supabase.table("comande").select("*").eq("telefono_cliente", telefono).order("data", desc=True).execute()
-    return response.data
+    return await ottieni_repository().comande_per_telefono(telefono)
 
 # ===== FUNZIONI PER LA DASHBOARD =====
 
-def ottieni_comande_dashboard(filtro: str = "tutte") -> List[Dict]:
+def _codifica_cursore(comanda: Dict) -> str:
+    """Cursore opaco per la pagina successiva: chiave (data, ora, comanda_id) dell'ultima riga"""
+    chiave = [comanda.get("data") or "", comanda.get("ora") or "", comanda.get("comanda_id") or ""]
+    return base64.urlsafe_b64encode(json.dumps(chiave).encode("utf-8")).decode("ascii")
+
+def _decodifica_cursore(cursore: str) -> Tuple[str, str, str]:
+    """
+    Chiave della riga da cui riprendere
+
+    Raises:
+        ValueError: Se il cursore non è valido
+    """
+    try:
+        data, ora, comanda_id = json.loads(base64.urlsafe_b64decode(cursore.encode("ascii")))
+    except Exception:
+        raise ValueError("Cursore non valido")
+    return str(data), str(ora), str(comanda_id)
+
+# Colonne da cui si ricava l'orario di consegna (vedi statistiche.consegna_prevista)
+_COLONNE_CONSEGNA = ("consegna_prevista", "orario_consegna")
+
+def _filtri_comande(filtro: str, adesso: datetime) -> List[Tuple[str, str]]:
     """
-    Ottiene le comande formattate per la dashboard
+    Condizioni PostgREST di un filtro della dashboard: in corso = consegna
+    nelle prossime ORE_IN_CORSO ore, completate = consegna di oggi già passata.
+    Le righe senza consegna_prevista (salvate prima della colonna, se non è
+    stato eseguito l'aggiornamento del README) usano data e orario_consegna.
+    Le alternative stanno in un "and" perché il cursore usa già il parametro "or".
     
     Args:
-        filtro: Filtro da applicare ('tutte', 'oggi', 'in_corso', 'completate', 'future')
+        filtro: Uno dei FILTRI_COMANDE
+        adesso: Istante di riferimento
         
     Returns:
-        Lista di comande formattate per la dashboard
+        Lista di coppie (colonna, condizione)
     """
-    # Determina gli stati delle comande per il filtro e l'ordinamento
-    oggi = date.today().strftime('%Y-%m-%d')
-    ora = datetime.now().strftime('%H:%M:%S')
-    
-    # Query base per recuperare le comande
-    query = supabase.table("comande").select("*")
-    
-    # Applica i filtri
+    oggi = adesso.strftime('%Y-%m-%d')
+    istante = adesso.strftime('%Y-%m-%dT%H:%M:%S')
+    ora = adesso.strftime('%H:%M')
     if filtro == "oggi":
-        query = query.eq("data", oggi)
-    elif filtro == "in_corso":
-        query = query.eq("data", oggi).lt("orario_consegna", (datetime.now() + timedelta(hours=2)).strftime('%H:%M:%S'))
-    elif filtro == "completate":
-        query = query.eq("data", oggi).lt("ora", ora)
-    elif filtro == "future":
-        query = query.gt("data", oggi)
-    
-    # Ordina per data e ora
-    query = query.order("data", desc=True).order("ora", desc=True)
-    
-    # Esegui la query
-    response = query.execute()
-    
-    if not response.data:
-        return []
-    
-    # Arricchisci i dati per la dashboard
-    comande_formattate = []
-    for comanda in response.data:
-        # Determina lo stato della comanda
-        data_comanda = comanda.get('data', '')
-        ora_comanda = comanda.get('ora', '')
-        orario_consegna = comanda.get('orario_consegna', '')
-        
-        if data_comanda == oggi and orario_consegna > ora:
-            stato = "in_corso"
-        elif data_comanda == oggi and orario_consegna <= ora:
-            stato = "completato"
-        elif data_comanda > oggi:
-            stato = "futuro"
-        else:
-            stato = "storico"
-        
-        # Aggiungi il campo stato
-        comanda['stato'] = stato
-        
-        # Calcola il totale delle pizze, fritti e bevande
-        comanda['num_pizze'] = len(comanda.get('pizze', []))
-        comanda['num_fritti'] = len(comanda.get('fritti', []))
-        comanda['num_bevande'] = len(comanda.get('bevande', []))
+        return [("data", f"eq.{oggi}")]
+    if filtro == "future":
+        return [("data", f"gt.{oggi}")]
+    if filtro == "in_corso":
+        fine = adesso + timedelta(hours=ORE_IN_CORSO)
+        # Per il formato storico la finestra si ferma a mezzanotte
+        ora_fine = fine.strftime('%H:%M') if fine.date() == adesso.date() else "23:59"
+        return [("and", f'(or(and(consegna_prevista.gt."{istante}",consegna_prevista.lte."{fine.strftime("%Y-%m-%dT%H:%M:%S")}"),'
+                        f'and(consegna_prevista.is.null,data.eq."{oggi}",orario_consegna.gt."{ora}",orario_consegna.lte."{ora_fine}")))')]
+    if filtro == "completate":
+        return [("data", f"eq.{oggi}"),
+                ("and", f'(or(consegna_prevista.lte."{istante}",and(consegna_prevista.is.null,orario_consegna.lte."{ora}")))')]
+    return []
+
+async def ottieni_comande_dashboard(filtro: str = "tutte", colonne: Optional[List[str]] = None,
+                                    limite: int = 50, cursore: Optional[str] = None) -> Dict:
+    """
+    Ottiene una pagina di comande per la dashboard, dalla più recente.
+    I filtri sono applicati dal database sulle colonne calcolate al salvataggio
+    (consegna_prevista), e vengono lette solo le colonne richieste.
+    
+    Args:
+        filtro: Filtro da applicare ('tutte', 'oggi', 'in_corso', 'completate', 'future')
+        colonne: Colonne da restituire (vedi COLONNE_COMANDE_DASHBOARD), quelle predefinite se None
+        limite: Comande per pagina
+        cursore: Cursore restituito dalla pagina precedente, None per la prima
         
-        # Aggiungi il totale dei prodotti
-        comanda['num_prodotti'] = comanda['num_pizze'] + comanda['num_fritti'] + comanda['num_bevande']
+    Returns:
+        Dizionario con le comande della pagina e il cursore della successiva (None se è l'ultima)
         
-        # Aggiungi la comanda formattata alla lista
-        comande_formattate.append(comanda)
+    Raises:
+        ValueError: Se filtro, colonne o cursore non sono validi
+    """
+    if filtro not in FILTRI_COMANDE:
+        raise ValueError(f"Filtro non valido, usa uno tra: {', '.join(FILTRI_COMANDE)}")
+    colonne = colonne or COLONNE_COMANDE_PREDEFINITE
+    sconosciute = [colonna for colonna in colonne if colonna not in COLONNE_COMANDE_DASHBOARD]
+    if sconosciute:
+        raise ValueError(f"Colonne non disponibili: {', '.join(sconosciute)}")
+    dopo = _decodifica_cursore(cursore) if cursore else None
+    
+    adesso = datetime.now()
+    filtri = _filtri_comande(filtro, adesso)
+    
+    # Le colonne della chiave servono per il cursore, quelle della consegna per lo stato
+    richieste = [colonna for colonna in colonne if colonna != "stato"]
+    selezione = ",".join(dict.fromkeys([*richieste, "data", "ora", "comanda_id", *_COLONNE_CONSEGNA]))
+    comande = await ottieni_repository().pagina_comande(
+        dopo, colonne=selezione, limite=limite + 1, filtri=filtri, decrescente=True
+    )
     
-    return comande_formattate
+    pagina = []
+    for comanda in comande[:limite]:
+        # Le comande salvate prima della colonna consegna_prevista la ricavano da data e orario
+        consegna = consegna_prevista(comanda)
+        riga = {colonna: comanda.get(colonna) for colonna in richieste}
+        if "consegna_prevista" in riga:
+            riga["consegna_prevista"] = consegna
+        if "stato" in colonne:
+            riga["stato"] = stato_comanda(consegna, comanda.get("data"), adesso)
+        pagina.append({colonna: riga[colonna] for colonna in colonne})
+    
+    # Una riga in più dice se esiste la pagina successiva
+    successiva = _codifica_cursore(comande[limite - 1]) if len(comande) > limite else None
+    return {"comande": pagina, "cursore": successiva}
 
-def ottieni_dettaglio_comanda_dashboard(comanda_id: str) -> Dict:
+async def ottieni_dettaglio_comanda_dashboard(comanda_id: str) -> Dict:
     """
     Ottiene i dettagli formattati di una singola comanda per la dashboard
     
@@ -301,13 +318,11 @@ def ottieni_dettaglio_comanda_dashboard(comanda_id: str) -> Dict:
     Returns:
         Dizionario con dettagli formattati della comanda
     """
-    response = supabase.table("comande").select("*").eq("comanda_id", comanda_id).execute()
+    comanda = await ottieni_repository().ottieni_comanda(comanda_id)
     
-    if not response.data or len(response.data) == 0:
+    if not comanda:
         return {"errore": "Comanda non trovata"}
     
-    comanda = response.data[0]
-    
     # Formato HTML per la stampa
     html_formattato = f"""
     <div class="comanda-container">
@@ -332,42 +347,21 @@ def ottieni_dettaglio_comanda_dashboard(comanda_id: str) -> Dict:
             <h3>PRODOTTI ORDINATI</h3>
     """
     
-    # Aggiungi le pizze
-    pizze = comanda.get("pizze", [])
-    if pizze:
-        html_formattato += "<div class='categoria-prodotti'><h4>PIZZE</h4><ul>"
-        for pizza in pizze:
-            prezzo = float(pizza["prezzo"]) if isinstance(pizza["prezzo"], str) else pizza["prezzo"]
-            quantita = int(pizza["quantita"])
-            html_formattato += f"<li>{quantita}x {pizza['nome']} - {prezzo:.2f}€/cad = {quantita * prezzo:.2f}€</li>"
-        html_formattato += "</ul></div>"
-    
-    # Aggiungi i fritti
-    fritti = comanda.get("fritti", [])
-    if fritti:
-        html_formattato += "<div class='categoria-prodotti'><h4>FRITTI</h4><ul>"
-        for fritto in fritti:
-            prezzo = float(fritto["prezzo"]) if isinstance(fritto["prezzo"], str) else fritto["prezzo"]
-            quantita = int(fritto["quantita"])
-            html_formattato += f"<li>{quantita}x {fritto['nome']} - {prezzo:.2f}€/cad = {quantita * prezzo:.2f}€</li>"
-        html_formattato += "</ul></div>"
-    
-    # Aggiungi le bevande
-    bevande = comanda.get("bevande", [])
-    if bevande:
-        html_formattato += "<div class='categoria-prodotti'><h4>BEVANDE</h4><ul>"
-        for bevanda in bevande:
-            prezzo = float(bevanda["prezzo"]) if isinstance(bevanda["prezzo"], str) else bevanda["prezzo"]
-            quantita = int(bevanda["quantita"])
-            html_formattato += f"<li>{quantita}x {bevanda['nome']} - {prezzo:.2f}€/cad = {quantita * prezzo:.2f}€</li>"
-        html_formattato += "</ul></div>"
+    # Aggiungi pizze, fritti e bevande
+    for categoria in CATEGORIE_CARRELLO:
+        righe = [RigaOrdine.da_json(voce) for voce in comanda.get(categoria) or []]
+        if righe:
+            html_formattato += f"<div class='categoria-prodotti'><h4>{categoria.upper()}</h4><ul>"
+            for riga in righe:
+                html_formattato += f"<li>{riga.quantita}x {riga.nome} - {formatta_euro(riga.prezzo_centesimi)}/cad = {formatta_euro(riga.subtotale_centesimi)}</li>"
+            html_formattato += "</ul></div>"
     
     # Chiusura e totale
     html_formattato += f"""
         </div>
         
         <div class="comanda-footer">
-            <h3>TOTALE: {float(comanda['totale']):.2f}€</h3>
+            <h3>TOTALE: {formatta_euro(in_centesimi(comanda['totale']))}</h3>
         </div>
     </div>
     """
@@ -376,10 +370,10 @@ def ottieni_dettaglio_comanda_dashboard(comanda_id: str) -> Dict:
     return {
         "dati": comanda,
         "html": html_formattato,
-        "testo": formatta_comanda_per_stampa(comanda_id)
+        "testo": _formatta_testo_comanda(comanda)
     }
 
-def ottieni_statistiche_giornaliere() -> Dict:
+async def ottieni_statistiche_giornaliere() -> Dict:
     """
     Ottiene le statistiche giornaliere per la dashboard
     
@@ -388,14 +382,14 @@ def ottieni_statistiche_giornaliere() -> Dict:
     """
     oggi = date.today().strftime('%Y-%m-%d')
     
-    # Statistiche comande di oggi
-    response_oggi = supabase.table("comande").select("*").eq("data", oggi).execute()
-    comande_oggi = response_oggi.data if response_oggi.data else []
-    
-    # Statistiche ultime 24 ore
     ieri = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
-    response_24h = supabase.table("comande").select("*").gte("timestamp_creazione", ieri).execute()
-    comande_24h = response_24h.data if response_24h.data else []
+    
+    # Comande di oggi e delle ultime 24 ore, recuperate in parallelo
+    repository = ottieni_repository()
+    comande_oggi, comande_24h = await asyncio.gather(
+        repository.lista_comande_finestra(da=oggi, a=oggi),
+        repository.lista_comande_finestra(da=ieri, colonna="timestamp_creazione")
+    )
     
     # Calcolo statistiche
     totale_oggi = sum(float(c['totale']) for c in comande_oggi)
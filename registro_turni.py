@@ -0,0 +1,196 @@
+import glob
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+# Cartella predefinita del registro dei turni di conversazione
+CARTELLA_REGISTRO = os.getenv("TURN_LOG_DIR", os.path.join("data", "registro_turni"))
+
+# Prefisso ed estensione dei segmenti (es. turni-000001.ndjson)
+_PREFISSO_SEGMENTO = "turni-"
+_ESTENSIONE_SEGMENTO = ".ndjson"
+
+
+class RegistroTurni:
+    """
+    Registro append-only dei turni di conversazione, diviso in segmenti NDJSON.
+    Le righe vengono accumulate in memoria e scritte a blocchi; quando un
+    segmento supera la dimensione massima se ne apre uno nuovo e i più
+    vecchi oltre il limite vengono eliminati.
+    """
+
+    def __init__(self, cartella: str = CARTELLA_REGISTRO, dimensione_segmento: int = 8 * 1024 * 1024,
+                 dimensione_buffer: int = 64 * 1024, intervallo_scrittura: float = 1.0,
+                 massimo_segmenti: int = 50):
+        """
+        Inizializza il registro
+
+        Args:
+            cartella: Cartella dei segmenti
+            dimensione_segmento: Byte oltre i quali si passa a un nuovo segmento
+            dimensione_buffer: Byte accumulati in memoria prima di scrivere su disco
+            intervallo_scrittura: Secondi massimi tra due scritture su disco
+            massimo_segmenti: Segmenti conservati (0 per conservarli tutti)
+        """
+        self.cartella = cartella
+        self.dimensione_segmento = dimensione_segmento
+        self.dimensione_buffer = dimensione_buffer
+        self.intervallo_scrittura = intervallo_scrittura
+        self.massimo_segmenti = massimo_segmenti
+        self._buffer: List[bytes] = []
+        self._byte_in_buffer = 0
+        self._ultima_scrittura = time.monotonic()
+        self._lock = threading.Lock()
+        self._segmento_corrente: Optional[str] = None
+
+    def registra(self, sessione: str, stato_prima: Optional[str], stato_dopo: Optional[str],
+                 messaggio: str, risposta: str, latenza_ms: float) -> None:
+        """
+        Registra un turno di conversazione
+
+        Args:
+            sessione: ID della sessione (user_id)
+            stato_prima: Stato dell'ordine prima del messaggio
+            stato_dopo: Stato dell'ordine dopo la risposta (None se l'ordine è concluso)
+            messaggio: Messaggio del cliente
+            risposta: Risposta del chatbot
+            latenza_ms: Tempo di elaborazione del turno in millisecondi
+        """
+        riga = json.dumps({
+            "t": round(time.time(), 3),
+            "sessione": sessione,
+            "stato_prima": stato_prima,
+            "stato_dopo": stato_dopo,
+            "messaggio": messaggio,
+            "risposta": risposta,
+            "latenza_ms": round(latenza_ms, 1)
+        }, ensure_ascii=False).encode("utf-8") + b"\n"
+
+        with self._lock:
+            self._buffer.append(riga)
+            self._byte_in_buffer += len(riga)
+            da_scrivere = (self._byte_in_buffer >= self.dimensione_buffer
+                           or time.monotonic() - self._ultima_scrittura >= self.intervallo_scrittura)
+        if da_scrivere:
+            self.scrivi()
+
+    def scrivi(self) -> None:
+        """Scrive su disco le righe accumulate, ruotando il segmento se necessario"""
+        with self._lock:
+            self._ultima_scrittura = time.monotonic()
+            if not self._buffer:
+                return
+            blocco = b"".join(self._buffer)
+            self._buffer.clear()
+            self._byte_in_buffer = 0
+            try:
+                percorso = self._segmento_da_scrivere()
+                with open(percorso, "ab") as f:
+                    f.write(blocco)
+            except OSError as e:
+                print(f"Errore nella scrittura del registro dei turni: {str(e)}")
+
+    def _segmento_da_scrivere(self) -> str:
+        """Segmento corrente, oppure uno nuovo se quello corrente è pieno"""
+        if self._segmento_corrente is None:
+            os.makedirs(self.cartella, exist_ok=True)
+            segmenti = self.segmenti()
+            self._segmento_corrente = segmenti[-1] if segmenti else self._percorso_segmento(1)
+
+        if os.path.exists(self._segmento_corrente) and os.path.getsize(self._segmento_corrente) >= self.dimensione_segmento:
+            numero = int(os.path.basename(self._segmento_corrente)[len(_PREFISSO_SEGMENTO):-len(_ESTENSIONE_SEGMENTO)])
+            self._segmento_corrente = self._percorso_segmento(numero + 1)
+            self._elimina_segmenti_vecchi()
+        return self._segmento_corrente
+
+    def _percorso_segmento(self, numero: int) -> str:
+        return os.path.join(self.cartella, f"{_PREFISSO_SEGMENTO}{numero:06d}{_ESTENSIONE_SEGMENTO}")
+
+    def _elimina_segmenti_vecchi(self) -> None:
+        """Elimina i segmenti più vecchi oltre il limite (il nuovo segmento conta nel limite)"""
+        if not self.massimo_segmenti:
+            return
+        segmenti = self.segmenti()
+        for percorso in segmenti[:max(0, len(segmenti) - self.massimo_segmenti + 1)]:
+            os.remove(percorso)
+
+    def segmenti(self) -> List[str]:
+        """Percorsi dei segmenti, dal più vecchio"""
+        return sorted(glob.glob(os.path.join(self.cartella, f"{_PREFISSO_SEGMENTO}*{_ESTENSIONE_SEGMENTO}")))
+
+    def scansiona(self, contiene: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Legge i turni registrati, dal più vecchio, mappando i segmenti in memoria
+
+        Args:
+            contiene: Testo opzionale: vengono decodificate solo le righe che lo contengono
+
+        Returns:
+            Iteratore dei turni
+        """
+        self.scrivi()
+        filtro = contiene.encode("utf-8") if contiene else None
+        for percorso in self.segmenti():
+            if os.path.getsize(percorso) == 0:
+                continue
+            with open(percorso, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mappa:
+                inizio = 0
+                fine_file = len(mappa)
+                while inizio < fine_file:
+                    fine = mappa.find(b"\n", inizio)
+                    if fine < 0:
+                        fine = fine_file
+                    if filtro is None or mappa.find(filtro, inizio, fine) >= 0:
+                        try:
+                            yield json.loads(mappa[inizio:fine])
+                        except ValueError:
+                            pass  # Riga incompleta (es. scrittura interrotta)
+                    inizio = fine + 1
+
+    def chiudi(self) -> None:
+        """Scrive le righe ancora in memoria"""
+        self.scrivi()
+
+
+def analizza(registro: RegistroTurni, soglia_lenti_ms: float = 2000) -> Dict:
+    """
+    Riassume il registro: latenze, turni lenti e stato finale delle sessioni
+
+    Args:
+        registro: Registro da analizzare
+        soglia_lenti_ms: Latenza oltre la quale un turno è considerato lento
+
+    Returns:
+        Dizionario con le statistiche
+    """
+    latenze = []
+    lenti = []
+    ultimo_stato = {}  # sessione -> stato dopo l'ultimo turno
+    for turno in registro.scansiona():
+        latenze.append(turno["latenza_ms"])
+        if turno["latenza_ms"] >= soglia_lenti_ms:
+            lenti.append(turno)
+        ultimo_stato[turno["sessione"]] = turno["stato_dopo"] or "completato"
+
+    latenze.sort()
+    abbandoni = {}
+    for stato in ultimo_stato.values():
+        abbandoni[stato] = abbandoni.get(stato, 0) + 1
+    return {
+        "turni": len(latenze),
+        "sessioni": len(ultimo_stato),
+        "latenza_p50_ms": latenze[len(latenze) // 2] if latenze else 0,
+        "latenza_p95_ms": latenze[int(len(latenze) * 0.95)] if latenze else 0,
+        "turni_lenti": len(lenti),
+        "stato_finale_sessioni": dict(sorted(abbandoni.items(), key=lambda x: x[1], reverse=True))
+    }
+
+
+if __name__ == "__main__":
+    # Uso: python registro_turni.py [cartella]
+    cartella = sys.argv[1] if len(sys.argv) > 1 else CARTELLA_REGISTRO
+    print(json.dumps(analizza(RegistroTurni(cartella)), indent=2, ensure_ascii=False))
@@ -0,0 +1,291 @@
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from database import http2_disponibile, limiti_pool, timeout_supabase
+from resilienza import CircuitBreaker, con_resilienza
+
+# Repository condiviso, creato al primo utilizzo
+_repository: Optional["RepositoryAsync"] = None
+
+
+def errore_di_supabase(errore: Exception) -> bool:
+    """
+    Indica se un errore è un guasto di Supabase: errori 5xx, di rete o scadenze.
+    Le risposte 4xx riguardano la richiesta e non aprono il circuit breaker.
+    """
+    if isinstance(errore, httpx.HTTPStatusError):
+        return errore.response.status_code >= 500
+    return True
+
+
+class RepositoryAsync:
+    """
+    Accesso asincrono alle tabelle Supabase tramite l'API REST (PostgREST).
+    Tutte le query condividono un pool di connessioni keep-alive e non
+    bloccano il ciclo di eventi; passano da un circuit breaker, hanno una
+    scadenza e, se sono letture, vengono ripetute in caso di errore.
+    """
+
+    def __init__(self, supabase_url: str, supabase_key: str, limiti: Optional[httpx.Limits] = None,
+                 timeout: Optional[httpx.Timeout] = None, breaker: Optional[CircuitBreaker] = None,
+                 scadenza: float = 8, tentativi_lettura: int = 3):
+        """
+        Inizializza il client HTTP asincrono
+
+        Args:
+            supabase_url: URL del progetto Supabase
+            supabase_key: Chiave API di Supabase
+            limiti: Limiti del pool di connessioni (quelli di database.limiti_pool se None)
+            timeout: Timeout delle richieste (quello di database.timeout_supabase se None)
+            breaker: Circuit breaker di Supabase
+            scadenza: Tempo massimo in secondi di ogni operazione, tentativi compresi
+            tentativi_lettura: Tentativi per le letture (le scritture non vengono ripetute)
+        """
+        self.breaker = breaker or CircuitBreaker("supabase")
+        self.scadenza = scadenza
+        self.tentativi_lettura = tentativi_lettura
+        self._http = httpx.AsyncClient(
+            base_url=f"{supabase_url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": supabase_key,
+                "Authorization": f"Bearer {supabase_key}"
+            },
+            http2=http2_disponibile(),
+            limits=limiti or limiti_pool(),
+            timeout=timeout or timeout_supabase()
+        )
+
+    async def _esegui(self, richiesta, tentativi: int = 1) -> Any:
+        """
+        Esegue una richiesta HTTP tramite il circuit breaker
+
+        Args:
+            richiesta: Funzione senza argomenti che restituisce la coroutine della richiesta
+            tentativi: Numero massimo di tentativi
+
+        Returns:
+            Il corpo JSON della risposta (None se vuoto)
+        """
+        async def chiamata():
+            risposta = await richiesta()
+            risposta.raise_for_status()
+            return risposta.json() if risposta.content else None
+
+        return await con_resilienza(self.breaker, chiamata, self.scadenza, tentativi, guasto=errore_di_supabase)
+
+    async def _seleziona(self, tabella: str, filtri: Sequence[Tuple[str, str]] = (),
+                         colonne: str = "*", ordine: Optional[str] = None,
+                         limite: Optional[int] = None) -> List[Dict]:
+        """
+        Esegue una select su una tabella
+
+        Args:
+            tabella: Nome della tabella
+            filtri: Coppie (colonna, condizione PostgREST), es. ("data", "gte.2024-01-01")
+            colonne: Colonne da restituire
+            ordine: Ordinamento PostgREST, es. "data.desc,ora.desc"
+            limite: Numero massimo di righe
+
+        Returns:
+            Lista delle righe trovate
+        """
+        parametri = [("select", colonne), *filtri]
+        if ordine:
+            parametri.append(("order", ordine))
+        if limite is not None:
+            parametri.append(("limit", str(limite)))
+        return await self._esegui(
+            lambda: self._http.get(f"/{tabella}", params=parametri), self.tentativi_lettura
+        )
+
+    async def _inserisci(self, tabella: str, dati: Dict) -> Dict:
+        """Inserisce una riga e la restituisce come salvata dal database"""
+        righe = await self._esegui(
+            lambda: self._http.post(f"/{tabella}", json=dati, headers={"Prefer": "return=representation"})
+        )
+        return righe[0] if righe else dati
+
+    # ===== COMANDE =====
+
+    async def inserisci_comanda(self, comanda: Dict) -> Dict:
+        """
+        Salva una nuova comanda
+
+        Args:
+            comanda: Dati della comanda (vedi profilo.prepara_dati_comanda)
+
+        Returns:
+            La comanda salvata
+        """
+        return await self._inserisci("comande", comanda)
+
+    async def ottieni_comanda(self, comanda_id: str) -> Optional[Dict]:
+        """
+        Recupera una comanda dal suo ID
+
+        Args:
+            comanda_id: ID della comanda
+
+        Returns:
+            La comanda, oppure None se non esiste
+        """
+        righe = await self._seleziona("comande", [("comanda_id", f"eq.{comanda_id}")], limite=1)
+        return righe[0] if righe else None
+
+    async def lista_comande(self, colonne: str = "*") -> List[Dict]:
+        """Recupera tutte le comande"""
+        return await self._seleziona("comande", colonne=colonne)
+
+    async def lista_comande_finestra(self, da: Optional[str] = None, a: Optional[str] = None,
+                                     colonna: str = "data", filtri: Sequence[Tuple[str, str]] = (),
+                                     colonne: str = "*") -> List[Dict]:
+        """
+        Recupera le comande in una finestra temporale, dalla più recente
+
+        Args:
+            da: Inizio della finestra (incluso), es. "2024-05-01"
+            a: Fine della finestra (inclusa)
+            colonna: Colonna su cui applicare la finestra
+            filtri: Condizioni PostgREST aggiuntive
+            colonne: Colonne da restituire
+
+        Returns:
+            Lista delle comande
+        """
+        condizioni = list(filtri)
+        if da is not None:
+            condizioni.append((colonna, f"gte.{da}"))
+        if a is not None:
+            condizioni.append((colonna, f"lte.{a}"))
+        return await self._seleziona("comande", condizioni, colonne=colonne, ordine="data.desc,ora.desc")
+
+    async def pagina_comande(self, dopo: Optional[Tuple[str, str, str]] = None, da: Optional[str] = None,
+                             a: Optional[str] = None, colonne: str = "*", limite: int = 1000,
+                             filtri: Sequence[Tuple[str, str]] = (), decrescente: bool = False) -> List[Dict]:
+        """
+        Recupera una pagina di comande ordinate per (data, ora, comanda_id) con
+        paginazione keyset: ogni pagina parte dalla chiave dell'ultima riga della
+        precedente, quindi il costo di una pagina non dipende da quante ne sono
+        state lette prima
+
+        Args:
+            dopo: Chiave (data, ora, comanda_id) dell'ultima riga già letta, None per la prima pagina
+            da: Primo giorno (incluso), es. "2024-05-01"
+            a: Ultimo giorno (incluso)
+            colonne: Colonne da restituire (devono comprendere data, ora e comanda_id)
+            limite: Righe per pagina
+            filtri: Condizioni PostgREST aggiuntive
+            decrescente: Se True dalla comanda più recente, altrimenti in ordine cronologico
+
+        Returns:
+            Lista delle comande, vuota dopo l'ultima pagina
+        """
+        condizioni = list(filtri)
+        if da is not None:
+            condizioni.append(("data", f"gte.{da}"))
+        if a is not None:
+            condizioni.append(("data", f"lte.{a}"))
+        if dopo is not None:
+            data, ora, comanda_id = (f'"{valore}"' for valore in dopo)
+            op = "lt" if decrescente else "gt"
+            condizioni.append(("or", f"(data.{op}.{data},and(data.eq.{data},ora.{op}.{ora}),"
+                                     f"and(data.eq.{data},ora.eq.{ora},comanda_id.{op}.{comanda_id}))"))
+        verso = "desc" if decrescente else "asc"
+        return await self._seleziona(
+            "comande", condizioni, colonne=colonne,
+            ordine=f"data.{verso},ora.{verso},comanda_id.{verso}", limite=limite
+        )
+
+    async def comande_per_telefono(self, telefono: str) -> List[Dict]:
+        """
+        Recupera le comande di un cliente dal numero di telefono
+
+        Args:
+            telefono: Numero di telefono del cliente
+
+        Returns:
+            Lista delle comande, dalla più recente
+        """
+        return await self._seleziona(
+            "comande", [("telefono_cliente", f"eq.{telefono}")], ordine="data.desc,ora.desc"
+        )
+
+    # ===== CLIENTI =====
+
+    async def lista_clienti(self, colonne: str = "*") -> List[Dict]:
+        """Recupera tutti i clienti"""
+        return await self._seleziona("clienti", colonne=colonne)
+
+    async def pagina_clienti(self, dopo: Optional[int] = None, colonne: str = "*",
+                             limite: int = 1000) -> List[Dict]:
+        """
+        Recupera una pagina di clienti ordinati per id (paginazione keyset)
+
+        Args:
+            dopo: Id dell'ultimo cliente già letto, None per la prima pagina
+            colonne: Colonne da restituire (devono comprendere id)
+            limite: Righe per pagina
+
+        Returns:
+            Lista dei clienti, vuota dopo l'ultima pagina
+        """
+        condizioni = [("id", f"gt.{dopo}")] if dopo is not None else []
+        return await self._seleziona("clienti", condizioni, colonne=colonne, ordine="id.asc", limite=limite)
+
+    async def upsert_cliente(self, cliente: Dict) -> None:
+        """
+        Aggiorna il cliente con lo stesso telefono, oppure lo inserisce, con un
+        solo upsert PostgREST: due ordini simultanei dello stesso cliente non
+        possono creare due righe (richiede il vincolo unique su clienti.telefono)
+
+        Args:
+            cliente: Dati del cliente (vedi profilo.prepara_dati_cliente)
+        """
+        await self._esegui(lambda: self._http.post(
+            "/clienti", params={"on_conflict": "telefono"}, json=cliente,
+            headers={"Prefer": "resolution=merge-duplicates,return=minimal"}
+        ))
+
+    async def chiudi(self) -> None:
+        """Chiude le connessioni del pool"""
+        await self._http.aclose()
+
+
+def ottieni_repository() -> RepositoryAsync:
+    """
+    Restituisce il repository condiviso, creandolo al primo utilizzo
+
+    Returns:
+        Il repository asincrono
+
+    Raises:
+        RuntimeError: Se le credenziali non sono presenti nel file .env
+    """
+    global _repository
+    if _repository is None:
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_KEY")
+        if not supabase_url or not supabase_key:
+            raise RuntimeError("Credenziali Supabase non trovate nel file .env")
+        _repository = RepositoryAsync(
+            supabase_url,
+            supabase_key,
+            breaker=CircuitBreaker(
+                "supabase",
+                soglia_errori=int(os.getenv("BREAKER_FAILURES", "5")),
+                attesa_secondi=float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+            ),
+            scadenza=float(os.getenv("SUPABASE_DEADLINE", "8")),
+            tentativi_lettura=1 + int(os.getenv("SUPABASE_RETRIES", "2"))
+        )
+    return _repository
+
+
+async def chiudi_repository() -> None:
+    """Chiude il repository condiviso"""
+    global _repository
+    if _repository is not None:
+        await _repository.chiudi()
+        _repository = None
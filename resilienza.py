@@ -0,0 +1,252 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Percorso predefinito della coda locale degli ordini non ancora salvati
+PERCORSO_CODA_ORDINI = os.getenv("ORDER_QUEUE_PATH", os.path.join("data", "ordini_in_attesa.ndjson"))
+
+
+class CircuitoAperto(Exception):
+    """Sollevata quando una dipendenza è esclusa dal circuit breaker"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per una dipendenza esterna.
+    Chiuso: le chiamate passano. Dopo troppi errori consecutivi si apre e le
+    chiamate falliscono subito; trascorsa l'attesa passa a semi-aperto e lascia
+    passare una sola chiamata di prova, che lo richiude o lo riapre.
+    """
+
+    CHIUSO = "chiuso"
+    APERTO = "aperto"
+    SEMI_APERTO = "semi_aperto"
+
+    def __init__(self, nome: str, soglia_errori: int = 5, attesa_secondi: float = 30):
+        """
+        Inizializza il circuit breaker
+
+        Args:
+            nome: Nome della dipendenza (per log e monitoraggio)
+            soglia_errori: Errori consecutivi dopo cui il circuito si apre
+            attesa_secondi: Tempo di apertura prima della chiamata di prova
+        """
+        self.nome = nome
+        self.soglia_errori = soglia_errori
+        self.attesa_secondi = attesa_secondi
+        self.stato = self.CHIUSO
+        self.errori_consecutivi = 0
+        self.aperto_il = 0.0
+        self.prova_in_corso = False
+        self.rifiutate = 0
+        self.aperture = 0
+
+    def consenti(self) -> bool:
+        """
+        Indica se una chiamata può partire
+
+        Returns:
+            True se la chiamata è consentita
+        """
+        if self.stato == self.APERTO:
+            if time.monotonic() - self.aperto_il < self.attesa_secondi:
+                self.rifiutate += 1
+                return False
+            self.stato = self.SEMI_APERTO
+            self.prova_in_corso = False
+        if self.stato == self.SEMI_APERTO:
+            if self.prova_in_corso:
+                self.rifiutate += 1
+                return False
+            self.prova_in_corso = True
+        return True
+
+    def registra_successo(self) -> None:
+        """Una chiamata è riuscita: il circuito si chiude"""
+        if self.stato != self.CHIUSO:
+            print(f"Circuit breaker {self.nome}: chiuso")
+        self.stato = self.CHIUSO
+        self.errori_consecutivi = 0
+        self.prova_in_corso = False
+
+    def rilascia_prova(self) -> None:
+        """La chiamata di prova è terminata senza esito (annullata o errore non della dipendenza)"""
+        self.prova_in_corso = False
+
+    def registra_errore(self) -> None:
+        """Una chiamata è fallita: il circuito si apre oltre la soglia o se era in prova"""
+        self.errori_consecutivi += 1
+        self.prova_in_corso = False
+        if self.stato == self.SEMI_APERTO or self.errori_consecutivi >= self.soglia_errori:
+            if self.stato != self.APERTO:
+                self.aperture += 1
+                print(f"Circuit breaker {self.nome}: aperto dopo {self.errori_consecutivi} errori")
+            self.stato = self.APERTO
+            self.aperto_il = time.monotonic()
+
+    @property
+    def aperto(self) -> bool:
+        """True se le chiamate vengono rifiutate (esclusa la finestra di prova)"""
+        return self.stato == self.APERTO and time.monotonic() - self.aperto_il < self.attesa_secondi
+
+    def statistiche(self) -> Dict:
+        """Stato del circuit breaker per il monitoraggio"""
+        return {
+            "stato": self.stato,
+            "errori_consecutivi": self.errori_consecutivi,
+            "aperture": self.aperture,
+            "chiamate_rifiutate": self.rifiutate,
+            "riapertura_tra_secondi": round(max(0.0, self.attesa_secondi - (time.monotonic() - self.aperto_il)), 1)
+            if self.stato == self.APERTO else 0.0
+        }
+
+
+def attesa_con_jitter(tentativo: int, base: float = 0.2, massimo: float = 5.0) -> float:
+    """
+    Attesa prima di un nuovo tentativo: backoff esponenziale con jitter pieno,
+    così i client non ripetono le chiamate tutti nello stesso istante
+
+    Args:
+        tentativo: Numero del tentativo fallito (da 0)
+        base: Attesa di base in secondi
+        massimo: Attesa massima in secondi
+
+    Returns:
+        Secondi di attesa
+    """
+    return random.uniform(0, min(massimo, base * (2 ** tentativo)))
+
+
+async def con_resilienza(breaker: CircuitBreaker, funzione: Callable[[], Awaitable[Any]],
+                         scadenza: float, tentativi: int = 1, attesa_base: float = 0.2,
+                         guasto: Callable[[Exception], bool] = lambda e: True) -> Any:
+    """
+    Esegue una chiamata a una dipendenza con circuit breaker, scadenza e nuovi tentativi.
+    Il breaker conta un solo esito per chiamata, qualunque sia il numero di tentativi.
+
+    Args:
+        breaker: Circuit breaker della dipendenza
+        funzione: Funzione asincrona senza argomenti che esegue la chiamata
+        scadenza: Tempo massimo complessivo in secondi, nuovi tentativi compresi
+        tentativi: Numero massimo di tentativi
+        attesa_base: Attesa di base del backoff tra i tentativi
+        guasto: Indica se un errore è un guasto della dipendenza; gli altri
+                (es. richieste rifiutate) non vengono ripetuti né contati dal breaker
+
+    Returns:
+        Il risultato della funzione
+
+    Raises:
+        CircuitoAperto: Se il circuito è aperto
+        Exception: L'errore dell'ultimo tentativo (asyncio.TimeoutError se scade)
+    """
+    fine = time.monotonic() + scadenza
+    if not breaker.consenti():
+        raise CircuitoAperto(f"{breaker.nome} non disponibile")
+    prova = breaker.prova_in_corso
+    registrato = False
+    try:
+        for tentativo in range(tentativi):
+            try:
+                risultato = await asyncio.wait_for(funzione(), timeout=max(0.0, fine - time.monotonic()))
+            except Exception as e:
+                if not guasto(e):
+                    raise
+                attesa = attesa_con_jitter(tentativo, attesa_base)
+                if tentativo == tentativi - 1 or time.monotonic() + attesa >= fine:
+                    breaker.registra_errore()
+                    registrato = True
+                    raise
+                print(f"Errore {breaker.nome} (tentativo {tentativo + 1}/{tentativi}): {str(e) or type(e).__name__}")
+                await asyncio.sleep(attesa)
+            else:
+                breaker.registra_successo()
+                registrato = True
+                return risultato
+    finally:
+        # Una prova annullata o fallita per un errore non della dipendenza non deve bloccare il breaker
+        if prova and not registrato:
+            breaker.rilascia_prova()
+
+
+class CodaOrdini:
+    """
+    Coda locale (NDJSON, una voce per riga) dei salvataggi non riusciti,
+    da ripetere quando il database torna disponibile
+    """
+
+    def __init__(self, percorso: str = PERCORSO_CODA_ORDINI):
+        """
+        Inizializza la coda
+
+        Args:
+            percorso: Percorso del file della coda
+        """
+        self.percorso = percorso
+        self._svuotamento_in_corso = False
+
+    def accoda(self, tipo: str, dati: Dict) -> None:
+        """
+        Aggiunge una voce alla coda, scrivendola subito su disco
+
+        Args:
+            tipo: Tipo di salvataggio ("comanda" o "cliente")
+            dati: Riga da salvare nel database
+        """
+        cartella = os.path.dirname(self.percorso)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        with open(self.percorso, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"tipo": tipo, "dati": dati}, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def voci(self) -> List[Dict]:
+        """Voci in attesa, nell'ordine di inserimento"""
+        if not os.path.exists(self.percorso):
+            return []
+        with open(self.percorso, encoding="utf-8") as f:
+            return [json.loads(riga) for riga in f if riga.strip()]
+
+    def __len__(self) -> int:
+        return len(self.voci())
+
+    def _rimuovi_prime(self, numero: int) -> None:
+        """Rimuove le prime voci dal file (quelle aggiunte nel frattempo restano)"""
+        voci = self.voci()[numero:]
+        temporaneo = f"{self.percorso}.tmp"
+        with open(temporaneo, "w", encoding="utf-8") as f:
+            for voce in voci:
+                f.write(json.dumps(voce, default=str) + "\n")
+        os.replace(temporaneo, self.percorso)
+
+    async def ripeti(self, salva: Callable[[str, Dict], Awaitable[None]]) -> int:
+        """
+        Ripete i salvataggi in coda, in ordine, fermandosi al primo errore
+
+        Args:
+            salva: Funzione asincrona (tipo, dati) che salva una voce
+
+        Returns:
+            Numero di voci salvate
+        """
+        if self._svuotamento_in_corso:
+            return 0
+        self._svuotamento_in_corso = True
+        salvate = 0
+        try:
+            for voce in self.voci():
+                try:
+                    await salva(voce["tipo"], voce["dati"])
+                except Exception as e:
+                    print(f"Coda ordini: salvataggio ancora non riuscito ({str(e) or type(e).__name__})")
+                    break
+                salvate += 1
+        finally:
+            if salvate:
+                self._rimuovi_prime(salvate)
+            self._svuotamento_in_corso = False
+        return salvate
@@ -0,0 +1,218 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Parole che non sono mai nomi di prodotti
+PAROLE_VUOTE = {
+    "pizza", "pizze", "vorrei", "voglio", "ordinare", "anche", "solo", "senza",
+    "euro", "grazie", "quanto", "costa", "prezzo", "della", "delle", "nella",
+    "sono", "fare", "porzione", "porzioni", "bottiglia", "bottiglie", "lattina"
+}
+
+
+class Corrispondenza(NamedTuple):
+    """Un prodotto trovato nell'indice"""
+    nome: str          # Nome del prodotto come nel menu
+    categoria: str     # Sezione del menu
+    distanza: int      # Distanza di edit dal testo cercato
+    inizio: int = -1   # Posizione nel testo (solo per trova_nel_testo)
+    fine: int = -1
+
+
+def normalizza(testo: str) -> str:
+    """Minuscolo e senza accenti"""
+    testo = unicodedata.normalize("NFKD", testo.lower())
+    return "".join(c for c in testo if not unicodedata.combining(c))
+
+
+def _trigrammi(testo: str) -> List[str]:
+    """Trigrammi di caratteri del testo, con delimitatori"""
+    testo = f"  {testo} "
+    return [testo[i:i + 3] for i in range(len(testo) - 2)]
+
+
+def distanza_limitata(a: str, b: str, limite: int) -> int:
+    """
+    Distanza di Levenshtein con interruzione anticipata
+
+    Args:
+        a: Primo testo
+        b: Secondo testo
+        limite: Distanza massima di interesse
+
+    Returns:
+        La distanza, oppure limite + 1 se la supera
+    """
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    precedente = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        corrente = [i]
+        minimo_riga = i
+        for j, cb in enumerate(b, 1):
+            valore = min(
+                precedente[j] + 1,
+                corrente[j - 1] + 1,
+                precedente[j - 1] + (ca != cb)
+            )
+            corrente.append(valore)
+            minimo_riga = min(minimo_riga, valore)
+        if minimo_riga > limite:
+            return limite + 1
+        precedente = corrente
+    return precedente[-1] if precedente[-1] <= limite else limite + 1
+
+
+def tolleranza(testo: str) -> int:
+    """Numero di errori ammessi in base alla lunghezza del testo"""
+    return max(1, len(testo) // 4)
+
+
+class IndiceProdotti:
+    """
+    Indice a trigrammi dei nomi dei prodotti e dei loro alias, costruito
+    al caricamento del menu per la ricerca tollerante agli errori di battitura
+    """
+
+    def __init__(self):
+        self.voci = []  # (chiave normalizzata, nome prodotto, categoria)
+        self.esatti = {}  # chiave normalizzata -> indice voce
+        self.trigrammi = defaultdict(list)  # trigramma -> indici voci
+        self.parole_massime = 1
+
+    @classmethod
+    def da_menu(cls, menu_data: Dict, alias: Optional[Dict[str, str]] = None) -> "IndiceProdotti":
+        """
+        Costruisce l'indice dal menu
+
+        Args:
+            menu_data: Menu organizzato per categoria (come in MenuManager)
+            alias: Dizionario opzionale alias -> nome prodotto
+
+        Returns:
+            Un nuovo IndiceProdotti
+        """
+        indice = cls()
+        categorie = {}
+        prime_parole = Counter()
+        for categoria, prodotti in menu_data.items():
+            for nome in prodotti:
+                indice.aggiungi(nome, nome, categoria)
+                categorie[nome] = categoria
+                prime_parole[normalizza(nome).split()[0]] += 1
+
+        # La prima parola del nome vale come alias se non è ambigua (es. "quattro")
+        for categoria, prodotti in menu_data.items():
+            for nome in prodotti:
+                parole = normalizza(nome).split()
+                if len(parole) > 1 and prime_parole[parole[0]] == 1 and parole[0] not in PAROLE_VUOTE:
+                    indice.aggiungi(parole[0], nome, categoria)
+
+        for chiave, nome in (alias or {}).items():
+            if nome in categorie:
+                indice.aggiungi(chiave, nome, categorie[nome])
+        return indice
+
+    def aggiungi(self, chiave: str, nome: str, categoria: str) -> None:
+        """
+        Aggiunge una chiave di ricerca per un prodotto
+
+        Args:
+            chiave: Testo con cui il prodotto può essere cercato
+            nome: Nome del prodotto nel menu
+            categoria: Sezione del menu
+        """
+        chiave = " ".join(normalizza(chiave).split())
+        if not chiave or chiave in self.esatti:
+            return
+        posizione = len(self.voci)
+        self.voci.append((chiave, nome, categoria))
+        self.esatti[chiave] = posizione
+        for trigramma in set(_trigrammi(chiave)):
+            self.trigrammi[trigramma].append(posizione)
+        self.parole_massime = max(self.parole_massime, len(chiave.split()))
+
+    def cerca(self, testo: str, k: int = 3, limite: Optional[int] = None,
+              categorie: Optional[Iterable[str]] = None) -> List[Corrispondenza]:
+        """
+        Cerca i prodotti più simili al testo
+
+        Args:
+            testo: Testo da cercare (es. "diavolla")
+            k: Numero massimo di risultati
+            limite: Distanza di edit massima (predefinita in base alla lunghezza)
+            categorie: Sezioni del menu in cui cercare (tutte se None)
+
+        Returns:
+            Lista di corrispondenze ordinate per distanza
+        """
+        chiave = " ".join(normalizza(testo).split())
+        if not chiave:
+            return []
+        if limite is None:
+            limite = tolleranza(chiave)
+        filtro = set(categorie) if categorie is not None else None
+
+        # Candidati: le voci che condividono almeno un trigramma
+        comuni = Counter()
+        for trigramma in set(_trigrammi(chiave)):
+            for posizione in self.trigrammi.get(trigramma, ()):
+                comuni[posizione] += 1
+
+        risultati = {}
+        for posizione, _ in comuni.most_common(32):
+            voce_chiave, nome, categoria = self.voci[posizione]
+            if filtro is not None and categoria not in filtro:
+                continue
+            distanza = distanza_limitata(chiave, voce_chiave, limite)
+            if distanza <= limite and (nome not in risultati or distanza < risultati[nome].distanza):
+                risultati[nome] = Corrispondenza(nome, categoria, distanza)
+
+        return sorted(risultati.values(), key=lambda c: c.distanza)[:k]
+
+    def trova_nel_testo(self, testo: str, categorie: Optional[Iterable[str]] = None) -> List[Corrispondenza]:
+        """
+        Trova tutti i prodotti menzionati in un messaggio, anche con errori di battitura
+
+        Args:
+            testo: Messaggio del cliente
+            categorie: Sezioni del menu in cui cercare (tutte se None)
+
+        Returns:
+            Lista di corrispondenze non sovrapposte, nell'ordine del testo,
+            con la posizione di ogni menzione nel testo originale
+        """
+        filtro = set(categorie) if categorie is not None else None
+        parole = [(m.start(), m.end(), normalizza(m.group())) for m in re.finditer(r"\w+", testo)]
+        trovati = []
+        i = 0
+        while i < len(parole):
+            migliore = None
+            # Prova prima le sequenze di più parole (es. "quattro stagioni")
+            for n in range(min(self.parole_massime, len(parole) - i), 0, -1):
+                estremi = (parole[i][2], parole[i + n - 1][2])
+                # Numeri, parole brevi e parole vuote non aprono né chiudono un nome
+                if any(p.isdigit() or len(p) < 3 or p in PAROLE_VUOTE for p in estremi):
+                    continue
+                if n == 1 and len(estremi[0]) < 4:
+                    continue
+                finestra = " ".join(p[2] for p in parole[i:i + n])
+                posizione = self.esatti.get(finestra)
+                if posizione is not None:
+                    _, nome, categoria = self.voci[posizione]
+                    if filtro is None or categoria in filtro:
+                        migliore = (Corrispondenza(nome, categoria, 0), n)
+                        break
+                risultati = self.cerca(finestra, k=1, categorie=filtro)
+                if risultati and (migliore is None or risultati[0].distanza < migliore[0].distanza):
+                    migliore = (risultati[0], n)
+
+            if migliore is None:
+                i += 1
+                continue
+
+            corrispondenza, n = migliore
+            trovati.append(corrispondenza._replace(inizio=parole[i][0], fine=parole[i + n - 1][1]))
+            i += n
+        return trovati
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SerializzatoreSessioni:
+    """
+    Esegue i turni di ogni sessione uno alla volta, nell'ordine di arrivo,
+    mentre sessioni diverse procedono in parallelo. Un doppio invio non
+    viene rielaborato e riceve la stessa risposta: con l'ID del messaggio
+    scelto dal client, un ID già visto (es. un nuovo tentativo dopo un errore
+    di rete); senza, un testo identico a uno ancora in elaborazione (es.
+    doppio clic su Invia). Due risposte uguali date una dopo l'altra (es. "no"
+    ai fritti e poi alle bibite) sono invece due turni distinti.
+    """
+
+    def __init__(self, finestra_duplicati: float = 2.0):
+        """
+        Inizializza il serializzatore
+
+        Args:
+            finestra_duplicati: Secondi, dalla risposta, in cui un ID di messaggio già
+                                elaborato riceve ancora la stessa risposta
+        """
+        self.finestra_duplicati = finestra_duplicati
+        self._lock: Dict[str, asyncio.Lock] = {}
+        self._utilizzatori: Dict[str, int] = {}  # sessione -> turni in corso o in attesa
+        # (sessione, "id" o "testo", valore) -> (scadenza, risultato del turno)
+        self._recenti: "OrderedDict[Tuple[str, str, str], Tuple[float, asyncio.Future]]" = OrderedDict()
+        self.duplicati = 0
+
+    @asynccontextmanager
+    async def sessione(self, chiave: str) -> AsyncIterator[None]:
+        """
+        Blocco eseguito in esclusiva per la sessione. Il lock viene
+        eliminato quando nessun turno della sessione è più in attesa.
+
+        Args:
+            chiave: ID della sessione
+        """
+        lock = self._lock.get(chiave)
+        if lock is None:
+            lock = self._lock[chiave] = asyncio.Lock()
+        self._utilizzatori[chiave] = self._utilizzatori.get(chiave, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._utilizzatori[chiave] -= 1
+            if not self._utilizzatori[chiave]:
+                del self._utilizzatori[chiave]
+                del self._lock[chiave]
+
+    async def esegui(self, chiave: str, messaggio: str, funzione: Callable[[], Awaitable[Any]],
+                     id_messaggio: Optional[str] = None) -> Any:
+        """
+        Esegue il turno in esclusiva per la sessione, salvo che sia un duplicato
+
+        Args:
+            chiave: ID della sessione
+            messaggio: Messaggio ricevuto
+            funzione: Funzione asincrona senza argomenti che elabora il turno
+            id_messaggio: ID del messaggio scelto dal client, uguale nei nuovi tentativi
+
+        Returns:
+            Il risultato del turno (quello del turno originale per i duplicati)
+        """
+        adesso = time.monotonic()
+        # I turni in corso hanno scadenza infinita: le voci scadute dopo di loro sono ignorate sotto
+        while self._recenti and next(iter(self._recenti.values()))[0] <= adesso:
+            self._recenti.popitem(last=False)
+
+        identita = (chiave, "id", id_messaggio) if id_messaggio else (chiave, "testo", messaggio)
+        recente = self._recenti.get(identita)
+        if recente is not None and recente[0] > adesso:
+            self.duplicati += 1
+            print(f"DEBUG - Messaggio duplicato ignorato: user_id={chiave}")
+            # shield: se il duplicato viene annullato il turno originale continua
+            return await asyncio.shield(recente[1])
+
+        # Finché il turno è in corso il duplicato attende lo stesso risultato
+        futuro = asyncio.get_running_loop().create_future()
+        self._recenti[identita] = (float("inf"), futuro)
+        try:
+            async with self.sessione(chiave):
+                risultato = await funzione()
+        except BaseException as e:
+            # Un turno fallito non va riproposto ai duplicati successivi
+            self._recenti.pop(identita, None)
+            futuro.set_exception(e)
+            futuro.exception()
+            raise
+        futuro.set_result(risultato)
+        if id_messaggio:
+            # Un nuovo tentativo con lo stesso ID riceve la risposta per la finestra indicata
+            self._recenti[identita] = (time.monotonic() + self.finestra_duplicati, futuro)
+            self._recenti.move_to_end(identita)
+        else:
+            # Senza ID, lo stesso testo inviato dopo la risposta è un nuovo turno
+            self._recenti.pop(identita, None)
+        return risultato
+
+    def statistiche(self) -> Dict:
+        """Sessioni con turni in corso e duplicati ignorati"""
+        return {
+            "sessioni_attive": len(self._lock),
+            "turni_in_corso_o_in_attesa": sum(self._utilizzatori.values()),
+            "duplicati_ignorati": self.duplicati
+        }
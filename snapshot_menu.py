@@ -0,0 +1,87 @@
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+# Versione del formato dello snapshot: snapshot di formati diversi vengono ignorati
+FORMATO_SNAPSHOT = 1
+
+# Percorso predefinito dello snapshot del menu
+PERCORSO_SNAPSHOT = os.getenv("MENU_SNAPSHOT_PATH", os.path.join("data", "menu_snapshot.json.gz"))
+
+
+def _checksum(menu_data: Dict) -> str:
+    """Impronta SHA-256 della forma canonica del menu"""
+    contenuto = json.dumps(menu_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(contenuto.encode("utf-8")).hexdigest()
+
+
+def salva_snapshot(menu_data: Dict, versione: str, percorso: str = PERCORSO_SNAPSHOT) -> bool:
+    """
+    Salva il menu su disco in formato JSON compresso.
+    La scrittura è atomica: un file temporaneo sostituisce lo snapshot precedente.
+
+    Args:
+        menu_data: Menu organizzato per categoria
+        versione: Versione del menu (impronta calcolata da MenuManager)
+        percorso: Percorso del file di snapshot
+
+    Returns:
+        True se lo snapshot è stato salvato
+    """
+    snapshot = {
+        "formato": FORMATO_SNAPSHOT,
+        "versione": versione,
+        "salvato_il": datetime.now().isoformat(timespec="seconds"),
+        "checksum": _checksum(menu_data),
+        "menu": menu_data
+    }
+    temporaneo = f"{percorso}.tmp"
+    try:
+        cartella = os.path.dirname(percorso)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        with gzip.open(temporaneo, "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"), default=str)
+        os.replace(temporaneo, percorso)
+        return True
+    except Exception as e:
+        print(f"Errore nel salvataggio dello snapshot del menu: {str(e)}")
+        return False
+
+
+def carica_snapshot(percorso: str = PERCORSO_SNAPSHOT) -> Optional[Dict]:
+    """
+    Carica lo snapshot del menu, verificandone formato e checksum
+
+    Args:
+        percorso: Percorso del file di snapshot
+
+    Returns:
+        Dizionario con 'menu', 'versione' e 'salvato_il', oppure None se
+        lo snapshot non esiste o non è valido
+    """
+    if not os.path.exists(percorso):
+        return None
+    try:
+        with gzip.open(percorso, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        print(f"Snapshot del menu illeggibile: {str(e)}")
+        return None
+
+    if snapshot.get("formato") != FORMATO_SNAPSHOT:
+        print(f"Snapshot del menu in formato non supportato: {snapshot.get('formato')}")
+        return None
+    menu_data = snapshot.get("menu")
+    if not isinstance(menu_data, dict) or snapshot.get("checksum") != _checksum(menu_data):
+        print("Snapshot del menu corrotto: checksum non valido")
+        return None
+
+    return {
+        "menu": menu_data,
+        "versione": snapshot.get("versione", ""),
+        "salvato_il": snapshot.get("salvato_il")
+    }
@@ -0,0 +1,338 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from carrello import CATEGORIE_CARRELLO, in_centesimi
+
+# Nomi dei giorni della settimana (lunedì = 0)
+GIORNI_SETTIMANA = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
+
+# Ampiezze degli intervalli della serie temporale delle vendite, in minuti
+INTERVALLI_SERIE = {"15m": 15, "1h": 60, "1d": 24 * 60, "1w": 7 * 24 * 60}
+
+# Stati di una comanda mostrati dalla dashboard, derivati dall'orario di consegna
+STATO_IN_CORSO = "In corso"
+STATO_COMPLETATO = "Completato"
+STATO_FUTURO = "Futuro"
+
+# Il 1970-01-01 era un giovedì: spostamento per far iniziare le settimane di lunedì
+_SPOSTAMENTO_LUNEDI_MINUTI = 3 * 24 * 60
+
+
+def voci_prodotti(valore) -> List[Tuple[str, int]]:
+    """
+    Normalizza una colonna prodotti della tabella comande
+
+    Args:
+        valore: Lista JSONB di {nome, prezzo, quantita}, oppure stringa "a, b" (formato storico)
+
+    Returns:
+        Lista di tuple (nome, quantità)
+    """
+    if isinstance(valore, list):
+        return [
+            (voce["nome"], int(voce.get("quantita") or 1))
+            for voce in valore if isinstance(voce, dict) and voce.get("nome")
+        ]
+    if isinstance(valore, str):
+        return [(nome.strip(), 1) for nome in valore.split(",") if nome.strip()]
+    return []
+
+
+def consegna_prevista(comanda: Dict) -> Optional[str]:
+    """
+    Data e ora di consegna di una comanda
+
+    Args:
+        comanda: Riga della tabella comande
+
+    Returns:
+        "AAAA-MM-GGTHH:MM:SS" dalla colonna consegna_prevista oppure, per le comande
+        salvate prima che esistesse, da data e orario_consegna; None se manca l'orario
+    """
+    valore = comanda.get("consegna_prevista")
+    if valore:
+        return str(valore)[:19].replace(" ", "T")
+    data, orario = comanda.get("data"), comanda.get("orario_consegna")
+    if data and orario:
+        return f"{str(data)[:10]}T{str(orario)[:5]}:00"
+    return None
+
+
+def stato_comanda(consegna: Optional[str], data: Optional[str] = None, adesso: Optional[datetime] = None) -> str:
+    """
+    Stato di una comanda all'istante indicato: dipende dall'ora, quindi si
+    calcola alla lettura e solo per le righe restituite
+
+    Args:
+        consegna: Data e ora di consegna (vedi consegna_prevista)
+        data: Giorno dell'ordine "AAAA-MM-GG", usato se manca l'orario di consegna
+        adesso: Istante di riferimento (ora attuale se None)
+
+    Returns:
+        STATO_IN_CORSO, STATO_COMPLETATO oppure STATO_FUTURO
+    """
+    istante = (adesso or datetime.now()).strftime("%Y-%m-%dT%H:%M:%S")
+    if consegna is None:
+        return STATO_COMPLETATO if str(data or "")[:10] < istante[:10] else STATO_IN_CORSO
+    if consegna[:10] > istante[:10]:
+        return STATO_FUTURO
+    return STATO_IN_CORSO if consegna > istante else STATO_COMPLETATO
+
+
+class TabellaComande:
+    """
+    Comande in forma colonnare per le statistiche della dashboard.
+    Ogni comanda è una posizione negli array; i prodotti sono in formato CSR:
+    le righe della comanda i sono id_prodotti[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, comande: List[Dict]):
+        """
+        Costruisce le colonne a partire dalle righe della tabella comande
+
+        Args:
+            comande: Righe della tabella comande
+        """
+        self.comande = comande
+        n = len(comande)
+        self.prodotti: List[str] = []  # id prodotto -> nome
+        id_per_nome: Dict[str, int] = {}
+
+        totali = np.zeros(n, dtype=np.int64)
+        date = []
+        ore = np.full(n, -1, dtype=np.int16)
+        secondi = np.zeros(n, dtype=np.int32)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        id_prodotti = []
+        quantita = []
+        categorie = []
+
+        for i, comanda in enumerate(comande):
+            try:
+                totali[i] = in_centesimi(comanda.get("totale"))
+            except (ArithmeticError, ValueError, TypeError):
+                print(f"Errore nel convertire il totale: {comanda.get('totale')}")
+            date.append((comanda.get("data") or "")[:10] or "NaT")
+            ora = comanda.get("ora") or ""
+            if len(ora) >= 5 and ora[:2].isdigit() and ora[3:5].isdigit():
+                ore[i] = int(ora[:2])
+                secondi[i] = int(ora[:2]) * 3600 + int(ora[3:5]) * 60
+            for codice_categoria, categoria in enumerate(CATEGORIE_CARRELLO):
+                for nome, quanti in voci_prodotti(comanda.get(categoria)):
+                    id_prodotto = id_per_nome.get(nome)
+                    if id_prodotto is None:
+                        id_prodotto = id_per_nome[nome] = len(self.prodotti)
+                        self.prodotti.append(nome)
+                    id_prodotti.append(id_prodotto)
+                    quantita.append(quanti)
+                    categorie.append(codice_categoria)
+            indptr[i + 1] = len(id_prodotti)
+
+        self.totali_centesimi = totali
+        try:
+            giorni = np.array(date, dtype="datetime64[D]")
+        except ValueError:
+            # Date non valide: vengono convertite una per una
+            giorni = np.array([_data_o_nat(d) for d in date], dtype="datetime64[D]")
+        self.data_valida = ~np.isnat(giorni)
+        self.giorni = np.where(self.data_valida, giorni.astype(np.int64), 0).astype(np.int32)  # giorni dal 1970-01-01
+        self.ore = ore
+        self.secondi = secondi  # secondi dalla mezzanotte (ora dell'ordine)
+        self.indptr = indptr
+        self.id_prodotti = np.array(id_prodotti, dtype=np.int32)
+        self.quantita = np.array(quantita, dtype=np.int32)
+        self.categorie = np.array(categorie, dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.totali_centesimi)
+
+    @property
+    def totale_centesimi(self) -> int:
+        return int(self.totali_centesimi.sum())
+
+    def scontrino_medio_centesimi(self) -> float:
+        """Importo medio di una comanda in centesimi"""
+        return float(self.totali_centesimi.mean()) if len(self) else 0.0
+
+    def ricavi_per_giorno(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ricavi raggruppati per giorno
+
+        Returns:
+            Tupla (giorni dal 1970-01-01 in ordine crescente, ricavi in centesimi)
+        """
+        giorni = self.giorni[self.data_valida]
+        if not len(giorni):
+            return np.array([], dtype=np.int32), np.array([], dtype=np.int64)
+        unici, posizioni = np.unique(giorni, return_inverse=True)
+        ricavi = np.bincount(posizioni, weights=self.totali_centesimi[self.data_valida], minlength=len(unici))
+        return unici, ricavi.astype(np.int64)
+
+    def quantita_per_prodotto(self, categoria: Optional[str] = None) -> np.ndarray:
+        """
+        Unità vendute di ogni prodotto
+
+        Args:
+            categoria: Categoria del carrello ("pizze", "fritti", "bevande"), tutte se None
+
+        Returns:
+            Array indicizzato per id prodotto
+        """
+        if categoria is None:
+            selezione = slice(None)
+        else:
+            selezione = self.categorie == CATEGORIE_CARRELLO.index(categoria)
+        return np.bincount(
+            self.id_prodotti[selezione], weights=self.quantita[selezione], minlength=len(self.prodotti)
+        ).astype(np.int64)
+
+    def prodotti_piu_venduti(self, categoria: Optional[str] = None, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Prodotti ordinati per unità vendute
+
+        Args:
+            categoria: Categoria del carrello, tutte se None
+            k: Numero massimo di prodotti (tutti se None)
+
+        Returns:
+            Lista di tuple (nome, unità) dal più venduto
+        """
+        conteggi = self.quantita_per_prodotto(categoria)
+        ordine = np.argsort(-conteggi, kind="stable")
+        ordine = ordine[conteggi[ordine] > 0]
+        if k is not None:
+            ordine = ordine[:k]
+        return [(self.prodotti[i], int(conteggi[i])) for i in ordine]
+
+    def mappa_calore(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Comande e ricavi per giorno della settimana e ora del giorno
+
+        Returns:
+            Tupla di matrici 7x24 (numero di comande, ricavi in centesimi); lunedì = riga 0
+        """
+        validi = self.data_valida & (self.ore >= 0)
+        # Il 1970-01-01 era un giovedì (indice 3)
+        celle = ((self.giorni[validi] + 3) % 7) * 24 + self.ore[validi]
+        comande = np.bincount(celle, minlength=7 * 24).reshape(7, 24)
+        ricavi = np.bincount(celle, weights=self.totali_centesimi[validi], minlength=7 * 24).reshape(7, 24)
+        return comande.astype(np.int64), ricavi.astype(np.int64)
+
+    def piu_recenti(self, k: int = 10) -> np.ndarray:
+        """Posizioni delle k comande più recenti (per data e ora)"""
+        chiave_giorno = np.where(self.data_valida, self.giorni, np.iinfo(np.int32).min)
+        ordine = np.lexsort((-self.secondi, -chiave_giorno.astype(np.int64)))
+        return ordine[:k]
+
+    def minuti(self) -> np.ndarray:
+        """Istante di ogni comanda in minuti dal 1970-01-01 (mezzanotte se manca l'ora)"""
+        return self.giorni.astype(np.int64) * 24 * 60 + self.secondi // 60
+
+    def nomi_prodotti(self, posizione: int) -> List[str]:
+        """Nomi dei prodotti di una comanda"""
+        inizio, fine = self.indptr[posizione], self.indptr[posizione + 1]
+        return [self.prodotti[i] for i in self.id_prodotti[inizio:fine]]
+
+
+def serie_vendite(tabella: TabellaComande, intervallo: str = "1d", da_minuto: Optional[int] = None,
+                  a_minuto: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ricavi e numero di comande per intervallo di tempo, intervalli vuoti compresi
+
+    Args:
+        tabella: Comande in forma colonnare
+        intervallo: Chiave di INTERVALLI_SERIE ("15m", "1h", "1d", "1w")
+        da_minuto: Inizio del periodo in minuti dal 1970-01-01 (prima comanda se None)
+        a_minuto: Fine del periodo, esclusa (ultima comanda se None)
+
+    Returns:
+        Tupla (inizio di ogni intervallo in minuti, ricavi in centesimi, numero di comande)
+    """
+    ampiezza = INTERVALLI_SERIE[intervallo]
+    spostamento = _SPOSTAMENTO_LUNEDI_MINUTI if intervallo == "1w" else 0
+    minuti = tabella.minuti()
+    validi = tabella.data_valida.copy()
+    if da_minuto is not None:
+        validi &= minuti >= da_minuto
+    if a_minuto is not None:
+        validi &= minuti < a_minuto
+    if not validi.any():
+        vuoto = np.array([], dtype=np.int64)
+        return vuoto, vuoto, vuoto
+
+    indici = (minuti[validi] + spostamento) // ampiezza
+    primo = indici.min() if da_minuto is None else (da_minuto + spostamento) // ampiezza
+    ultimo = indici.max() if a_minuto is None else (a_minuto - 1 + spostamento) // ampiezza
+    posizioni = indici - primo
+    numero = int(ultimo - primo + 1)
+    ricavi = np.bincount(posizioni, weights=tabella.totali_centesimi[validi], minlength=numero)
+    comande = np.bincount(posizioni, minlength=numero)
+    inizi = (np.arange(primo, ultimo + 1, dtype=np.int64) * ampiezza) - spostamento
+    return inizi, ricavi.astype(np.int64), comande.astype(np.int64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, punti: int) -> np.ndarray:
+    """
+    Sottocampionamento Largest-Triangle-Three-Buckets: sceglie i punti che
+    conservano la forma della curva (picchi e valli compresi)
+
+    Args:
+        x: Ascisse crescenti
+        y: Ordinate
+        punti: Numero di punti desiderato (almeno 3)
+
+    Returns:
+        Indici dei punti scelti, in ordine crescente
+    """
+    n = len(x)
+    if punti >= n or punti < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Gruppi interni (il primo e l'ultimo punto sono sempre tenuti)
+    confini = np.linspace(1, n - 1, punti - 1).astype(np.int64)
+    scelti = np.empty(punti, dtype=np.int64)
+    scelti[0] = 0
+    scelti[-1] = n - 1
+    precedente = 0
+    for i in range(punti - 2):
+        inizio, fine = confini[i], confini[i + 1]
+        # Media del gruppo successivo (l'ultimo punto per l'ultimo gruppo)
+        inizio_succ, fine_succ = fine, confini[i + 2] if i + 2 < len(confini) else n
+        media_x = x[inizio_succ:fine_succ].mean()
+        media_y = y[inizio_succ:fine_succ].mean()
+        # Punto del gruppo che forma il triangolo di area massima
+        aree = np.abs(
+            (x[precedente] - media_x) * (y[inizio:fine] - y[precedente])
+            - (x[precedente] - x[inizio:fine]) * (media_y - y[precedente])
+        )
+        precedente = inizio + int(np.argmax(aree))
+        scelti[i + 1] = precedente
+    return scelti
+
+
+def minuto_in_data(minuto: int) -> str:
+    """Converte un istante in minuti dal 1970-01-01 in "AAAA-MM-GGTHH:MM" """
+    return str(np.datetime64(int(minuto), "m"))
+
+
+def data_in_minuto(data: str) -> int:
+    """Converte "AAAA-MM-GG" o "AAAA-MM-GGTHH:MM" in minuti dal 1970-01-01"""
+    return int(np.datetime64(data, "m").astype(np.int64))
+
+
+def _data_o_nat(testo: str) -> str:
+    """Restituisce la data se è valida, altrimenti "NaT" """
+    try:
+        np.datetime64(testo, "D")
+        return testo
+    except ValueError:
+        return "NaT"
+
+
+def giorno_in_data(giorno: int) -> str:
+    """Converte un giorno dal 1970-01-01 in "AAAA-MM-GG" """
+    return str(np.datetime64(int(giorno), "D"))
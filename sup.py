@@ -4,30 +4,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, List, Any
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
 import json
 from datetime import datetime
 
-# Carica le variabili d'ambiente dal file .env
-load_dotenv()
-
-# Verifica e inizializza connessione Supabase
-try:
-    # Ottieni credenziali Supabase
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    
-    if not supabase_url or not supabase_key:
-        print("ERRORE: Credenziali Supabase non trovate nel file .env")
-        exit(1)
-    
-    # Inizializza il client Supabase
-    supabase: Client = create_client(supabase_url, supabase_key)
-    print(f"Connessione a Supabase stabilita: {supabase_url}")
-except Exception as e:
-    print(f"ERRORE: Impossibile connettersi a Supabase: {str(e)}")
-    exit(1)
+# Client Supabase condiviso con gli altri moduli (creato al primo utilizzo)
+from database import ottieni_client
 
 # Modelli per le richieste
 class LoginRequest(BaseModel):
@@ -96,6 +77,8 @@ async def get_dashboard_stats():
     Ottiene le statistiche per la dashboard dalle tabelle Supabase
     """
     try:
+        supabase = ottieni_client()
+        
         # Ottieni le comande dalla vista vista_comande_dashboard
         response = supabase.table("vista_comande_dashboard").select("*").order("data_ordine", {"ascending": False}).execute()
         
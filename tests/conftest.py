@@ -0,0 +1,54 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# I moduli del progetto stanno nella radice del repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forno  # noqa: E402
+from clienti import RubricaClienti  # noqa: E402
+from ordine import GestoreOrdine  # noqa: E402
+from previsioni import CapacitaSlot  # noqa: E402
+from ricerca_menu import IndiceProdotti  # noqa: E402
+
+MENU_PROVA = {
+    "Pizze Classiche": {
+        "Margherita": {"price": 6.0, "description": "Pomodoro, mozzarella"},
+        "Capricciosa": {"price": 8.0, "description": "Prosciutto, funghi, carciofi"},
+    },
+    "Fritti": {"Patatine": {"price": 3.0, "description": ""}},
+    "Bevande": {"Coca Cola": {"price": 2.5, "description": ""}},
+}
+
+
+class _MenuProva:
+    """Indice del menu minimo usato da GestoreOrdine"""
+
+    def __init__(self, menu_data):
+        self.menu_data = menu_data
+        self.indice_prodotti = IndiceProdotti.da_menu(menu_data)
+
+
+class _Ore18(datetime):
+    """Orologio fermo alle 18:00, prima dell'apertura delle consegne"""
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(2030, 5, 3, 18, 0)
+
+
+@pytest.fixture
+def gestore(monkeypatch, tmp_path):
+    """GestoreOrdine con il menu di prova, senza salvataggi né previsioni"""
+    monkeypatch.setattr(forno, "datetime", _Ore18)
+    salvati = []
+    gestore = GestoreOrdine(
+        _MenuProva(MENU_PROVA),
+        salva_ordine=lambda user_id, ordine: salvati.append(ordine),
+        pianificatore=forno.PianificatoreForno(capacita_slot=CapacitaSlot(percorso=str(tmp_path / "previsioni.json"))),
+        rubrica=RubricaClienti()
+    )
+    gestore.salvati = salvati
+    return gestore
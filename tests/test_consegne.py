@@ -0,0 +1,44 @@
+from consegne import pianifica_giri
+
+PIZZERIA = (45.0, 7.0)
+
+
+class _GeocoderProva:
+    """Geocoder con coordinate fisse per indirizzo"""
+
+    def __init__(self, coordinate):
+        self.coordinate = coordinate
+
+    def geocodifica(self, indirizzo):
+        return self.coordinate.get(indirizzo)
+
+
+def test_giro_serve_prima_lo_slot_piu_urgente():
+    geocoder = _GeocoderProva({
+        "vicino": (45.001, 7.0),
+        "lontano": (45.01, 7.0),
+    })
+    comande = [
+        {"comanda_id": 1, "indirizzo_cliente": "lontano", "orario_consegna": "20:00"},
+        {"comanda_id": 2, "indirizzo_cliente": "vicino", "orario_consegna": "20:15"},
+    ]
+
+    piano = pianifica_giri(comande, geocoder, partenza=PIZZERIA)
+
+    assert len(piano["giri"]) == 1
+    assert [c["comanda_id"] for c in piano["giri"][0]["consegne"]] == [1, 2]
+
+
+def test_stesso_slot_ordinato_per_vicinanza():
+    geocoder = _GeocoderProva({
+        "vicino": (45.001, 7.0),
+        "lontano": (45.01, 7.0),
+    })
+    comande = [
+        {"comanda_id": 1, "indirizzo_cliente": "lontano", "orario_consegna": "20:00"},
+        {"comanda_id": 2, "indirizzo_cliente": "vicino", "orario_consegna": "20:05"},
+    ]
+
+    piano = pianifica_giri(comande, geocoder, partenza=PIZZERIA)
+
+    assert [c["comanda_id"] for c in piano["giri"][0]["consegne"]] == [2, 1]
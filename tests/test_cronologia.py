@@ -0,0 +1,36 @@
+import cronologia
+from cronologia import BudgetToken, conta_token
+
+
+class _EncoderCaratteri:
+    """Encoder fittizio con un token per carattere, più denso della stima"""
+
+    def encode(self, testo):
+        return list(testo)
+
+
+def test_condensa_rispetta_il_limite_di_token():
+    gestore = BudgetToken(limite_messaggio=50)
+    lungo = {"role": "assistant", "content": "La pizza margherita è pronta. " * 40}
+
+    condensato = gestore.condensa(lungo)
+
+    assert condensato["content"].endswith("…")
+    assert conta_token(condensato["content"]) <= 50
+
+
+def test_condensa_conta_i_token_dell_encoder(monkeypatch):
+    monkeypatch.setattr(cronologia, "_encoder", _EncoderCaratteri())
+    gestore = BudgetToken(limite_messaggio=50)
+    lungo = {"role": "assistant", "content": "La pizza margherita è pronta. " * 40}
+
+    condensato = gestore.condensa(lungo)
+
+    assert len(condensato["content"]) <= 50
+
+
+def test_condensa_lascia_invariati_i_messaggi_brevi():
+    gestore = BudgetToken(limite_messaggio=50)
+    breve = {"role": "assistant", "content": "Quante pizze desidera?"}
+
+    assert gestore.condensa(breve) is breve
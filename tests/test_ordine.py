@@ -0,0 +1,122 @@
+import pytest
+
+
+def _turni(gestore, user_id, messaggi):
+    """Invia i messaggi in sequenza e restituisce l'ultima risposta"""
+    risposta = gestore.inizia_nuovo_ordine(user_id)
+    for messaggio in messaggi:
+        risposta = gestore.gestisci_messaggio(user_id, messaggio)
+    return risposta
+
+
+RACCOLTA = ["2 margherite", "no", "no"]
+DATI = ["si", "3331234567", "Mario Rossi", "via Roma 1", "contanti", "20:00"]
+
+
+@pytest.mark.parametrize("conferma", ["sì, va bene così", "sì va bene così", "si grazie mille", "okay grazie", "sì, a posto così"])
+def test_conferma_ordine_con_si_in_testa(gestore, conferma):
+    _turni(gestore, "u", RACCOLTA)
+    assert gestore.ordini_attivi["u"]["stato"] == "conferma_ordine"
+    gestore.gestisci_messaggio("u", conferma)
+    ordine = gestore.ordini_attivi["u"]
+    assert ordine["stato"] == "raccolta_telefono"
+    assert ordine["carrello"].totale_centesimi == 1200
+
+
+@pytest.mark.parametrize("conferma", ["sì, va bene così", "sì va bene così", "si grazie mille", "okay grazie"])
+def test_conferma_finale_con_si_in_testa(gestore, conferma):
+    _turni(gestore, "u", RACCOLTA + DATI)
+    assert gestore.ordini_attivi["u"]["stato"] == "conferma_finale"
+    risposta = gestore.gestisci_messaggio("u", conferma)
+    assert "confermato" in risposta
+    assert len(gestore.salvati) == 1
+
+
+@pytest.mark.parametrize("stato, messaggi", [
+    ("conferma_ordine", RACCOLTA),
+    ("conferma_finale", RACCOLTA + DATI),
+])
+@pytest.mark.parametrize("risposta", ["va bene così", "a posto così", "Giusto Bianchi"])
+def test_risposte_ambigue_non_svuotano_il_carrello(gestore, stato, messaggi, risposta):
+    _turni(gestore, "u", messaggi)
+    gestore.gestisci_messaggio("u", risposta)
+    ordine = gestore.ordini_attivi["u"]
+    assert ordine["stato"] == stato
+    assert ordine["carrello"].totale_centesimi == 1200
+
+
+@pytest.mark.parametrize("chiusura", ["va bene così", "a posto così", "basta così"])
+def test_va_bene_cosi_chiude_la_raccolta(gestore, chiusura):
+    _turni(gestore, "u", ["2 margherite", chiusura])
+    ordine = gestore.ordini_attivi["u"]
+    assert ordine["stato"] == "conferma_ordine"
+    assert ordine["carrello"].totale_centesimi == 1200
+
+
+def test_no_in_testa_rifiuta(gestore):
+    _turni(gestore, "u", RACCOLTA)
+    gestore.gestisci_messaggio("u", "no, va bene così")
+    ordine = gestore.ordini_attivi["u"]
+    assert ordine["stato"] == "raccolta_pizze"
+    assert ordine["carrello"].totale_centesimi == 0
+
+
+@pytest.mark.parametrize("domanda", [
+    "quanto costa la capriciosa?", "quanto costa la margherita", "che ingredienti ha la capricciosa?",
+    "cosa c'è nella capricciosa",
+])
+def test_domande_sui_prodotti_non_cambiano_il_carrello(gestore, domanda):
+    _turni(gestore, "u", [])
+    assert gestore.gestisci_messaggio("u", domanda) == "FALLBACK"
+    ordine = gestore.ordini_attivi["u"]
+    assert ordine["stato"] == "raccolta_pizze"
+    assert ordine["carrello"].totale_centesimi == 0
+
+
+@pytest.mark.parametrize("messaggio, totale", [
+    ("una capricciosa", 800), ("2 margherite e una capriciosa", 2000), ("vorrei una margherita", 600),
+])
+def test_ordini_con_prodotti_riempiono_il_carrello(gestore, messaggio, totale):
+    _turni(gestore, "u", [messaggio])
+    assert gestore.ordini_attivi["u"]["carrello"].totale_centesimi == totale
+
+
+def test_tutte_le_categorie_in_un_messaggio(gestore):
+    _turni(gestore, "u", ["2 margherite, una patatine e 3 coche"])
+    ordine = gestore.ordini_attivi["u"]
+    assert ordine["stato"] == "conferma_ordine"
+    assert ordine["carrello"].totale_centesimi == 2 * 600 + 300 + 3 * 250
+
+
+def _cliente_abituale(gestore):
+    gestore.rubrica.registra("3331234567", "Mario Rossi", "Via Roma 1", "Contanti alla consegna",
+                             {"pizze": [("Capricciosa", 2)]}, "2030-05-01 20:00:00")
+
+
+@pytest.mark.parametrize("messaggi", [["3331234567"], RACCOLTA + ["si", "3331234567"]])
+def test_telefono_in_rubrica_non_mostra_dati(gestore, messaggi):
+    _cliente_abituale(gestore)
+    risposta = _turni(gestore, "u", messaggi)
+    for dato in ("Mario", "Roma", "Capricciosa", "Contanti"):
+        assert dato not in risposta
+    assert gestore.ordini_attivi["u"]["stato"] == "verifica_indirizzo"
+
+
+def test_indirizzo_sbagliato_non_usa_i_dati_salvati(gestore):
+    _cliente_abituale(gestore)
+    risposta = _turni(gestore, "u", ["3331234567", "via Po 3"])
+    ordine = gestore.ordini_attivi["u"]
+    assert "2 Capricciosa" not in risposta
+    assert ordine["cliente_abituale"] is None
+    assert ordine["cliente"] == {"nome": None, "indirizzo": "via Po 3", "telefono": "3331234567"}
+    assert ordine["stato"] == "raccolta_pizze"
+
+
+def test_indirizzo_giusto_propone_il_riordino(gestore):
+    _cliente_abituale(gestore)
+    risposta = _turni(gestore, "u", ["3331234567", "via roma, 1"])
+    assert "2 Capricciosa" in risposta
+    gestore.gestisci_messaggio("u", "sì, alle 20:30")
+    ordine = gestore.ordini_attivi["u"]
+    assert ordine["stato"] == "conferma_finale"
+    assert ordine["cliente"]["indirizzo"] == "Via Roma 1"
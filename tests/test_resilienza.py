@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+
+from repository import errore_di_supabase
+from resilienza import CircuitBreaker, CircuitoAperto, con_resilienza
+
+
+def _errore_http(stato):
+    richiesta = httpx.Request("GET", "http://supabase/comande")
+    return httpx.HTTPStatusError("errore", request=richiesta, response=httpx.Response(stato, request=richiesta))
+
+
+def _fallisce(errore, chiamate):
+    async def funzione():
+        chiamate.append(1)
+        raise errore
+    return funzione
+
+
+def test_errori_4xx_non_aprono_il_circuito():
+    breaker = CircuitBreaker("prova", soglia_errori=1)
+    chiamate = []
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(con_resilienza(breaker, _fallisce(_errore_http(404), chiamate), 1, tentativi=3,
+                                   attesa_base=0, guasto=errore_di_supabase))
+
+    assert len(chiamate) == 1
+    assert breaker.stato == CircuitBreaker.CHIUSO
+    assert breaker.errori_consecutivi == 0
+
+
+def test_errori_5xx_contati_una_volta_per_chiamata():
+    breaker = CircuitBreaker("prova", soglia_errori=2)
+    chiamate = []
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(con_resilienza(breaker, _fallisce(_errore_http(503), chiamate), 1, tentativi=3,
+                                   attesa_base=0, guasto=errore_di_supabase))
+
+    assert len(chiamate) == 3
+    assert breaker.errori_consecutivi == 1
+    assert breaker.stato == CircuitBreaker.CHIUSO
+
+
+def test_prova_annullata_libera_il_breaker():
+    breaker = CircuitBreaker("prova", soglia_errori=1, attesa_secondi=0)
+    breaker.registra_errore()
+
+    async def lenta():
+        await asyncio.sleep(10)
+
+    async def annulla_prova():
+        prova = asyncio.create_task(con_resilienza(breaker, lenta, 20))
+        await asyncio.sleep(0.01)
+        prova.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await prova
+
+    asyncio.run(annulla_prova())
+    assert not breaker.prova_in_corso
+
+    async def riuscita():
+        return "ok"
+
+    assert asyncio.run(con_resilienza(breaker, riuscita, 1)) == "ok"
+    assert breaker.stato == CircuitBreaker.CHIUSO
+
+
+def test_circuito_aperto_rifiuta_le_chiamate():
+    breaker = CircuitBreaker("prova", soglia_errori=1, attesa_secondi=60)
+    breaker.registra_errore()
+
+    async def riuscita():
+        return "ok"
+
+    with pytest.raises(CircuitoAperto):
+        asyncio.run(con_resilienza(breaker, riuscita, 1))
@@ -0,0 +1,57 @@
+import asyncio
+
+from sessioni import SerializzatoreSessioni
+
+
+def test_risposte_uguali_in_sequenza_avanzano_due_volte(gestore):
+    serializzatore = SerializzatoreSessioni(finestra_duplicati=2.0)
+    gestore.inizia_nuovo_ordine("u")
+    gestore.gestisci_messaggio("u", "2 margherite")
+
+    async def turno(messaggio):
+        return gestore.gestisci_messaggio("u", messaggio)
+
+    async def conversazione():
+        # "no" ai fritti e subito dopo "no" alle bibite
+        await serializzatore.esegui("u", "no", lambda: turno("no"))
+        await serializzatore.esegui("u", "no", lambda: turno("no"))
+
+    asyncio.run(conversazione())
+    assert gestore.ordini_attivi["u"]["stato"] == "conferma_ordine"
+    assert serializzatore.duplicati == 0
+
+
+def _contatore():
+    chiamate = []
+
+    async def turno():
+        chiamate.append(1)
+        await asyncio.sleep(0.01)
+        return len(chiamate)
+
+    return chiamate, turno
+
+
+def test_testo_identico_in_elaborazione_e_un_duplicato():
+    serializzatore = SerializzatoreSessioni()
+    chiamate, turno = _contatore()
+
+    async def doppio_clic():
+        return await asyncio.gather(serializzatore.esegui("u", "ciao", turno), serializzatore.esegui("u", "ciao", turno))
+
+    assert asyncio.run(doppio_clic()) == [1, 1]
+    assert len(chiamate) == 1
+
+
+def test_id_messaggio_ripetuto_dopo_la_risposta_e_un_duplicato():
+    serializzatore = SerializzatoreSessioni(finestra_duplicati=2.0)
+    chiamate, turno = _contatore()
+
+    async def tentativi():
+        primo = await serializzatore.esegui("u", "no", turno, id_messaggio="a")
+        ripetuto = await serializzatore.esegui("u", "no", turno, id_messaggio="a")
+        nuovo = await serializzatore.esegui("u", "no", turno, id_messaggio="b")
+        return primo, ripetuto, nuovo
+
+    assert asyncio.run(tentativi()) == (1, 1, 2)
+    assert len(chiamate) == 2